@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+bench_generate_bibtex.py - Serial vs concurrent BibTeX fetching against a local stub.
+
+Usage:
+    python3 benchmarks/bench_generate_bibtex.py --ids 400 --latency 0.05 --concurrency 16
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+
+import generate_bibtex  # noqa: E402
+from http_session import RateLimiter  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+def synthetic_ids(n):
+    """Half PMIDs, half DOIs, interleaved."""
+    return [str(30000000 + i) if i % 2 else f"10.5555/doi.{i}" for i in range(n)]
+
+def run(ids, concurrency, batch_size):
+    start = time.perf_counter()
+    bibs = generate_bibtex.fetch_entries(ids, concurrency=concurrency, batch_size=batch_size)
+    return time.perf_counter() - start, bibs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_bibtex against a stub server")
+    parser.add_argument("--ids", type=int, default=400, help="Number of identifiers")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub latency per request (s)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=generate_bibtex.PMID_BATCH_SIZE)
+    args = parser.parse_args()
+
+    ids = synthetic_ids(args.ids)
+    with StubServer(latency=args.latency) as stub:
+        generate_bibtex.CROSSREF_WORKS_URL = stub.url + "/works"
+        generate_bibtex.DOI_RESOLVE_URL = stub.url + "/doi/"
+        generate_bibtex.ESUMMARY_URL = stub.url + "/entrez/eutils/esummary.fcgi"
+        generate_bibtex.ESUMMARY_LIMITER = RateLimiter(0)  # the stub has no NCBI quota
+
+        results = {}
+        for label, concurrency, batch_size in [
+            ("serial", 1, 1),
+            ("concurrent", args.concurrency, args.batch_size),
+        ]:
+            before = stub.requests_served
+            elapsed, bibs = run(ids, concurrency, batch_size)
+            results[label] = bibs
+            print(f"{label:>10}: {elapsed:7.2f}s  {stub.requests_served - before:5d} requests  "
+                  f"{len(ids) / elapsed:8.1f} ids/s")
+
+    if results["serial"] != results["concurrent"]:
+        print("ERROR: concurrent output differs from serial output", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+bench_ingest_excel.py - Streaming vs pandas engine of ingest_excel, with an output check.
+
+Converts a synthetic workbook, plus a sheet of awkward cells (blanks in
+integer and boolean columns, dates with and without times, NA strings,
+numeric text, mixed columns), with both engines and fails if their CSVs
+differ.
+
+Usage:
+    python3 benchmarks/bench_ingest_excel.py --sheets 2 --rows 50000
+"""
+
+import argparse
+import datetime
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+
+import ingest_excel  # noqa: E402
+import synthetic  # noqa: E402
+
+def edge_rows():
+    """Header and rows of cells whose CSV form depends on the whole column."""
+    d = datetime.datetime
+    return [["id", "count", "weight", "flag", "flag_na", "day", "stamp", "frac", "text", "mixed", "numeric_text"],
+            [1, 30, 70.5, True, True, d(2020, 1, 1), d(2020, 1, 1, 12, 30), d(2020, 1, 1, 0, 0, 0, 500000), "a", 5, "12"],
+            [2, None, 80.0, False, None, d(2021, 5, 6), d(2021, 1, 1), d(2020, 1, 2), "NA", "x", "3.5"],
+            [3, 45, 1e-7, True, False, None, None, None, None, 2.5, "NA"]]
+
+def make_edge_workbook(path):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Edge")
+    for row in edge_rows():
+        ws.append(row)
+    wb.save(path)
+    return path
+
+def convert(excel, outdir, engine):
+    """Convert every sheet of excel with one engine; returns (seconds, {file name: CSV text})."""
+    from openpyxl import load_workbook
+    outdir.mkdir(exist_ok=True)
+    sheets = load_workbook(excel, read_only=True).sheetnames
+    start = time.perf_counter()
+    for sheet in sheets:
+        out_path = outdir / f"{excel.stem}_{ingest_excel.normalize(sheet)}.csv"
+        if engine == "stream":
+            ingest_excel.convert_sheet(excel, sheet, out_path)
+        else:
+            ingest_excel.convert_sheet_pandas(excel, sheet, out_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, {p.name: p.read_text(encoding="utf-8") for p in sorted(outdir.glob(f"{excel.stem}_*.csv"))}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and cross-check the ingest_excel engines")
+    parser.add_argument("--sheets", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=50_000, help="Rows per synthetic sheet")
+    args = parser.parse_args()
+
+    differs = False
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        books = [synthetic.make_workbook(tmp / "book.xlsx", args.sheets, args.rows), make_edge_workbook(tmp / "edge.xlsx")]
+        for book in books:
+            results = {}
+            for engine in ("pandas", "stream"):
+                elapsed, results[engine] = convert(book, tmp / engine, engine)
+                print(f"{book.name:>10} {engine:>7}: {elapsed:7.2f}s")
+            for name, text in results["pandas"].items():
+                if results["stream"].get(name) != text:
+                    print(f"ERROR: {name} differs between the stream and pandas engines", file=sys.stderr)
+                    differs = True
+    if differs:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py - Cold-start and warm-call latency of every tool.
+
+For each tool in codex.json:
+    help     wall time of `python3 tools/<tool>.py --help` in a fresh interpreter
+    imports  import time on that path (-X importtime) and its heaviest top-level imports
+    libs     import time once the tool's deferred libraries are loaded, i.e. what a
+             real run pays before doing any work
+    warm     wall time of `tool_server.py run <tool> --help` against a running server
+
+Usage:
+    python3 benchmarks/bench_startup.py --repeats 5 --out startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLS_DIR = Path(__file__).resolve().parent.parent / "tools"
+sys.path.insert(0, str(TOOLS_DIR))
+
+from run_pipeline import load_tools  # noqa: E402
+from tool_server import SKIP  # noqa: E402
+
+ENV = {**os.environ, "MPLBACKEND": "Agg", "PYTHONWARNINGS": "ignore"}
+LOAD_LIBS = ("import importlib, sys; sys.path.insert(0, {tools!r}); from lazy_imports import LazyModule; "
+             "m = importlib.import_module({tool!r}); "
+             "[v._load() for v in vars(m).values() if isinstance(v, LazyModule)]")
+
+def wall(cmd, repeats, env=ENV):
+    """Median wall time of running cmd, in seconds."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def import_profile(cmd):
+    """(total import seconds, [(module, seconds)] top-level imports) from -X importtime output."""
+    err = subprocess.run([sys.executable, "-X", "importtime", *cmd], capture_output=True, text=True, env=ENV).stderr
+    top = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # nested imports are indented
+            top.append((name.strip(), int(cumulative) / 1e6))
+    return sum(s for _, s in top), sorted(top, key=lambda t: -t[1])
+
+def start_server(socket_path, timeout=120):
+    proc = subprocess.Popen([sys.executable, str(TOOLS_DIR / "tool_server.py"), "--socket", str(socket_path), "serve"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=ENV)
+    deadline = time.monotonic() + timeout
+    while not socket_path.exists():
+        if proc.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit("tool_server did not start")
+        time.sleep(0.1)
+    return proc
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tool startup, cold and against tool_server")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per measurement (median reported)")
+    parser.add_argument("--tools", nargs="+", help="Tools to measure (default: all in codex.json)")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports listed per tool")
+    parser.add_argument("--out", type=Path, help="Write results as JSON")
+    args = parser.parse_args()
+
+    tools = {n: s for n, s in load_tools().items() if n not in SKIP and (not args.tools or n in args.tools)}
+    results = {}
+    for name, script in tools.items():
+        imports, top = import_profile([str(script), "--help"])
+        libs, _ = import_profile(["-c", LOAD_LIBS.format(tools=str(TOOLS_DIR), tool=name)])
+        results[name] = {"help_s": round(wall([sys.executable, str(script), "--help"], args.repeats), 4),
+                         "help_imports_s": round(imports, 4), "libs_imports_s": round(libs, 4),
+                         "top_imports": [[m, round(s, 4)] for m, s in top[:args.top]]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = Path(tmp) / "bench.sock"
+        server = start_server(socket_path)
+        try:
+            client = [sys.executable, str(TOOLS_DIR / "tool_server.py"), "--socket", str(socket_path), "run"]
+            for name in tools:
+                results[name]["warm_s"] = round(wall([*client, name, "--help"], args.repeats), 4)
+        finally:
+            subprocess.run([*client[:-1], "stop"], env=ENV)
+            server.wait(timeout=30)
+
+    print(f"{'tool':<20}{'help':>8}{'imports':>9}{'libs':>8}{'warm':>8}  heaviest imports on --help")
+    for name, r in results.items():
+        heavy = ", ".join(f"{m} {s * 1000:.0f}ms" for m, s in r["top_imports"])
+        print(f"{name:<20}{r['help_s']:>8.3f}{r['help_imports_s']:>9.3f}{r['libs_imports_s']:>8.3f}{r['warm_s']:>8.3f}  {heavy}")
+    if args.out:
+        args.out.write_text(json.dumps({"python": sys.version.split()[0], "repeats": args.repeats, "tools": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
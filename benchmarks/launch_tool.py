@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+launch_tool.py - Run a tool with its remote APIs redirected to a stub server.
+
+    python3 benchmarks/launch_tool.py http://127.0.0.1:8765 search_literature "thyroid" --email a@b.c
+
+The tool runs unmodified in this process. Before its main() runs, the API
+endpoints in the tool's module (CrossRef, Semantic Scholar, doi.org, ESummary), the
+NCBI E-utilities base used by Biopython, and $OPENAI_BASE_URL (read by
+`--llm-backend http`) are pointed at the stub. Pass "-" as the URL to run
+with no redirection.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+
+from run_pipeline import call_tool, load_tool, load_tools  # noqa: E402
+
+EUTILS = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+ENDPOINTS = {"CROSSREF_WORKS_URL": "/works", "S2_SEARCH_URL": "/graph/v1/paper/search",
+             "S2_BULK_URL": "/graph/v1/paper/search/bulk", "DOI_RESOLVE_URL": "/doi/",
+             "ESUMMARY_URL": "/entrez/eutils/esummary.fcgi"}
+
+def redirect(module, base):
+    """Point the module's API constants, Entrez and the OpenAI base URL at base."""
+    os.environ["OPENAI_BASE_URL"] = base + "/v1"
+    for name, path in ENDPOINTS.items():
+        if hasattr(module, name):
+            setattr(module, name, base + path)
+    if "Entrez" in vars(module):
+        from Bio import Entrez
+        build = Entrez._build_request
+        def _build_request(cgi, *args, **kwargs):
+            return build(cgi.replace(EUTILS, base + "/entrez/eutils"), *args, **kwargs)
+        Entrez._build_request = _build_request
+
+def main():
+    if len(sys.argv) < 3:
+        raise SystemExit(f"usage: {Path(sys.argv[0]).name} STUB_URL|- TOOL [ARGS...]")
+    base, tool, args = sys.argv[1].rstrip("/"), sys.argv[2], sys.argv[3:]
+    tools = load_tools()
+    if tool not in tools:
+        raise SystemExit(f"Unknown tool {tool!r} (see codex.json)")
+    module = load_tool(str(tools[tool]))
+    if base != "-":
+        redirect(module, base)
+    sys.exit(call_tool(tool, module, args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+run_benchmarks.py - Offline throughput, latency and memory benchmarks for every tool.
+
+Each case runs a tool in a fresh interpreter through launch_tool.py, with the
+remote APIs served by stub_server.py (fixed --latency per request) and inputs
+from synthetic.py, so no network access or API keys are needed. Inputs are
+generated once per size and kept in ~/.cache/research-assistant-ai/bench-data.
+Caches are bypassed (--no-cache) so every repeat does the full work.
+
+Per case it records the median/min/max wall time, throughput (rows, pages,
+records, ... per second), the peak RSS of the tool and its workers, the per-stage
+metrics the tool writes with --metrics-out, and the mean latency of its HTTP
+and LLM calls. Results are saved to benchmarks/results/<date>-<commit>.json;
+compare two of them to find regressions between commits:
+
+    python3 benchmarks/run_benchmarks.py --sizes small medium
+    python3 benchmarks/run_benchmarks.py --tools ingest_pdf --compare benchmarks/results/2026-10-01-abc1234.json
+    python3 benchmarks/run_benchmarks.py --from results/new.json --compare results/old.json --fail-on-regression
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import cached_property
+from pathlib import Path
+
+import synthetic
+from stub_server import FIRST_PMID, StubServer
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+RESULTS_DIR = HERE / "results"
+DATA_DIR = Path.home() / ".cache" / "research-assistant-ai" / "bench-data"
+ENV = {**os.environ, "MPLBACKEND": "Agg", "PYTHONWARNINGS": "ignore"}
+
+SIZES = {
+    "small": dict(rows=20_000, wide_cols=50, wide_rows=5_000, boot_rows=2_000, sheets=2, sheet_rows=5_000,
+                  pages=50, ids=20, records=500, paragraphs=40, refs=100, papers=10_000),
+    "medium": dict(rows=500_000, wide_cols=200, wide_rows=50_000, boot_rows=10_000, sheets=4, sheet_rows=50_000,
+                   pages=300, ids=200, records=5_000, paragraphs=200, refs=1_000, papers=100_000),
+    "large": dict(rows=5_000_000, wide_cols=1_000, wide_rows=100_000, boot_rows=50_000, sheets=8, sheet_rows=250_000,
+                  pages=1_000, ids=1_000, records=50_000, paragraphs=1_000, refs=10_000, papers=300_000),
+}
+
+class Inputs:
+    """Synthetic inputs for one size, generated on first use and cached by their parameters."""
+
+    def __init__(self, size):
+        self.p = SIZES[size]
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, stem, suffix, make, *args):
+        path = DATA_DIR / f"{stem}-{'-'.join(map(str, args))}{suffix}"
+        if not path.exists():
+            tmp = path.with_name(f".tmp-{path.name}")
+            t0 = time.perf_counter()
+            make(tmp, *args)
+            tmp.rename(path)
+            print(f"  generated {path.name} in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        return path
+
+    @cached_property
+    def tall_csv(self):
+        return self._file("tall", ".csv", synthetic.make_csv, self.p["rows"], 10)
+
+    @cached_property
+    def wide_csv(self):
+        return self._file("wide", ".csv", synthetic.make_csv, self.p["wide_rows"], self.p["wide_cols"])
+
+    @cached_property
+    def boot_csv(self):
+        return self._file("boot", ".csv", synthetic.make_csv, self.p["boot_rows"], 10)
+
+    @cached_property
+    def workbook(self):
+        return self._file("book", ".xlsx", synthetic.make_workbook, self.p["sheets"], self.p["sheet_rows"])
+
+    @cached_property
+    def pdf(self):
+        return self._file("paper", ".pdf", synthetic.make_pdf, self.p["pages"])
+
+    @cached_property
+    def document(self):
+        return self._file("document", ".txt", synthetic.make_document, self.p["paragraphs"])
+
+    @cached_property
+    def bibtex(self):
+        return self._file("refs", ".bib", synthetic.make_bibtex, self.p["refs"])
+
+    @cached_property
+    def literature(self):
+        return self._file("literature", ".jsonl", synthetic.make_literature, self.p["papers"])
+
+    @cached_property
+    def index(self):
+        return self._file("index", ".sqlite", build_index, self.literature)
+
+def build_index(path, literature):
+    subprocess.run([sys.executable, str(ROOT / "tools" / "literature_index.py"), "--index", str(path), "add", str(literature)],
+                   env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    for suffix in ("-wal", "-shm"):  # checkpointed on close
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+def cases(inp, work):
+    """
+    (name, tool, args thunk, units, unit) for one size. The thunk is called
+    before every run, so inputs are only generated for selected tools.
+    """
+    p = inp.p
+    xs = [f"x{j}" for j in range(1, 6)]
+    llm = ["--llm-backend", "http", "--no-cache", "--llm-log", str(work / "llm_calls.jsonl")]
+    lit = ["thyroid", "--email", "bench@example.org", "--api-key", "stub", "--no-cache", "--no-index"]
+    fresh = itertools.count()
+    ids = [str(FIRST_PMID + i) if i % 2 else f"10.5555/stub.{FIRST_PMID + i}" for i in range(p["ids"])]
+    return [
+        ("tall", "analyze_advanced", lambda: [inp.tall_csv, "--outcome", "y", "--predictors", *xs, "--no-cache",
+                                              "--outdir", work / "analysis", "--log", work / "analyze.log"], p["rows"], "rows"),
+        ("wide", "analyze_advanced", lambda: [inp.wide_csv, "--outcome", "y", "--predictors", *xs, "--no-cache",
+                                              "--outdir", work / "analysis", "--log", work / "analyze.log"],
+         p["wide_rows"] * (p["wide_cols"] + 7), "cells"),
+        ("stream", "analyze_advanced", lambda: [inp.tall_csv, "--stream", "--outcome", "y", "--predictors", *xs,
+                                                "--no-cache", "--outdir", work / "analysis", "--log", work / "analyze.log"],
+         p["rows"], "rows"),
+        ("cv", "validate_models", lambda: [inp.tall_csv, "--outcome", "event", "--predictors", *xs, "--model", "logistic",
+                                           "--no-cache", "--no-fold-cache", "--outdir", work / "validation"], p["rows"], "rows"),
+        ("bootstrap", "validate_models", lambda: [inp.boot_csv, "--outcome", "y", "--predictors", *xs, "--method", "bootstrap",
+                                                  "--resamples", "200", "--no-cache", "--outdir", work / "validation"],
+         200, "resamples"),
+        ("figures", "generate_visuals", lambda: [inp.tall_csv, "--group", "event", "--value", "y", "--score", "x1", "--force",
+                                                 "--pairplot-columns", "x1", "x2", "x3", "y",
+                                                 "--no-cache", "--outdir", work / "visuals"], p["rows"], "rows"),
+        ("grouped", "create_apa_table", lambda: [inp.tall_csv, "--by", "g", "--no-cache", "--out", work / "table.md"],
+         p["rows"], "rows"),
+        ("wide", "create_apa_table", lambda: [inp.wide_csv, "--no-cache", "--out", work / "table.md"],
+         p["wide_rows"] * (p["wide_cols"] + 7), "cells"),
+        ("workbook", "ingest_excel", lambda: [inp.workbook, "--outdir", work / "excel"], p["sheets"] * p["sheet_rows"], "rows"),
+        ("pages", "ingest_pdf", lambda: [inp.pdf, "--out", work / "text.txt", "--log", work / "ingest.log"], p["pages"], "pages"),
+        ("search", "search_literature", lambda: [*lit, "--retmax", str(p["records"]), "--outdir", work / "lit"],
+         3 * p["records"], "records"),
+        ("harvest", "search_literature", lambda: [*lit, "--harvest", "--retmax", str(p["records"]), "--outdir", work / "harvest"],
+         3 * p["records"], "records"),
+        ("ids", "generate_bibtex", lambda: [*ids, "--no-cache", "--out", work / "refs.bib"], p["ids"], "entries"),
+        ("sections", "write_paper", lambda: [work / "analysis_stub.csv", work / "lit_stub.json", "--by-section",
+                                             "--out", work / "draft.md", *llm], 5, "sections"),
+        ("document", "add_citations", lambda: [inp.document, "--references", inp.bibtex, "--out", work / "cited.txt", *llm],
+         p["paragraphs"], "paragraphs"),
+        ("prompt", "write_code", lambda: ["--prompt", "Fit a Cox model", "--outfile", work / "code.py", *llm], 1, "calls"),
+        ("add", "literature_index", lambda: ["--index", work / f"index{next(fresh)}.sqlite", "add", inp.literature],
+         p["papers"], "papers"),
+        ("query", "literature_index", lambda: ["--index", inp.index, "query", "thyroid carcinoma survival", "--limit", "20"],
+         1, "queries"),
+    ]
+
+def run_case(stub_url, tool, build, work, repeats):
+    """Run one case `repeats` times; returns walls, peak RSS (MB, largest process) and the last run's metrics."""
+    walls, peak, metrics = [], 0.0, None
+    metrics_path = work / "metrics.json"
+    for _ in range(repeats):
+        cmd = [sys.executable, str(HERE / "launch_tool.py"), stub_url, tool, *map(str, build()),
+               "--metrics-out", str(metrics_path)]
+        metrics_path.unlink(missing_ok=True)
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=work, env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        walls.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{tool} exited with {proc.returncode}:\n{proc.stderr.decode(errors='replace')[-2000:]}")
+        metrics = json.loads(metrics_path.read_text())
+        # Stage peaks include worker processes' high-water marks (instrumentation.record)
+        stage_peaks = [s["peak_rss_mb"] or 0 for s in metrics["stages"].values()]
+        peak = max(peak, metrics["peak_rss_mb"] or 0, *stage_peaks)
+    return walls, peak, metrics
+
+def summarize(walls, peak, metrics, units, unit):
+    stages = metrics["stages"]
+    mean = lambda name: round(stages[name]["wall_s"] / stages[name]["count"], 4) if name in stages else None
+    median = statistics.median(walls)
+    return {"wall_s": round(median, 4), "min_wall_s": round(min(walls), 4), "max_wall_s": round(max(walls), 4),
+            "units": units, "unit": unit, "throughput": round(units / median, 2), "peak_rss_mb": peak,
+            "cpu_s": metrics["cpu_s"], "children_cpu_s": metrics["children_cpu_s"],
+            "http_latency_s": mean("http_request"), "llm_latency_s": mean("llm_call"),
+            "stages": {name: {"count": s["count"], "wall_s": s["wall_s"], "peak_rss_mb": s["peak_rss_mb"]}
+                       for name, s in stages.items()}}
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+def compare(base, current, threshold):
+    """Rows of (case, metric, base, current, ratio, regressed) for cases present in both results."""
+    rows = []
+    for key, cur in current["cases"].items():
+        old = base["cases"].get(key)
+        if not old:
+            continue
+        for metric in ("wall_s", "peak_rss_mb"):
+            if old.get(metric) and cur.get(metric):
+                ratio = cur[metric] / old[metric]
+                rows.append((key, metric, old[metric], cur[metric], ratio, ratio > 1 + threshold))
+    return rows
+
+def print_results(results):
+    print(f"{'case':<40}{'wall s':>9}{'min':>8}{'max':>8}{'throughput':>16}{'peak MB':>9}{'http s':>8}{'llm s':>8}")
+    for key, r in results["cases"].items():
+        rate = f"{r['throughput']:.0f} {r['unit']}/s"
+        print(f"{key:<40}{r['wall_s']:>9.2f}{r['min_wall_s']:>8.2f}{r['max_wall_s']:>8.2f}{rate:>16}{r['peak_rss_mb']:>9.1f}"
+              f"{r['http_latency_s'] or 0:>8.3f}{r['llm_latency_s'] or 0:>8.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every tool offline against synthetic data and API stubs")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"])
+    parser.add_argument("--tools", nargs="+", help="Only benchmark these tools")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case (median reported)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub API delay per request (s)")
+    parser.add_argument("--out", type=Path, help="Results file (default benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--from", dest="from_", type=Path, help="Skip running; load these results instead")
+    parser.add_argument("--compare", type=Path, help="Earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative increase counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any case regressed")
+    args = parser.parse_args()
+
+    if args.from_:
+        results = json.loads(args.from_.read_text())
+    else:
+        commit = git("rev-parse", "--short", "HEAD")
+        results = {"commit": commit, "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+                   "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                   "platform": platform.platform(), "cpus": os.cpu_count(), "latency_s": args.latency,
+                   "repeats": args.repeats, "cases": {}}
+        for size in args.sizes:
+            inp = Inputs(size)
+            records = max(SIZES[size]["records"], SIZES[size]["ids"]) + 1
+            with tempfile.TemporaryDirectory() as tmp, StubServer(args.latency, records) as stub:
+                work = Path(tmp)
+                (work / "analysis_stub.csv").write_text(",mean,std\nage,54.1,12.3\ny,2.0,1.4\n")
+                (work / "lit_stub.json").write_text(json.dumps(
+                    [{"source": "PubMed", "text": synthetic.paragraph(random.Random(i))} for i in range(20)]))
+                for name, tool, build, units, unit in cases(inp, work):
+                    if args.tools and tool not in args.tools:
+                        continue
+                    key = f"{size}/{tool}/{name}"
+                    print(f"{key} ...", file=sys.stderr)
+                    walls, peak, metrics = run_case(stub.url, tool, build, work, args.repeats)
+                    results["cases"][key] = summarize(walls, peak, metrics, units, unit)
+        out = args.out or RESULTS_DIR / f"{time.strftime('%Y-%m-%d')}-{results['commit']}.json"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2))
+        print(f"Results written to {out}", file=sys.stderr)
+
+    print_results(results)
+    if args.compare:
+        base = json.loads(args.compare.read_text())
+        rows = compare(base, results, args.threshold)
+        print(f"\nvs {base.get('commit')} ({args.compare.name}), regression threshold +{args.threshold:.0%}")
+        for key, metric, old, new, ratio, regressed in rows:
+            print(f"{'REGRESSION ' if regressed else '':<11}{key:<40}{metric:<13}{old:>10.2f} -> {new:>10.2f}  {ratio - 1:+.1%}")
+        if args.fail_on_regression and any(r[-1] for r in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+stub_server.py - Local HTTP stand-ins for the remote APIs used by the tools.
+
+Each stub answers from synthetic data after a configurable delay, so network
+bound code paths can be benchmarked offline and repeatably. Searches match
+`records` synthetic papers (default 5000) whatever the query; record i has
+PMID 30000000+i and DOI 10.5555/stub.<pmid>.
+
+Routes:
+    /entrez/eutils/esearch.fcgi   NCBI esearch (XML; IdList, Count, WebEnv/QueryKey)
+    /entrez/eutils/efetch.fcgi    NCBI efetch abstracts as text, by id list or
+                                  by WebEnv with retstart/retmax
+    /entrez/eutils/esummary.fcgi  NCBI esummary as JSON, with a DOI article id per PMID
+    /works        CrossRef works: `filter=pmid:...` lists, or `query.title`
+                  search with `rows` and cursor paging
+    /graph/v1/paper/search        Semantic Scholar search (`limit`)
+    /graph/v1/paper/search/bulk   Semantic Scholar bulk search, token paging
+    /doi/<doi>    doi.org content negotiation returning BibTeX
+    POST /v1/chat/completions
+                  OpenAI-compatible chat completion; the reply is derived from
+                  a hash of the request, so it is deterministic
+
+Point the tools at it with benchmarks/launch_tool.py, or run it standalone:
+
+    python3 benchmarks/stub_server.py --port 8765 --latency 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+FIRST_PMID = 30000000
+S2_BULK_PAGE = 1000
+WORDS = ("thyroid carcinoma cohort survival regression outcome patients treatment risk trial "
+         "mortality biomarker imaging surgery follow-up incidence screening therapy").split()
+
+def pmid_to_doi(pmid):
+    return f"10.5555/stub.{pmid}"
+
+def _title(i):
+    return " ".join(WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(6)).capitalize()
+
+def _abstract(i):
+    return " ".join(WORDS[(i + k * 5) % len(WORDS)] for k in range(60)) + "."
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is measurable
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, body, content_type="application/json", status=200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests_served += 1
+
+    def do_GET(self):
+        self._count()
+        self._get(self.path)
+
+    def _get(self, path):
+        url = urlparse(path)
+        params = parse_qs(url.query)
+        if url.path == "/works":
+            self._send(json.dumps(self.crossref_works(params)))
+        elif url.path.startswith("/doi/"):
+            doi = unquote(url.path[len("/doi/"):])
+            key = doi.replace("/", "_").replace(".", "_")
+            self._send(f"@article{{{key},\n  title = {{Stub record {doi}}},\n  doi = {{{doi}}}\n}}",
+                       content_type="application/x-bibtex")
+        elif url.path == "/entrez/eutils/esearch.fcgi":
+            self._send(self.esearch(params), content_type="text/xml")
+        elif url.path == "/entrez/eutils/efetch.fcgi":
+            self._send(self.efetch(params), content_type="text/plain")
+        elif url.path == "/entrez/eutils/esummary.fcgi":
+            self._send(json.dumps(self.esummary(params)))
+        elif url.path == "/graph/v1/paper/search":
+            self._send(json.dumps(self.s2_search(params)))
+        elif url.path == "/graph/v1/paper/search/bulk":
+            self._send(json.dumps(self.s2_bulk(params)))
+        else:
+            self._send(json.dumps({"error": "not found"}), status=404)
+
+    def do_POST(self):
+        self._count()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse(self.path).path == "/v1/chat/completions":
+            self._send(json.dumps(self.chat_completion(json.loads(body))))
+        elif urlparse(self.path).path.startswith("/entrez/eutils/"):  # Biopython POSTs long id lists
+            self._get(self.path + ("&" if "?" in self.path else "?") + body.decode())
+        else:
+            self._send(json.dumps({"error": "not found"}), status=404)
+
+    def _page(self, params, start_key, size_key, default_size):
+        start = int(params.get(start_key, ["0"])[0] or 0)
+        size = int(params.get(size_key, [str(default_size)])[0] or default_size)
+        return range(start, min(start + size, self.server.records))
+
+    def esearch(self, params):
+        ids = "".join(f"<Id>{FIRST_PMID + i}</Id>" for i in self._page(params, "retstart", "retmax", 20))
+        return ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+                '<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" '
+                '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">\n'
+                f"<eSearchResult><Count>{self.server.records}</Count><RetMax>{ids.count('<Id>')}</RetMax>"
+                f"<RetStart>0</RetStart><QueryKey>1</QueryKey><WebEnv>STUB</WebEnv>"
+                f"<IdList>{ids}</IdList><TranslationSet/><QueryTranslation>stub</QueryTranslation></eSearchResult>")
+
+    def efetch(self, params):
+        if "id" in params:
+            pmids = [int(p) for p in ",".join(params["id"]).split(",") if p]
+        else:
+            pmids = [FIRST_PMID + i for i in self._page(params, "retstart", "retmax", 20)]
+        return "\n\n\n".join(f"{n}. Stub J. 2020;{i % 50}:1-10.\n\n{_title(i - FIRST_PMID)}.\n\n"
+                             f"{_abstract(i - FIRST_PMID)}\n\nDOI: {pmid_to_doi(i)}\nPMID: {i}"
+                             for n, i in enumerate(pmids, 1)) + "\n"
+
+    def esummary(self, params):
+        pmids = [p for p in ",".join(params.get("id", [])).split(",") if p]
+        result = {"uids": pmids}
+        for p in pmids:
+            result[p] = {"uid": p, "articleids": [{"idtype": "pubmed", "value": p},
+                                                  {"idtype": "doi", "value": pmid_to_doi(p)}]}
+        return {"header": {"type": "esummary", "version": "0.3"}, "result": result}
+
+    def chat_completion(self, request):
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        digest = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()[:12]
+        content = f"Stub completion {digest} from {request.get('model')}."
+        return {"id": f"chatcmpl-{digest}", "object": "chat.completion", "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4}}
+
+    def crossref_works(self, params):
+        filters = ",".join(params.get("filter", [])).split(",")
+        pmids = [f.split(":", 1)[1] for f in filters if f.startswith("pmid:")]
+        if pmids:
+            items = [{"DOI": pmid_to_doi(p), "pmid": p} for p in pmids]
+            return {"status": "ok", "message": {"items": items, "total-results": len(items)}}
+        cursor = params.get("cursor", [None])[0]
+        start = int(cursor) if cursor and cursor != "*" else 0
+        page = self._page({"offset": [str(start)], **params}, "offset", "rows", 20)
+        items = [{"DOI": pmid_to_doi(FIRST_PMID + i), "title": [_title(i)],
+                  "author": [{"family": f"Author{i % 97}"}], "published-print": {"date-parts": [[2000 + i % 25]]}}
+                 for i in page]
+        message = {"items": items, "total-results": self.server.records}
+        if cursor:
+            message["next-cursor"] = str(page.stop) if page.stop < self.server.records else None
+        return {"status": "ok", "message": message}
+
+    def _s2(self, i):
+        return {"paperId": hashlib.sha1(str(i).encode()).hexdigest(), "title": _title(i), "year": 2000 + i % 25,
+                "abstract": _abstract(i), "externalIds": {"DOI": pmid_to_doi(FIRST_PMID + i), "PubMed": str(FIRST_PMID + i)}}
+
+    def s2_search(self, params):
+        page = self._page(params, "offset", "limit", 10)
+        return {"total": self.server.records, "offset": page.start, "data": [self._s2(i) for i in page]}
+
+    def s2_bulk(self, params):
+        page = self._page({"offset": params.get("token", ["0"]), "limit": [str(S2_BULK_PAGE)]}, "offset", "limit", S2_BULK_PAGE)
+        token = str(page.stop) if page.stop < self.server.records else None
+        return {"total": self.server.records, "token": token, "data": [self._s2(i) for i in page]}
+
+class StubServer:
+    """Run StubHandler on a localhost port (free one by default) in a background thread."""
+
+    def __init__(self, latency=0.05, records=5000, port=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.records = records
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests_served = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests_served(self):
+        return self.httpd.requests_served
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API stubs until interrupted")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Delay per request (s)")
+    parser.add_argument("--records", type=int, default=5000, help="Papers matched by every search")
+    args = parser.parse_args()
+    with StubServer(args.latency, args.records, args.port) as stub:
+        print(f"Stub APIs on {stub.url} (Ctrl-C to stop)")
+        try:
+            stub.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
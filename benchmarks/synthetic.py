@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+synthetic.py - Seeded synthetic inputs for the benchmarks.
+
+    make_csv        clinical-style table: id, group g (3 levels), sex, age,
+                    x1..xN numeric predictors, continuous outcome y, binary
+                    outcome event, survival time; `cols` controls width
+    make_workbook   multi-sheet .xlsx of such tables (openpyxl write-only)
+    make_pdf        multi-page PDF of paragraph text (PyMuPDF)
+    make_document   manuscript-like text of paragraphs, for add_citations
+    make_bibtex     BibTeX entries with titles/abstracts drawn from the same vocabulary
+    make_literature search_literature-style records (JSON lines) from PubMed,
+                    CrossRef and Semantic Scholar, overlapping by DOI/PMID, with
+                    text drawn from a large Zipf-distributed vocabulary
+
+Same arguments and seed give byte-identical files. Usage:
+
+    python3 benchmarks/synthetic.py csv tall.csv --rows 1000000 --cols 10
+    python3 benchmarks/synthetic.py workbook data.xlsx --sheets 4 --rows 250000
+    python3 benchmarks/synthetic.py pdf paper.pdf --pages 500
+    python3 benchmarks/synthetic.py literature results.jsonl --records 100000
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from stub_server import WORDS
+
+def table(rows, cols=10, seed=0, block=0):
+    """
+    Column name -> values for a synthetic table with `cols` numeric predictors
+    (at least 2). Blocks of one seed share the outcome model, so they can be
+    concatenated.
+    """
+    cols = max(cols, 2)
+    beta = np.random.default_rng(seed).normal(scale=0.5, size=cols)
+    rng = np.random.default_rng([seed, block])
+    X = rng.normal(size=(rows, cols))
+    lp = X @ beta
+    data = {"id": np.arange(1, rows + 1),
+            "g": rng.choice(np.array(["control", "low", "high"]), rows),
+            "sex": rng.choice(np.array(["F", "M"]), rows),
+            "age": rng.integers(18, 90, rows)}
+    data.update({f"x{j + 1}": X[:, j].round(6) for j in range(cols)})
+    data["y"] = (2.0 + lp + rng.normal(size=rows)).round(6)
+    data["event"] = (rng.random(rows) < 1 / (1 + np.exp(-lp))).astype(int)
+    data["time"] = rng.exponential(np.exp(-lp / 2) * 365).round(1) + 1
+    return data
+
+def make_csv(path, rows, cols=10, seed=0, block=200_000):
+    """Write the table in blocks, so tall files do not need to fit in memory at once."""
+    path = Path(path)
+    with open(path, "w", newline="") as f:
+        writer = None
+        for start in range(0, rows, block):
+            data = table(min(block, rows - start), cols, seed, start)
+            data["id"] = data["id"] + start
+            if writer is None:
+                writer = csv.writer(f); writer.writerow(data)
+            writer.writerows(zip(*(v.tolist() for v in data.values())))
+    return path
+
+def make_workbook(path, sheets=3, rows=10_000, cols=10, seed=0):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        data = table(rows, cols, seed + s)
+        ws.append(list(data))
+        for row in zip(*(v.tolist() for v in data.values())):
+            ws.append(row)
+    wb.save(path)
+    return Path(path)
+
+def paragraph(rng, words=120):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+def make_pdf(path, pages=100, seed=0):
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                            "\n\n".join(paragraph(rng) for _ in range(4)), fontsize=10)
+    doc.save(path, deflate=True)
+    doc.close()
+    return Path(path)
+
+def make_document(path, paragraphs=100, seed=0):
+    rng = random.Random(seed)
+    Path(path).write_text("\n\n".join(paragraph(rng) for _ in range(paragraphs)) + "\n")
+    return Path(path)
+
+def make_bibtex(path, entries=200, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(entries):
+        title = " ".join(rng.choice(WORDS) for _ in range(8)).capitalize()
+        out.append(f"@article{{ref{i},\n  author = {{Author{i % 97}, A. and Writer{i % 13}, B.}},\n"
+                   f"  title = {{{title}}},\n  journal = {{Stub Journal}},\n  year = {{{2000 + i % 25}}},\n"
+                   f"  doi = {{10.5555/ref.{i}}},\n  abstract = {{{paragraph(rng, 80)}}}\n}}")
+    Path(path).write_text("\n\n".join(out) + "\n")
+    return Path(path)
+
+SYLLABLES = "ba ce di fo gu ka le mi no pu ra se ti vo zu tha pre lin mor cal".split()
+FUNCTION_WORDS = ("the of and in to a with for was were is by that on as at from or be this are an which "
+                  "these between than after we not more had has").split()
+
+def vocabulary(size=20_000):
+    """
+    English-like vocabulary for Zipf sampling: function words take the top
+    ranks, the domain WORDS sit at mid ranks (so a query term like "thyroid"
+    matches a realistic share of documents), pseudo-words fill the tail.
+    """
+    words = list(FUNCTION_WORDS)
+    for i in range(size):
+        word, n = "", i + len(SYLLABLES)
+        while n:
+            n, r = divmod(n, len(SYLLABLES))
+            word += SYLLABLES[r]
+        words.append(word)
+    for k, word in enumerate(WORDS):
+        words.insert(60 + 25 * k, word)
+    return words
+
+def make_literature(path, records=10_000, seed=0):
+    """
+    Records as search_literature writes them. Each paper appears in one to
+    three sources, so about half of the records duplicate another by DOI/PMID.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary())
+    ranks = np.minimum(rng.zipf(1.1, size=records * 140), len(words)) - 1
+    with open(path, "w") as f:
+        for i in range(0, records):
+            text = " ".join(words[ranks[i * 140:(i + 1) * 140]])
+            title, abstract = text[:text.index(" ", 60)].capitalize(), text
+            pmid, doi = str(30_000_000 + i), f"10.5555/syn.{i}"
+            sources = [s for s, p in (("PubMed", 0.8), ("CrossRef", 0.5), ("SemanticScholar", 0.4)) if rng.random() < p]
+            for source in sources or ["CrossRef"]:
+                if source == "PubMed":
+                    rec = {"source": source, "id": pmid,
+                           "text": f"1. Syn J. 2020;1:1-9.\n\n{title}.\n\n{abstract}\n\nDOI: {doi}\nPMID: {pmid}\n"}
+                elif source == "CrossRef":
+                    rec = {"source": source, "id": doi, "title": title, "authors": [f"Author{i % 97}"], "published": 2000 + i % 25}
+                else:
+                    rec = {"source": source, "id": f"s2{i:08x}", "title": title, "year": 2000 + i % 25, "text": abstract,
+                           "doi": doi, "pmid": pmid}
+                f.write(json.dumps(rec) + "\n")
+    return Path(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark inputs")
+    sub = parser.add_subparsers(dest="kind", required=True)
+    for kind in ("csv", "workbook", "pdf", "document", "bibtex", "literature"):
+        p = sub.add_parser(kind)
+        p.add_argument("out", type=Path)
+        p.add_argument("--seed", type=int, default=0)
+        if kind in ("csv", "workbook"):
+            p.add_argument("--rows", type=int, default=10_000)
+            p.add_argument("--cols", type=int, default=10, help="Numeric predictor columns")
+        if kind == "workbook":
+            p.add_argument("--sheets", type=int, default=3)
+        if kind == "pdf":
+            p.add_argument("--pages", type=int, default=100)
+        if kind == "document":
+            p.add_argument("--paragraphs", type=int, default=100)
+        if kind == "bibtex":
+            p.add_argument("--entries", type=int, default=200)
+        if kind == "literature":
+            p.add_argument("--records", type=int, default=10_000, help="Distinct papers")
+    args = parser.parse_args()
+
+    if args.kind == "csv":
+        make_csv(args.out, args.rows, args.cols, args.seed)
+    elif args.kind == "workbook":
+        make_workbook(args.out, args.sheets, args.rows, args.cols, args.seed)
+    elif args.kind == "pdf":
+        make_pdf(args.out, args.pages, args.seed)
+    elif args.kind == "document":
+        make_document(args.out, args.paragraphs, args.seed)
+    elif args.kind == "bibtex":
+        make_bibtex(args.out, args.entries, args.seed)
+    else:
+        make_literature(args.out, args.records, args.seed)
+    print(args.out, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,33 @@
 add_citations.py - Insert inline citations into a document in a specified style.
 
 Reads a text file and a references file (e.g., BibTeX), calls OpenAI to
-insert inline citations in the desired style.
+insert inline citations in the desired style. Completions go through
+llm_client (cached, logged, pluggable backend).
+
+Long documents are split into paragraph chunks of about --chunk-tokens. Each
+chunk is sent with only its --top-k references, ranked by BM25 over each
+entry's title, abstract, keywords, authors and year. Chunks are processed
+concurrently and reassembled in order. Chunks that match no reference are
+left unchanged without a request. For Vancouver, the model marks citations as
+[@key] and numbers are assigned afterwards by order of first citation across
+the whole document. --whole sends everything in one prompt as before.
 """
 
 import argparse
 import logging
+import math
+import re
 import sys
+import time
+from collections import Counter
 from pathlib import Path
-import openai
+from http_session import DEFAULT_CONCURRENCY, concurrent_map
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from llm_client import LLMError, add_llm_arguments, complete, configure_from_args, count_tokens
+
+CHUNK_TOKENS = 800
+TOP_K = 8
+STOPWORDS = set("a an and are as at be by for from has in is it its of on or that the this to was were with".split())
 
 def setup_logging():
     logging.basicConfig(
@@ -21,6 +40,134 @@ def setup_logging():
 def read_file(path: Path) -> str:
     return path.read_text(encoding='utf-8')
 
+def _braced(text, start):
+    """Index just past the brace group opening at text[start]."""
+    depth = 0
+    for i in range(start, len(text)):
+        depth += {"{": 1, "}": -1}.get(text[i], 0)
+        if depth == 0:
+            return i + 1
+    return len(text)
+
+def parse_bibtex(text):
+    """Entries as dicts of lower-cased fields plus 'key' and the 'raw' entry text."""
+    entries = []
+    for m in re.finditer(r"@(\w+)\s*\{\s*([^,\s]+)\s*,", text):
+        if m.group(1).lower() in ("comment", "string", "preamble"):
+            continue
+        end = _braced(text, text.index("{", m.start()))
+        body = text[m.end():end - 1]
+        entry = {"key": m.group(2), "raw": text[m.start():end]}
+        for f in re.finditer(r"(\w+)\s*=\s*", body):
+            pos = f.end()
+            if pos < len(body) and body[pos] == "{":
+                value = body[pos + 1:_braced(body, pos) - 1]
+            elif pos < len(body) and body[pos] == '"':
+                value = body[pos + 1:body.find('"', pos + 1)]
+            else:
+                value = re.match(r"[^,}\s]*", body[pos:]).group()
+            entry.setdefault(f.group(1).lower(), re.sub(r"[{}\s]+", " ", value).strip())
+        entries.append(entry)
+    return entries
+
+def tokenize(text):
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+class BM25:
+    """Okapi BM25 over a list of token lists, scored through an inverted index."""
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.n = len(docs)
+        avgdl = sum(map(len, docs)) / self.n if docs else 0
+        self.postings = {}
+        for i, doc in enumerate(docs):
+            norm = k1 * (1 - b + b * len(doc) / avgdl) if avgdl else k1
+            for t, f in Counter(doc).items():
+                self.postings.setdefault(t, []).append((i, f * (k1 + 1) / (f + norm)))
+        self.idf = {t: math.log(1 + (self.n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self.postings.items()}
+
+    def scores(self, query):
+        out = [0.0] * self.n
+        for t in set(query):
+            idf = self.idf.get(t)
+            if idf:
+                for i, w in self.postings[t]:
+                    out[i] += idf * w
+        return out
+
+    def top_k(self, query, k):
+        """Indices of the k best-scoring documents with a positive score."""
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: -scores[i])
+        return [i for i in ranked[:k] if scores[i] > 0]
+
+def reference_index(entries):
+    docs = [tokenize(" ".join(e.get(f, "") for f in ("title", "abstract", "keywords", "author", "year"))) for e in entries]
+    return BM25(docs)
+
+def compact_entry(entry):
+    """The BibTeX entry without its abstract, to keep prompts short."""
+    fields = ",\n".join(f"  {f} = {{{entry[f]}}}" for f in ("author", "title", "journal", "booktitle", "year", "doi") if f in entry)
+    return f"@article{{{entry['key']},\n{fields}\n}}"
+
+def chunk_document(text, chunk_tokens=CHUNK_TOKENS, model=None):
+    """Consecutive paragraphs grouped into chunks of at most ~chunk_tokens (a longer paragraph stays whole)."""
+    chunks, current, used = [], [], 0
+    for para in re.split(r"\n\s*\n", text):
+        if not para.strip():
+            continue
+        cost = count_tokens(para, model)
+        if current and used + cost > chunk_tokens:
+            chunks.append("\n\n".join(current)); current, used = [], 0
+        current.append(para); used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def chunk_prompt(chunk, refs, style):
+    if style == "vancouver":
+        how = "Mark each citation as [@key] using the BibTeX key (e.g. [@smith2020] or [@smith2020; @lee2019])"
+    else:
+        how = f"Use {style.upper()} style inline citations"
+    return (f"Insert inline citations into the following passage. {how}. Cite only the references listed, "
+            "only where they support a statement. Return the passage with citations inserted and otherwise "
+            f"unchanged; return it as is if none applies.\n\nPassage:\n{chunk}\n\nReferences (BibTeX):\n"
+            + "\n".join(compact_entry(e) for e in refs))
+
+def number_citations(text, keys):
+    """Replace [@key; @key2] markers with Vancouver numbers in order of first citation."""
+    numbers = {}
+    def replace(m):
+        cited = [k.strip().lstrip("@") for k in m.group(1).split(";")]
+        nums = [numbers.setdefault(k, len(numbers) + 1) for k in cited if k in keys]
+        return f"[{','.join(map(str, sorted(set(nums))))}]" if nums else ""
+    return re.sub(r"\[(@[^\]]+)\]", replace, text), numbers
+
+def cite_chunks(doc_text, entries, style, model, chunk_tokens=CHUNK_TOKENS, top_k=TOP_K, concurrency=DEFAULT_CONCURRENCY):
+    with stage("reference_ranking"):
+        chunks = chunk_document(doc_text, chunk_tokens, model)
+        index = reference_index(entries)
+        plans = [[entries[i] for i in index.top_k(tokenize(c), top_k)] for c in chunks]
+    sent = sum(1 for refs in plans if refs)
+    logging.info(f"{len(chunks)} chunks, {sent} with candidate references (top {top_k} of {len(entries)})")
+    def cite(item):
+        chunk, refs = item
+        if not refs:
+            return chunk
+        prompt = chunk_prompt(chunk, refs, style)
+        return complete(model, [{"role":"user","content":prompt}], temperature=0.2,
+                        max_tokens=2 * count_tokens(chunk, model) + 200).strip()
+    cited = "\n\n".join(concurrent_map(cite, list(zip(chunks, plans)), concurrency))
+    if style == "vancouver":
+        cited, numbers = number_citations(cited, {e["key"] for e in entries})
+        by_key = {e["key"]: e for e in entries}
+        refs = [f"{n}. {by_key[k].get('author', '')}. {by_key[k].get('title', '')}. {by_key[k].get('year', '')}."
+                for k, n in sorted(numbers.items(), key=lambda kv: kv[1])]
+        if refs:
+            cited += "\n\nReferences\n\n" + "\n".join(refs)
+    return cited + "\n"
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser(description="Insert inline citations into document")
     parser.add_argument("document", type=Path, help="Text document file")
@@ -28,30 +175,46 @@ def main():
     parser.add_argument("--references", type=Path, required=True, help="References file (e.g. .bib)")
     parser.add_argument("--out", type=Path, default=Path("document_cited.txt"), help="Output file")
     parser.add_argument("--model", default="gpt-4", help="OpenAI model ID")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="Approximate tokens per document chunk")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="Candidate references sent with each chunk")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Chunks processed at once")
+    parser.add_argument("--whole", action="store_true", help="Send the whole document and references in one prompt")
+    add_llm_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging()
-    openai.api_key = sys.getenv("OPENAI_API_KEY")
-    if not openai.api_key:
-        logging.error("OPENAI_API_KEY not set")
-        sys.exit(1)
+    setup_logging(); instrument_from_args(args)
+    llm = configure_from_args(args)
 
     doc_text = read_file(args.document)
     ref_text = read_file(args.references)
+    with stage("bibtex_parse"):
+        entries = parse_bibtex(ref_text)
+    if not args.whole and not entries:
+        logging.warning("No BibTeX entries found in references; sending the whole document")
+        args.whole = True
 
     prompt = (
         f"Insert inline citations into the following document using {args.style.upper()} style.\n\n"
         f"Document:\n{doc_text}\n\nReferences (BibTeX):\n{ref_text}"
     )
 
-    response = openai.ChatCompletion.create(
-        model=args.model,
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.2,
-        max_tokens=3000
-    )
-
-    cited = response.choices[0].message.content
+    start = time.perf_counter()
+    try:
+        if args.whole:
+            cited = complete(
+                args.model,
+                [{"role":"user","content":prompt}],
+                temperature=0.2,
+                max_tokens=3000
+            )
+        else:
+            cited = cite_chunks(doc_text, entries, args.style, args.model, args.chunk_tokens, args.top_k, args.concurrency)
+    except LLMError as e:
+        logging.error(e)
+        sys.exit(1)
+    logging.info(f"Citations inserted in {time.perf_counter() - start:.1f}s")
+    llm.log_stats()
     args.out.write_text(cited)
     logging.info(f"Cited document saved to {args.out}")
 
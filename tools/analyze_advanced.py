@@ -1,14 +1,38 @@
 #!/usr/bin/env python3
 """
 analyze_advanced.py - Descriptive, regression, survival analyses.
+
+--stream computes descriptive statistics and correlations chunk by chunk with
+bounded memory (see streaming_stats.py for tolerances) and loads only the
+model columns for fitting. Correlations use numeric columns only.
+
+--spec fits many outcome/predictor/event specifications from a YAML or JSON
+file against one load of the data, in a process pool:
+
+    defaults: {outcome: los_days}          # optional, merged into each spec
+    specs:
+      - {name: base, predictors: [age, sex]}
+      - {name: adj, predictors: [age, sex, bmi]}
+      - {name: surv, outcome: time, event: died, predictors: [age]}
+
+Each spec's usual summary goes to <outdir>/models/<name>/. Two combined tables
+are also written: model_coefficients.csv (one row per term) and model_runs.csv
+(status, convergence warnings such as perfect separation, seconds per spec).
 """
 
-import argparse, logging, sys
+import argparse, json, logging, os, sys, time, warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import pandas as pd
-import statsmodels.api as sm
-from lifelines import CoxPHFitter
-from statsmodels.tools.sm_exceptions import PerfectSeparationError
+from dataset_cache import add_dataset_cache_arguments, load_dataset, widen
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from lazy_imports import lazy_import
+from streaming_stats import DEFAULT_K, stream_csv_stats
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+sm = lazy_import("statsmodels.api")
+sm_exceptions = lazy_import("statsmodels.tools.sm_exceptions")
+lifelines = lazy_import("lifelines")
 
 def setup_logging(log_path):
     logging.basicConfig(
@@ -17,40 +41,168 @@ def setup_logging(log_path):
         handlers=[logging.FileHandler(log_path), logging.StreamHandler(sys.stdout)],
     )
 
+def fit_model(df, outcome, predictors, event=None):
+    """Cox with an event column, logistic for a 0/1 outcome, OLS otherwise. Returns (kind, result)."""
+    if event:
+        data = df[[outcome, event] + predictors].dropna()
+        return "cox", lifelines.CoxPHFitter().fit(data, duration_col=outcome, event_col=event)
+    y = df[outcome]; X = sm.add_constant(df[predictors])
+    if set(y.dropna().unique()) <= {0,1}:
+        return "logistic", sm.Logit(y, X).fit(disp=False)
+    return "linear", sm.OLS(y, X).fit()
+
+def write_summary(kind, res, outdir):
+    if kind == "cox":
+        res.summary.to_csv(outdir / "cox_summary.csv")
+    else:
+        (outdir / f"{kind}_summary.txt").write_text(res.summary().as_text())
+
+def tidy(kind, res):
+    """One row per term: estimate, SE, test statistic, p, 95% CI, and exp(estimate) for HR/OR."""
+    if kind == "cox":
+        s = res.summary
+        out = pd.DataFrame({"term": s.index, "estimate": s["coef"], "std_error": s["se(coef)"], "statistic": s["z"],
+                            "p_value": s["p"], "ci_low": s["coef lower 95%"], "ci_high": s["coef upper 95%"]})
+        n = len(res.durations)
+    else:
+        ci = res.conf_int()
+        out = pd.DataFrame({"term": res.params.index, "estimate": res.params, "std_error": res.bse, "statistic": res.tvalues,
+                            "p_value": res.pvalues, "ci_low": ci[0], "ci_high": ci[1]})
+        n = int(res.nobs)
+    out["exp_estimate"] = np.exp(out["estimate"]) if kind != "linear" else np.nan
+    out["n"] = n
+    return out.reset_index(drop=True)
+
+def load_specs(path):
+    """Read a YAML/JSON spec file: a list of specs, or {defaults: {...}, specs: [...]}."""
+    text = path.read_text()
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("PyYAML is required for YAML spec files (pip install pyyaml), or use JSON")
+        raw = yaml.safe_load(text)
+    else:
+        raw = json.loads(text)
+    defaults, entries = ({}, raw) if isinstance(raw, list) else (raw.get("defaults", {}), raw.get("specs", []))
+    specs = []
+    for i, entry in enumerate(entries, 1):
+        spec = {**defaults, **entry}
+        spec.setdefault("name", f"spec{i:03d}")
+        spec["predictors"] = [spec["predictors"]] if isinstance(spec.get("predictors"), str) else spec.get("predictors")
+        if not spec.get("outcome") or not spec["predictors"]:
+            raise SystemExit(f"Spec {spec['name']}: outcome and predictors are required")
+        specs.append(spec)
+    names = [s["name"] for s in specs]
+    if len(set(names)) != len(names):
+        raise SystemExit("Spec names must be unique")
+    return specs
+
+_DATA = None
+
+def _init_worker(data):
+    global _DATA
+    _DATA = data
+
+def run_spec(spec, outdir):
+    """Fit one spec against the worker's copy of the data; never raises."""
+    run = {"spec": spec["name"], "model": None, "status": "ok", "converged": True, "warnings": "", "error": ""}
+    t0 = time.perf_counter()
+    coefs = None
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            kind, res = fit_model(_DATA, spec["outcome"], spec["predictors"], spec.get("event"))
+        run["model"] = kind
+        outdir.mkdir(parents=True, exist_ok=True)
+        write_summary(kind, res, outdir)
+        coefs = tidy(kind, res)
+        coefs.insert(0, "model", kind); coefs.insert(0, "spec", spec["name"])
+        flagged = sorted({w.category.__name__ for w in caught if any(k in w.category.__name__ for k in ("Convergence", "PerfectSeparation"))})
+        if flagged or (kind == "logistic" and not res.mle_retvals.get("converged", True)):
+            run.update(status="warning", converged=False, warnings="; ".join(flagged or ["not converged"]))
+    except sm_exceptions.PerfectSeparationError as e:
+        run.update(status="failed", converged=False, error=f"PerfectSeparationError: {e}")
+    except Exception as e:
+        run.update(status="failed", converged=False, error=f"{type(e).__name__}: {e}")
+    run["seconds"] = round(time.perf_counter() - t0, 3)
+    return run, coefs
+
+def run_specs(df, specs, outdir, jobs):
+    """Fit every spec in a process pool sharing one copy of the data per worker."""
+    needed = list(dict.fromkeys(c for s in specs for c in [s["outcome"], s.get("event"), *s["predictors"]] if c))
+    missing = [c for c in needed if c not in df.columns]
+    if missing:
+        logging.error(f"Columns not in data: {', '.join(missing)}"); sys.exit(1)
+    t0 = time.perf_counter()
+    with stage("model_fit_batch"), ProcessPoolExecutor(max_workers=max(1, min(jobs, len(specs))), initializer=_init_worker,
+                                                       initargs=(df[needed],)) as pool:
+        futures = [pool.submit(run_spec, spec, outdir / "models" / spec["name"]) for spec in specs]
+        results = [f.result() for f in futures]
+    runs = pd.DataFrame([r for r, _ in results])
+    runs.to_csv(outdir / "model_runs.csv", index=False)
+    coefs = [c for _, c in results if c is not None]
+    if coefs:
+        pd.concat(coefs, ignore_index=True).to_csv(outdir / "model_coefficients.csv", index=False)
+    for r in runs.itertuples():
+        if r.status != "ok":
+            logging.warning(f"Spec {r.spec}: {r.status} {r.error or r.warnings}")
+    counts = runs["status"].value_counts().to_dict()
+    logging.info(f"Fitted {len(specs)} specs in {time.perf_counter() - t0:.1f}s: {counts}")
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("csv", type=Path)
-    parser.add_argument("--outcome", required=True)
-    parser.add_argument("--predictors", required=True, nargs="+")
+    parser.add_argument("--outcome")
+    parser.add_argument("--predictors", nargs="+")
     parser.add_argument("--event", help="Event column for Cox", default=None)
     parser.add_argument("--outdir", type=Path, default=Path("analysis_output"))
     parser.add_argument("--log", type=Path, default=Path("analyze_advanced.log"))
+    parser.add_argument("--stream", action="store_true", help="Out-of-core statistics for files larger than memory")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="Rows per chunk with --stream")
+    parser.add_argument("--sketch-k", type=int, default=DEFAULT_K, help="Quantile sketch size with --stream (larger = more accurate)")
+    parser.add_argument("--spec", type=Path, help="YAML/JSON file of model specifications to fit in batch")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes with --spec")
+    add_dataset_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
+    if not args.spec and not (args.outcome and args.predictors):
+        parser.error("--outcome and --predictors are required unless --spec is given")
+    specs = load_specs(args.spec) if args.spec else None
 
-    setup_logging(args.log)
+    setup_logging(args.log); instrument_from_args(args)
     if not args.csv.exists():
         logging.error("CSV not found"); sys.exit(1)
     args.outdir.mkdir(exist_ok=True)
 
-    df = pd.read_csv(args.csv)
-    df.describe(include="all").to_csv(args.outdir / "descriptive_stats.csv")
-    df.corr().to_csv(args.outdir / "correlation_matrix.csv")
-
-    if args.event:
-        data = df[[args.outcome, args.event] + args.predictors].dropna()
-        cph = CoxPHFitter().fit(data, duration_col=args.outcome, event_col=args.event)
-        cph.summary.to_csv(args.outdir / "cox_summary.csv")
+    if args.stream:
+        stats = stream_csv_stats(args.csv, chunksize=args.chunksize, k=args.sketch_k)
+        logging.info(f"Streamed {stats.rows} rows, {len(stats.columns)} numeric columns")
+        with stage("describe"):
+            stats.describe().to_csv(args.outdir / "descriptive_stats.csv")
+        with stage("corr"):
+            stats.corr().to_csv(args.outdir / "correlation_matrix.csv")
+        models = specs or [{"outcome": args.outcome, "event": args.event, "predictors": args.predictors}]
+        needed = list(dict.fromkeys(c for m in models for c in [m["outcome"], m.get("event"), *m["predictors"]] if c))
+        # Use the columnar cache if another tool already built it, but never build it here.
+        df = load_dataset(args.csv, needed, cache_dir=args.cache_dir, use_cache=not args.no_cache, build=False)
     else:
-        y = df[args.outcome]; X = sm.add_constant(df[args.predictors])
-        if set(y.dropna().unique()) <= {0,1}:
-            try:
-                res = sm.Logit(y, X).fit(disp=False)
-                (args.outdir / "logistic_summary.txt").write_text(res.summary().as_text())
-            except PerfectSeparationError:
-                logging.error("Perfect separation")
-        else:
-            res = sm.OLS(y, X).fit()
-            (args.outdir / "linear_summary.txt").write_text(res.summary().as_text())
+        df = load_dataset(args.csv, cache_dir=args.cache_dir, use_cache=not args.no_cache)
+        with stage("describe"):  # on the dtypes read_csv gives, not the cache's compact ones
+            widen(df).describe(include="all").to_csv(args.outdir / "descriptive_stats.csv")
+        with stage("corr"):
+            df.corr(numeric_only=True).to_csv(args.outdir / "correlation_matrix.csv")
+
+    if specs:
+        run_specs(df, specs, args.outdir, args.jobs)
+        return
+    try:
+        with stage("model_fit"):
+            kind, res = fit_model(df, args.outcome, args.predictors, args.event)
+        write_summary(kind, res, args.outdir)
+    except sm_exceptions.PerfectSeparationError:
+        logging.error("Perfect separation")
 
 if __name__=="__main__":
     main()
@@ -4,13 +4,31 @@ create_apa_table.py - Generate an APA-style table from a CSV dataset.
 
 Computes N, mean (M), and standard deviation (SD) for numeric columns
 and outputs tables in Markdown and LaTeX formats.
+
+With --by GROUP the table is stratified: per-group N/M/SD for numeric columns,
+n (%) rows for categorical columns, and a between-group test for each
+variable (one-way ANOVA F computed from the grouped summaries, chi-square for
+categorical variables). All numeric summaries come from a single grouped
+aggregation. Several input CSVs are processed in parallel, one table each
+in --outdir.
 """
 
 import argparse
 import logging
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import pandas as pd
+from dataset_cache import add_dataset_cache_arguments, load_dataset
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, peak_rss_mb, record, stage
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+MAX_LEVELS = 10  # non-numeric columns with more levels are not tabulated
 
 def setup_logging():
     logging.basicConfig(
@@ -18,39 +36,140 @@ def setup_logging():
         format="%(asctime)s [%(levelname)s] %(message)s"
     )
 
+def format_p(p):
+    if pd.isna(p):
+        return ""
+    return "< .001" if p < .001 else f"{p:.3f}".lstrip("0")
+
+def overall_table(df):
+    """N, M and SD of every numeric column in one aggregation."""
+    agg = df.select_dtypes(include='number').agg(["count", "mean", "std"]).T
+    return pd.DataFrame({
+        'Variable': agg.index,
+        'N': agg["count"].astype(int).to_numpy(),
+        'M': [f"{m:.2f}" for m in agg["mean"]],
+        'SD': [f"{s:.2f}" for s in agg["std"]],
+    })
+
+def anova_from_summaries(n, mean, var):
+    """One-way ANOVA F and p from per-group count, mean and variance."""
+    ok = n > 0
+    n, mean, var = n[ok], mean[ok], np.nan_to_num(var[ok])
+    k, total = len(n), n.sum()
+    if k < 2 or total <= k:
+        return np.nan, np.nan, (k - 1, total - k)
+    grand = (n * mean).sum() / total
+    ssb = (n * (mean - grand) ** 2).sum()
+    ssw = ((n - 1) * var).sum()
+    f = (ssb / (k - 1)) / (ssw / (total - k)) if ssw > 0 else np.nan
+    return f, stats.f.sf(f, k - 1, total - k), (k - 1, total - k)
+
+def grouped_table(df, by, max_levels=MAX_LEVELS):
+    """Table 1 stratified by `by`: numeric N/M/SD per group, categorical n (%), and test statistics."""
+    data = df[df[by].notna()]
+    groups = sorted(data[by].unique().tolist())
+    numeric = [c for c in data.select_dtypes(include='number').columns if c != by]
+    categorical = [c for c in data.columns if c != by and c not in numeric and data[c].nunique() <= max_levels]
+    columns = ['Variable'] + [f"{g} {s}" for g in groups for s in ("N", "M", "SD")] + ['Test', 'p']
+    rows = []
+
+    agg = data.groupby(by, sort=False, observed=True)[numeric].agg(["count", "mean", "var"]) if numeric else None
+    for col in numeric:
+        summary = agg[col].reindex(groups)
+        row = {'Variable': col}
+        for g, (n, m, v) in summary.iterrows():
+            row.update({f"{g} N": int(n), f"{g} M": f"{m:.2f}", f"{g} SD": f"{np.sqrt(v):.2f}"})
+        f, p, (df1, df2) = anova_from_summaries(summary["count"].to_numpy(float), summary["mean"].to_numpy(float), summary["var"].to_numpy(float))
+        row.update({'Test': f"F({df1}, {int(df2)}) = {f:.2f}" if pd.notna(f) else "", 'p': format_p(p)})
+        rows.append(row)
+
+    for col in categorical:
+        table = pd.crosstab(data[col], data[by]).reindex(columns=groups, fill_value=0)
+        totals = table.sum(axis=0)
+        test = {'Test': "", 'p': ""}
+        # groups or levels with no observations have zero expected counts; test only the rest
+        observed = table.loc[table.sum(axis=1) > 0, totals > 0]
+        if observed.shape[0] > 1 and observed.shape[1] > 1:
+            try:
+                chi2, p, dof, _ = stats.chi2_contingency(observed)
+                test = {'Test': f"χ²({dof}) = {chi2:.2f}", 'p': format_p(p)}
+            except ValueError as e:
+                logging.warning(f"No chi-square test for {col}: {e}")
+        rows.append({'Variable': col, **test})
+        for level, counts in table.iterrows():
+            row = {'Variable': f"  {level}"}
+            for g in groups:
+                pct = 100 * counts[g] / totals[g] if totals[g] else 0
+                row[f"{g} N"] = f"{counts[g]} ({pct:.1f}%)"
+            rows.append(row)
+    return pd.DataFrame(rows, columns=columns).fillna("")
+
+def build_table(csv, by=None, max_levels=MAX_LEVELS, cache_dir=None, use_cache=True):
+    kwargs = {"use_cache": use_cache, **({"cache_dir": cache_dir} if cache_dir else {})}
+    df = load_dataset(csv, **kwargs) if by else load_dataset(csv, numeric_only=True, **kwargs)
+    with stage("table_build"):
+        return grouped_table(df, by, max_levels) if by else overall_table(df)
+
+def write_table(apa_df, md_path, tex_path=None, by=None):
+    with stage("table_write"):
+        # grouped cells are preformatted ("50.00", ".032"); stop tabulate re-parsing them as numbers
+        md_path.write_text(apa_df.to_markdown(index=False, disable_numparse=bool(by)))
+        logging.info(f"APA table saved to {md_path}")
+        if tex_path:
+            caption = f"Descriptive Statistics by {by}" if by else "Descriptive Statistics"
+            tex = apa_df.to_latex(index=False, caption=caption, label="tab:descriptive", float_format="%.2f")
+            tex_path.write_text(tex)
+            logging.info(f"LaTeX table saved to {tex_path}")
+
+def process(csv, md_path, tex_path, by, max_levels, cache_dir, use_cache):
+    """Build and write one table; runs in a worker process in batch mode. Returns (wall, CPU seconds, peak RSS MB)."""
+    setup_logging()
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    write_table(build_table(csv, by, max_levels, cache_dir, use_cache), md_path, tex_path, by)
+    return time.perf_counter() - t0, time.process_time() - cpu0, peak_rss_mb()
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser(description="Generate APA-style descriptive table")
-    parser.add_argument("csv", type=Path, help="Input CSV file")
+    parser.add_argument("csv", type=Path, nargs="+", help="Input CSV file(s)")
     parser.add_argument("--out", type=Path, default=Path("apa_table.md"), help="Output Markdown file")
-    parser.add_argument("--to-tex", type=Path, help="Output LaTeX file")
+    parser.add_argument("--to-tex", type=Path, help="Output LaTeX file (batch mode: any value writes <stem>_apa_table.tex)")
+    parser.add_argument("--by", help="Grouping column for a stratified Table 1")
+    parser.add_argument("--max-levels", type=int, default=MAX_LEVELS, help="Max levels for categorical n (%%) rows")
+    parser.add_argument("--outdir", type=Path, default=Path("apa_tables"), help="Output directory when several CSVs are given")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="CSVs processed in parallel")
+    add_dataset_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging()
-    if not args.csv.exists():
-        logging.error(f"CSV not found: {args.csv}")
+    setup_logging(); instrument_from_args(args)
+    missing = [str(p) for p in args.csv if not p.exists()]
+    if missing:
+        logging.error(f"CSV not found: {', '.join(missing)}")
         sys.exit(1)
 
-    df = pd.read_csv(args.csv)
-    numeric = df.select_dtypes(include='number').columns
-    records = []
-    for col in numeric:
-        series = df[col].dropna()
-        records.append({
-            'Variable': col,
-            'N': series.count(),
-            'M': f"{series.mean():.2f}",
-            'SD': f"{series.std():.2f}"
-        })
-    apa_df = pd.DataFrame(records)
-
-    md = apa_df.to_markdown(index=False)
-    args.out.write_text(md)
-    logging.info(f"APA table saved to {args.out}")
-
-    if args.to_tex:
-        tex = apa_df.to_latex(index=False, caption="Descriptive Statistics", label="tab:descriptive", float_format="%.2f")
-        args.to_tex.write_text(tex)
-        logging.info(f"LaTeX table saved to {args.to_tex}")
+    common = (args.by, args.max_levels, args.cache_dir, not args.no_cache)
+    if len(args.csv) == 1:
+        process(args.csv[0], args.out, args.to_tex, *common)
+        return
+
+    args.outdir.mkdir(parents=True, exist_ok=True)
+    failed = 0
+    with stage("table_pool"), ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(args.csv)))) as pool:
+        futures = {}
+        for csv in args.csv:
+            md = args.outdir / f"{csv.stem}_apa_table.md"
+            tex = md.with_suffix(".tex") if args.to_tex else None
+            futures[pool.submit(process, csv, md, tex, *common)] = csv
+        for future in as_completed(futures):
+            try:
+                record("table", *future.result())
+            except Exception as e:
+                failed += 1
+                logging.error(f"Failed on {futures[future]}: {e}")
+    logging.info(f"{len(args.csv) - failed}/{len(args.csv)} tables written to {args.outdir}")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,168 @@
+"""
+dataset_cache.py - Shared columnar cache for the CSV-consuming tools.
+
+The first tool to load a CSV parses it once and stores a compact Parquet copy
+keyed by the file's SHA-256. Every later load, by any tool, reads only the
+columns it asks for from that copy. When the cache is built:
+
+- integer columns are downcast to the smallest integer type that holds them;
+- text columns with few distinct values become categoricals, with categories
+  in order of first appearance (the order seaborn uses);
+- float columns stay float64, so statistics are unchanged.
+
+A small index maps (path, size, mtime) to the file hash, so unchanged files
+are not re-hashed on every run. Without pyarrow, loads fall back to
+pd.read_csv(usecols=...).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from instrumentation import stage
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "research-assistant-ai" / "datasets"
+CATEGORY_RATIO = 0.5  # text columns with fewer unique values than this share of rows become categorical
+_index_lock = threading.Lock()  # serializes index updates between threads of one process (tool server)
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast integer columns and encode low-cardinality text columns as categoricals."""
+    out = {}
+    for name, col in df.items():
+        if pd.api.types.is_integer_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            col = pd.to_numeric(col, downcast="integer")
+        elif col.dtype == object and len(col):
+            values = col.dropna()
+            if values.map(type).eq(str).all() and values.nunique() < CATEGORY_RATIO * len(col):
+                col = pd.Categorical(col, categories=pd.unique(values))
+        out[name] = col
+    return pd.DataFrame(out, index=df.index)
+
+def widen(df: pd.DataFrame) -> pd.DataFrame:
+    """Undo compact(): integer columns back to int64 and categoricals back to object, as pd.read_csv gives them."""
+    out = {}
+    for name, col in df.items():
+        if pd.api.types.is_integer_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            col = col.astype("int64")
+        elif isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype(object)
+        out[name] = col
+    return pd.DataFrame(out, index=df.index)
+
+def _tmp_path(path: Path) -> Path:
+    """Sibling temporary file unique to this process and thread, for write-then-replace."""
+    return path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+class DatasetCache:
+    """Parquet copies of CSV files under cache_dir, keyed by content hash."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.json"
+
+    def _index(self) -> dict:
+        try:
+            return json.loads(self.index_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def content_hash(self, csv_path: Path) -> str:
+        """Hash of csv_path, reusing the stored hash while size and mtime are unchanged."""
+        key, st = str(Path(csv_path).resolve()), os.stat(csv_path)
+        entry = self._index().get(key)
+        if entry and (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return entry["sha256"]
+        digest = file_sha256(csv_path)
+        with _index_lock:
+            index = self._index()
+            index[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+            tmp = _tmp_path(self.index_path)
+            tmp.write_text(json.dumps(index, indent=1))
+            tmp.replace(self.index_path)  # atomic, so readers never see a partial index
+        return digest
+
+    def path_for(self, csv_path: Path) -> Path:
+        return self.cache_dir / f"{self.content_hash(csv_path)}.parquet"
+
+    def build(self, csv_path: Path, parquet_path: Path):
+        t0 = time.perf_counter()
+        with stage("cache_build"):
+            df = compact(pd.read_csv(csv_path))
+            tmp = _tmp_path(parquet_path)
+            df.to_parquet(tmp, index=False)
+        tmp.replace(parquet_path)  # atomic, so concurrent tools never see a partial file
+        logging.info(f"Dataset cache built for {csv_path} in {time.perf_counter() - t0:.2f}s")
+
+    def load(self, csv_path: Path, columns=None, numeric_only=False, build=True):
+        """
+        Load csv_path through the cache. Returns None if it is not cached and
+        build is False.
+        """
+        parquet_path = self.path_for(csv_path)
+        if not parquet_path.exists():
+            if not build:
+                return None
+            self.build(csv_path, parquet_path)
+        if numeric_only:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(parquet_path)
+            numeric = [f.name for f in schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type)]
+            columns = [c for c in columns if c in numeric] if columns else numeric
+        t0 = time.perf_counter()
+        df = pd.read_parquet(parquet_path, columns=list(columns) if columns is not None else None)
+        logging.info(f"Loaded {df.shape[1]} columns x {len(df)} rows of {csv_path} from dataset cache "
+                     f"in {time.perf_counter() - t0:.2f}s")
+        return df
+
+def load_dataset(csv_path, columns=None, numeric_only=False, cache_dir=DEFAULT_CACHE_DIR,
+                 use_cache=True, build=True):
+    """
+    Load a CSV, only `columns` if given (or only numeric columns), through the
+    shared dataset cache. With build=False an uncached file is read directly
+    instead of being cached, for callers that must not hold it all in memory.
+    """
+    with stage("csv_load"):
+        return _load(csv_path, columns, numeric_only, cache_dir, use_cache, build)
+
+def _load(csv_path, columns, numeric_only, cache_dir, use_cache, build):
+    columns = list(dict.fromkeys(columns)) if columns is not None else None
+    if use_cache and _have_pyarrow():
+        df = DatasetCache(cache_dir).load(Path(csv_path), columns, numeric_only, build=build)
+        if df is not None:
+            return df
+    elif use_cache:
+        logging.warning("pyarrow is not installed; reading CSV without the dataset cache")
+    df = pd.read_csv(csv_path, usecols=columns)
+    return df.select_dtypes(include="number") if numeric_only else df
+
+def add_dataset_cache_arguments(parser):
+    """Add the shared --cache-dir/--no-cache flags to a CSV-consuming tool."""
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                        help="Directory holding the columnar dataset cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse the CSV directly instead of using the dataset cache")
@@ -3,26 +3,40 @@
 generate_bibtex.py
 
 Fetches BibTeX entries for a list of identifiers (DOIs or PMIDs) and writes them
-to a .bib file. PMIDs are resolved via CrossRef’s PMID filter.
+to a .bib file. PMIDs are resolved to DOIs with PubMed ESummary, several PMIDs
+per request (falling back to CrossRef for records PubMed has no DOI for), and
+entries are fetched concurrently over pooled keep-alive connections. The
+output keeps the order of the input identifiers. Responses are kept in the
+shared on-disk cache (see response_cache.py).
 
 Usage:
     python3 tools/generate_bibtex.py 10.1038/nature12373 31452104 \
-        --out references.bib
+        --out references.bib --concurrency 8 --batch-size 20
 
 Requirements:
     pip install requests
 """
 
 import argparse
+import json
 import logging
 import re
 import sys
 from pathlib import Path
 
-import requests
+from http_session import DEFAULT_CONCURRENCY, RateLimiter, cached_get, concurrent_map, get_with_retry
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from lazy_imports import lazy_import
+from response_cache import add_cache_arguments, configure_from_args, get_cache
+
+requests = lazy_import("requests")
 
 CROSSREF_WORKS_URL = "https://api.crossref.org/works"
 DOI_RESOLVE_URL = "https://doi.org/"
+ESUMMARY_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+PMID_BATCH_SIZE = 20
+# E-utilities allow 3 requests/s without an API key; batches share one limiter.
+ESUMMARY_LIMITER = RateLimiter(3)
 
 def setup_logging():
     logging.basicConfig(
@@ -34,19 +48,23 @@ def fetch_bibtex_from_doi(doi: str, timeout: float = 10.0) -> str:
     """Fetch a BibTeX entry directly via DOI resolution."""
     headers = {"Accept": "application/x-bibtex"}
     url = DOI_RESOLVE_URL + doi
-    resp = requests.get(url, headers=headers, timeout=timeout)
-    resp.raise_for_status()
-    return resp.text.strip()
+    return cached_get("doi", url, headers=headers, timeout=timeout).strip()
 
 def fetch_bibtex_from_pmid(pmid: str, timeout: float = 10.0) -> str:
     """
     Resolve a PMID to a DOI via CrossRef, then fetch the BibTeX.
     Returns empty string if not found.
     """
+    doi = resolve_pmid_to_doi(pmid, timeout=timeout)
+    if not doi:
+        return ""
+    return fetch_bibtex_from_doi(doi, timeout=timeout)
+
+def resolve_pmid_to_doi(pmid: str, timeout: float = 10.0) -> str:
+    """Resolve a single PMID to a DOI via CrossRef. Returns empty string if not found."""
     params = {"filter": f"pmid:{pmid}", "rows": 1}
-    resp = requests.get(CROSSREF_WORKS_URL, params=params, timeout=timeout)
-    resp.raise_for_status()
-    data = resp.json().get("message", {}).get("items", [])
+    body = cached_get("crossref", CROSSREF_WORKS_URL, params=params, timeout=timeout)
+    data = json.loads(body).get("message", {}).get("items", [])
     if not data:
         logging.warning(f"No CrossRef entry found for PMID {pmid}")
         return ""
@@ -54,12 +72,88 @@ def fetch_bibtex_from_pmid(pmid: str, timeout: float = 10.0) -> str:
     if not doi:
         logging.warning(f"No DOI in CrossRef record for PMID {pmid}")
         return ""
-    return fetch_bibtex_from_doi(doi, timeout=timeout)
+    return doi
+
+def _esummary_dois(pmids: list, timeout: float = 10.0) -> dict:
+    """Map each PMID PubMed ESummary knows to the DOI in its article ids ("" if none)."""
+    params = {"db": "pubmed", "id": ",".join(pmids), "retmode": "json"}
+    def fetch():
+        return get_with_retry(ESUMMARY_URL, params=params, timeout=timeout,
+                              limiter=ESUMMARY_LIMITER).text
+    body = get_cache().cached("pubmed", (ESUMMARY_URL, params, {}), fetch)
+    result = json.loads(body).get("result", {})
+    dois = {}
+    for pmid in result.get("uids", []):
+        ids = result.get(pmid, {}).get("articleids", [])
+        dois[pmid] = next((a.get("value", "") for a in ids if a.get("idtype") == "doi"), "")
+    return dois
+
+def resolve_pmid_batch(pmids: list, timeout: float = 10.0) -> dict:
+    """
+    Resolve several PMIDs with one PubMed ESummary request.
+
+    Returns a dict mapping each PMID to its DOI, or to "" when none is found.
+    PMIDs whose PubMed record carries no DOI are looked up in CrossRef one at
+    a time.
+    """
+    dois = _esummary_dois(pmids, timeout=timeout)
+    for pmid in pmids:
+        if not dois.get(pmid):
+            dois[pmid] = resolve_pmid_to_doi(pmid, timeout=timeout)
+    return {pmid: dois[pmid] for pmid in pmids}
+
+def resolve_pmids(pmids: list, batch_size: int = PMID_BATCH_SIZE,
+                  timeout: float = 10.0, concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+    """Resolve PMIDs to DOIs in concurrent batches. Failed batches map to ""."""
+    unique = list(dict.fromkeys(pmids))
+    batches = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+
+    def run(batch):
+        try:
+            return resolve_pmid_batch(batch, timeout=timeout)
+        except (requests.RequestException, ValueError) as e:  # ValueError: malformed JSON body
+            logging.error(f"DOI lookup failed for PMIDs {', '.join(batch)}: {e}")
+            return {pmid: "" for pmid in batch}
+
+    dois = {}
+    for found in concurrent_map(run, batches, concurrency):
+        dois.update(found)
+    return dois
+
+def fetch_entry(identifier: str, pmid_dois: dict, timeout: float = 10.0) -> str:
+    """Fetch one BibTeX entry, logging failures. Returns empty string on failure."""
+    try:
+        if is_pmid(identifier):
+            logging.info(f"Fetching BibTeX for PMID {identifier}")
+            doi = pmid_dois.get(identifier, "")
+            bib = fetch_bibtex_from_doi(doi, timeout=timeout) if doi else ""
+        else:
+            logging.info(f"Fetching BibTeX for DOI {identifier}")
+            bib = fetch_bibtex_from_doi(identifier, timeout=timeout)
+        if not bib:
+            logging.error(f"No BibTeX entry found for {identifier}")
+        return bib
+    except requests.HTTPError as e:
+        logging.error(f"HTTP error for {identifier}: {e}")
+    except Exception:
+        logging.exception(f"Unexpected error fetching {identifier}")
+    return ""
+
+def fetch_entries(identifiers: list, timeout: float = 10.0,
+                  concurrency: int = DEFAULT_CONCURRENCY,
+                  batch_size: int = PMID_BATCH_SIZE) -> list:
+    """Fetch BibTeX for every identifier; the result list follows input order."""
+    pmid_dois = resolve_pmids([i for i in identifiers if is_pmid(i)],
+                              batch_size=batch_size, timeout=timeout,
+                              concurrency=concurrency)
+    return concurrent_map(lambda i: fetch_entry(i, pmid_dois, timeout=timeout),
+                          identifiers, concurrency)
 
 def is_pmid(identifier: str) -> bool:
     """Detect if the identifier is a numeric PMID."""
     return bool(re.fullmatch(r"\d+", identifier))
 
+@instrumented
 def main():
     parser = argparse.ArgumentParser(
         description="Generate a BibTeX file from DOIs or PMIDs"
@@ -76,27 +170,27 @@ def main():
         "--timeout", type=float, default=10.0,
         help="Network timeout in seconds"
     )
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help="Maximum number of requests in flight"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=PMID_BATCH_SIZE,
+        help="PMIDs resolved per PubMed ESummary request"
+    )
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
-
-    setup_logging()
-    entries = []
-
-    for identifier in args.ids:
-        try:
-            if is_pmid(identifier):
-                logging.info(f"Fetching BibTeX for PMID {identifier}")
-                bib = fetch_bibtex_from_pmid(identifier, timeout=args.timeout)
-            else:
-                logging.info(f"Fetching BibTeX for DOI {identifier}")
-                bib = fetch_bibtex_from_doi(identifier, timeout=args.timeout)
-            if bib:
-                entries.append(bib)
-            else:
-                logging.error(f"No BibTeX entry found for {identifier}")
-        except requests.HTTPError as e:
-            logging.error(f"HTTP error for {identifier}: {e}")
-        except Exception as e:
-            logging.exception(f"Unexpected error fetching {identifier}")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    setup_logging(); instrument_from_args(args)
+    cache = configure_from_args(args)
+    with stage("fetch_entries"):
+        bibs = fetch_entries(args.ids, timeout=args.timeout,
+                             concurrency=args.concurrency, batch_size=args.batch_size)
+    cache.log_stats()
+    entries = [bib for bib in bibs if bib]
 
     if not entries:
         logging.error("No entries fetched; exiting without writing file.")
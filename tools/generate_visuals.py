@@ -1,31 +1,170 @@
 #!/usr/bin/env python3
 """
 generate_visuals.py - Boxplot, violin, pairplot, ROC.
+
+Figures render in parallel worker processes on the non-interactive Agg
+backend. A figure is skipped when its data, columns and parameters match the
+previous run (fingerprints in <outdir>/figures.json). Above --max-rows rows:
+
+- the pairplot is drawn from NumPy-binned 2D histograms;
+- boxplots keep exact statistics but show a sample of the outliers;
+- violins use a sample stratified by group.
 """
 
-import argparse, logging, sys
+import argparse, hashlib, json, logging, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.metrics import roc_curve, auc
+from dataset_cache import DatasetCache, add_dataset_cache_arguments, file_sha256, load_dataset
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, peak_rss_mb, record, stage
+from lazy_imports import lazy_import
+
+os.environ["MPLBACKEND"] = "Agg"  # same as matplotlib.use("Agg"), before matplotlib is (lazily) imported
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+matplotlib = lazy_import("matplotlib")
+plt = lazy_import("matplotlib.pyplot")
+cbook = lazy_import("matplotlib.cbook")
+sns = lazy_import("seaborn")
+metrics = lazy_import("sklearn.metrics")
+
+RENDER_VERSION = 1  # bump when a renderer's output changes
+MAX_ROWS = 50_000
+BINS = 60
+MAX_FLIERS = 1_000
 
-sns.set_theme(style="whitegrid")
 def setup_logging(): logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
+def stratified_sample(df, group, n, seed=0):
+    """About n rows, keeping each group's share of the data."""
+    if len(df) <= n:
+        return df
+    if not group:
+        return df.sample(n, random_state=seed)
+    return df.groupby(group, observed=True).sample(frac=n / len(df), random_state=seed)
+
+def _boxplot(data, p, out):
+    if len(data) <= p["max_rows"]:
+        sns.boxplot(data=data, x=p["group"], y=p["value"])
+    else:
+        groups = [(k, g.dropna().to_numpy()) for k, g in data.groupby(p["group"], sort=False, observed=True)[p["value"]]]
+        stats = []
+        rng = np.random.default_rng(0)
+        for key, values in groups:
+            s = cbook.boxplot_stats(values)[0]
+            if len(s["fliers"]) > MAX_FLIERS:
+                s["fliers"] = rng.choice(s["fliers"], MAX_FLIERS, replace=False)
+            s["label"] = str(key); stats.append(s)
+        ax = plt.gca(); ax.bxp(stats); ax.set_xlabel(p["group"]); ax.set_ylabel(p["value"])
+    plt.savefig(out)
+
+def _violinplot(data, p, out):
+    sns.violinplot(data=stratified_sample(data, p["group"], p["max_rows"]), x=p["group"], y=p["value"])
+    plt.savefig(out)
+
+def _pairplot(data, p, out):
+    if len(data) <= p["max_rows"]:
+        sns.pairplot(data); plt.savefig(out); return
+    cols = list(data.columns); k = len(cols)
+    fig, axes = plt.subplots(k, k, figsize=(2.5 * k, 2.5 * k), squeeze=False)
+    values = {c: data[c].to_numpy(dtype=float) for c in cols}
+    for i, yc in enumerate(cols):
+        for j, xc in enumerate(cols):
+            ax = axes[i][j]
+            if i == j:
+                v = values[xc][~np.isnan(values[xc])]
+                counts, edges = np.histogram(v, bins=BINS)
+                ax.stairs(counts, edges, fill=True)
+            else:
+                ok = ~(np.isnan(values[xc]) | np.isnan(values[yc]))
+                h, xe, ye = np.histogram2d(values[xc][ok], values[yc][ok], bins=BINS)
+                ax.pcolormesh(xe, ye, np.ma.masked_equal(h.T, 0), cmap="viridis", norm=matplotlib.colors.LogNorm())
+            if i == k - 1: ax.set_xlabel(xc)
+            if j == 0: ax.set_ylabel(yc)
+    fig.tight_layout(); fig.savefig(out)
+
+def _roc(data, p, out):
+    y = data[p["label"]]; s = data[p["score"]]; fpr,tpr,_=metrics.roc_curve(y,s); plt.plot(fpr,tpr,label=f"AUC={metrics.auc(fpr,tpr):.2f}"); plt.plot([0,1],[0,1],'--'); plt.legend(); plt.savefig(out)
+
+RENDERERS = {"boxplot": _boxplot, "violinplot": _violinplot, "pairplot": _pairplot, "roc_curve": _roc}
+
+def render(name, data, params, out):
+    """Render one figure in a fresh pyplot state; runs in a worker process. Returns (wall, CPU seconds, peak RSS MB)."""
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    sns.set_theme(style="whitegrid")
+    plt.figure()
+    try:
+        RENDERERS[name](data, params, out)
+    finally:
+        plt.close("all")
+    return time.perf_counter() - t0, time.process_time() - cpu0, peak_rss_mb()
+
+def fingerprint(data_hash, name, columns, params):
+    blob = json.dumps([RENDER_VERSION, data_hash, name, columns, params], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def plan_figures(args):
+    """(name, columns, params) for every requested figure; pairplot columns None = all numeric."""
+    figures = []
+    if args.group and args.value:
+        params = {"group": args.group, "value": args.value, "max_rows": args.max_rows}
+        figures += [("boxplot", [args.group, args.value], params), ("violinplot", [args.group, args.value], params)]
+    figures.append(("pairplot", args.pairplot_columns, {"max_rows": args.max_rows}))
+    if args.score:
+        label = args.group or args.value
+        figures.append(("roc_curve", [label, args.score], {"label": label, "score": args.score}))
+    return figures
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("csv", type=Path)
     parser.add_argument("--group"); parser.add_argument("--value"); parser.add_argument("--score")
+    parser.add_argument("--pairplot-columns", nargs="+", help="Columns for the pairplot (default: all numeric)")
+    parser.add_argument("--max-rows", type=int, default=MAX_ROWS, help="Above this, use binned/sampled rendering")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Figures rendered in parallel")
+    parser.add_argument("--force", action="store_true", help="Re-render figures even if unchanged")
     parser.add_argument("--outdir", type=Path, default=Path("visuals_output"))
+    add_dataset_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
-    setup_logging(); args.outdir.mkdir(exist_ok=True)
-    df = pd.read_csv(args.csv)
-    if args.group and args.value:
-        sns.boxplot(data=df, x=args.group, y=args.value); plt.savefig(args.outdir/"boxplot.png"); plt.clf()
-        sns.violinplot(data=df, x=args.group, y=args.value); plt.savefig(args.outdir/"violinplot.png"); plt.clf()
-    sns.pairplot(df); plt.savefig(args.outdir/"pairplot.png"); plt.clf()
-    if args.score:
-        y=df[args.group or args.value]; s=df[args.score]; fpr,tpr,_=roc_curve(y,s); plt.plot(fpr,tpr,label=f"AUC={auc(fpr,tpr):.2f}"); plt.plot([0,1],[0,1],'--'); plt.legend(); plt.savefig(args.outdir/"roc_curve.png")
+    setup_logging(); instrument_from_args(args); args.outdir.mkdir(exist_ok=True)
+
+    data_hash = file_sha256(args.csv) if args.no_cache else DatasetCache(args.cache_dir).content_hash(args.csv)
+    state_path = args.outdir/"figures.json"
+    state = {} if args.force or not state_path.exists() else json.loads(state_path.read_text())
+    todo = []
+    for name, columns, params in plan_figures(args):
+        fp = fingerprint(data_hash, name, columns, params)
+        out = args.outdir/f"{name}.png"
+        if state.get(name) == fp and out.exists():
+            logging.info(f"{out} is up to date"); continue
+        todo.append((name, columns, params, out, fp))
+    if not todo:
+        return
+
+    if any(columns is None for _, columns, *_ in todo):
+        df = load_dataset(args.csv, cache_dir=args.cache_dir, use_cache=not args.no_cache)
+        todo = [(n, c if c is not None else list(df.select_dtypes(include="number").columns), *rest) for n, c, *rest in todo]
+    else:
+        needed = list(dict.fromkeys(c for _, columns, *_ in todo for c in columns))
+        df = load_dataset(args.csv, needed, cache_dir=args.cache_dir, use_cache=not args.no_cache)
+    if len(df) > args.max_rows:
+        logging.info(f"{len(df)} rows > --max-rows {args.max_rows}: using binned/sampled rendering")
+    failed = 0
+    with stage("render_pool"), ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(todo)))) as pool:
+        futures = [(pool.submit(render, name, df[columns], params, str(out)), name, out, fp) for name, columns, params, out, fp in todo]
+        for future, name, out, fp in futures:
+            try:
+                wall, cpu, rss = future.result()
+            except Exception as e:
+                failed += 1; logging.error(f"Failed to render {name}: {e}"); state.pop(name, None); continue
+            record(f"figure_render:{name}", wall, cpu, rss)
+            state[name] = fp
+            logging.info(f"Saved {out}")
+    state_path.write_text(json.dumps(state, indent=2))
+    if failed:
+        logging.error(f"{failed}/{len(todo)} figures failed to render")
+        sys.exit(1)
+
 if __name__=="__main__":
     main()
@@ -0,0 +1,114 @@
+"""
+http_session.py - Pooled keep-alive HTTP sessions and bounded concurrent fetching.
+
+Shared by the tools that talk to remote APIs (CrossRef, doi.org, ...). Each
+worker thread gets its own requests.Session so connections are reused across
+calls without sharing a Session between threads. Long-running paginated
+fetches use RateLimiter and get_with_retry() to stay within API quotas.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import stage
+from lazy_imports import lazy_import
+from response_cache import get_cache
+
+requests = lazy_import("requests")
+adapters = lazy_import("requests.adapters")
+
+DEFAULT_CONCURRENCY = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_local = threading.local()
+
+def get_session(pool_size: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """Return the calling thread's keep-alive session, creating it on first use."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+def concurrent_map(func, items, concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """
+    Apply `func` to every item using at most `concurrency` threads.
+    Results are returned in input order; exceptions propagate to the caller,
+    so `func` should handle per-item failures itself.
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        return list(pool.map(func, items))
+
+def cached_get(source: str, url: str, params=None, headers=None, timeout: float = 10.0) -> str:
+    """
+    GET `url` on the thread's pooled session and return the response text,
+    served from the response cache when available. Only successful responses
+    are cached; HTTP errors raise requests.HTTPError.
+    """
+    def fetch():
+        with stage("http_request"):
+            resp = get_session().get(url, params=params, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp.text
+    return get_cache().cached(source, (url, params or {}, headers or {}), fetch)
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call slot is free."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def _retry_delay(resp, attempt: int, backoff: float) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return backoff * 2 ** attempt * (1 + random.random() / 2)
+
+def get_with_retry(url: str, params=None, headers=None, timeout: float = 10.0,
+                   limiter: RateLimiter = None, retries: int = 5, backoff: float = 1.0):
+    """
+    GET `url` on the pooled session, waiting on `limiter` before each attempt.
+    429/5xx responses and connection errors are retried with exponential
+    backoff (honouring Retry-After); the final failure is raised.
+    """
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.wait()
+        resp = None
+        try:
+            with stage("http_request"):
+                resp = get_session().get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            reason = str(e)
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                resp.raise_for_status()
+                return resp
+            reason = f"HTTP {resp.status_code}"
+        delay = _retry_delay(resp, attempt, backoff)
+        logging.warning(f"{url}: {reason}; retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+        time.sleep(delay)
@@ -1,11 +1,31 @@
 #!/usr/bin/env python3
 """
 ingest_excel.py - Convert multi-sheet Excel to normalized CSVs.
+
+Sheets are streamed with openpyxl's read-only mode and written in chunks, one
+worker process per sheet, so memory stays flat for very large sheets. CSV
+cells are formatted as pandas' read_excel + to_csv would (see CsvSink), so both
+engines write the same CSV. Output can also be Parquet or Feather (requires
+pyarrow). Peak memory and rows/sec
+are logged per sheet. --engine pandas keeps the original whole-sheet path
+(needed for legacy .xls files).
 """
 
-import argparse, logging, sys, re
+import argparse, csv, datetime, logging, os, pickle, re, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
 from pathlib import Path
-import pandas as pd
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, peak_rss_mb, record, stage
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+CHUNK_ROWS = 50_000
+EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+# Strings pandas reads as missing by default (pandas' STR_NA_VALUES).
+NA_STRINGS = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+              "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+INT_RE = re.compile(r"[+-]?\d+")
 
 def setup_logging():
     logging.basicConfig(
@@ -18,24 +38,252 @@ def normalize(col):
     col = re.sub(r'\s+', '_', col)
     return re.sub(r'[^0-9a-z_]', '', col)
 
+def header_names(row):
+    """Header cells -> normalized names, labelling blanks and de-duplicating as pandas does."""
+    names, seen = [], {}
+    for i, cell in enumerate(row):
+        name = f"Unnamed: {i}" if cell is None else str(cell)
+        if name in seen:
+            seen[name] += 1; name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(normalize(name))
+    return names
+
+def _data_rows(rows, width):
+    """Pad/trim rows to the header width and drop trailing blank rows."""
+    blank = 0
+    for row in rows:
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        if all(v is None for v in row):
+            blank += 1; continue
+        for _ in range(blank):
+            yield (None,) * width
+        blank = 0
+        yield row
+
+def _cell(value):
+    """A cell as pandas' openpyxl reader sees it: integral floats as int, NA strings as None."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+def _number(text):
+    """int or float parsed from a numeric string, else None."""
+    if "_" in text:
+        return None
+    try:
+        return int(text) if INT_RE.fullmatch(text) else float(text)
+    except ValueError:
+        return None
+
+class ColumnKinds:
+    """Value kinds seen in one column, from which the dtype pandas would infer follows."""
+
+    def __init__(self):
+        self.kinds, self.missing, self.clock, self.fraction = set(), False, False, 0
+
+    def update(self, values):
+        for v in values:
+            if v is None:
+                self.missing = True
+            elif isinstance(v, bool):
+                self.kinds.add("bool")
+            elif isinstance(v, int):
+                self.kinds.add("int")
+            elif isinstance(v, float):
+                self.kinds.add("float")
+            elif isinstance(v, datetime.datetime):
+                self.kinds.add("datetime")
+                if v.microsecond:
+                    self.fraction = max(self.fraction, 3 if v.microsecond % 1000 == 0 else 6)
+                elif v.hour or v.minute or v.second:
+                    self.clock = True
+            elif isinstance(v, str) and (n := _number(v)) is not None:
+                self.kinds.add("int" if isinstance(n, int) else "float")
+            else:
+                self.kinds.add("other")
+
+    def formatter(self):
+        """Cell value -> CSV text, as DataFrame.to_csv writes the inferred dtype."""
+        kinds = self.kinds
+        if kinds == {"bool"} and not self.missing:
+            return str
+        if kinds <= {"bool", "int", "float"}:
+            if kinds and "float" not in kinds and not self.missing:
+                return lambda v: str(int(_number(v) if isinstance(v, str) else v))
+            return lambda v: "" if v is None else repr(float(_number(v) if isinstance(v, str) else v))
+        if kinds == {"datetime"}:
+            if self.fraction:
+                return lambda v: "" if v is None else v.strftime("%Y-%m-%d %H:%M:%S.%f")[:20 + self.fraction]
+            fmt = "%Y-%m-%d %H:%M:%S" if self.clock else "%Y-%m-%d"
+            return lambda v: "" if v is None else v.strftime(fmt)
+        return lambda v: "" if v is None else str(v)
+
+class CsvSink:
+    """
+    CSV writer matching pandas' read_excel + to_csv output. pandas infers one
+    dtype per column (an int column with blanks becomes float, a datetime
+    column without times is written as dates), so chunks are spooled to a
+    temporary file and formatted once every value has been seen.
+    """
+
+    def __init__(self, path, columns):
+        self.path, self.header = path, columns
+        self.columns = [ColumnKinds() for _ in columns]
+        self.spool = tempfile.TemporaryFile(dir=Path(path).parent)
+
+    def write(self, rows):
+        rows = [tuple(map(_cell, row)) for row in rows]
+        for column, values in zip(self.columns, zip(*rows)):
+            column.update(values)
+        pickle.dump(rows, self.spool, pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        formatters = [c.formatter() for c in self.columns]
+        self.spool.seek(0)
+        with open(self.path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh, lineterminator=os.linesep)
+            writer.writerow(self.header)
+            while True:
+                try:
+                    rows = pickle.load(self.spool)
+                except EOFError:
+                    break
+                writer.writerows([f(v) for f, v in zip(formatters, row)] for row in rows)
+        self.spool.close()
+
+class ArrowSink:
+    """Chunked Parquet/Feather writer; the first chunk fixes the schema."""
+
+    def __init__(self, path, columns, fmt):
+        import pyarrow as pa
+        self.pa, self.path, self.columns, self.fmt = pa, path, columns, fmt
+        self.schema = self.writer = None
+
+    def _schema(self, arrays):
+        pa, fields = self.pa, []
+        for name, arr in zip(self.columns, arrays):
+            t = arr.type
+            # Excel numbers are doubles; all-empty or mixed first chunks fall back to text.
+            if pa.types.is_integer(t): t = pa.float64()
+            elif pa.types.is_null(t): t = pa.string()
+            fields.append(pa.field(name, t))
+        return pa.schema(fields)
+
+    def write(self, rows):
+        pa = self.pa
+        cols = list(zip(*rows)) if rows else [[] for _ in self.columns]
+        if self.schema is None:
+            arrays = []
+            for values in cols:
+                try:
+                    arrays.append(pa.array(values))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    arrays.append(pa.array([None if v is None else str(v) for v in values]))
+            self.schema = self._schema(arrays)
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(str(self.path), self.schema)
+        arrays = []
+        for field, values in zip(self.schema, cols):
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(f"column {field.name!r} changes type mid-sheet ({e}); use --format csv") from e
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            self.write([])
+        self.writer.close()
+
+def convert_sheet(excel, sheet, out_path, fmt="csv", chunk_rows=CHUNK_ROWS):
+    """
+    Stream one sheet to out_path in chunks of chunk_rows.
+    Returns (rows written, seconds taken, CPU seconds, peak RSS in MB of this process).
+    """
+    from openpyxl import load_workbook
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    wb = load_workbook(excel, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = next(rows, ())
+        while header and header[-1] is None:
+            header = header[:-1]
+        columns = header_names(header)
+        sink = CsvSink(out_path, columns) if fmt == "csv" else ArrowSink(out_path, columns, fmt)
+        n = 0
+        try:
+            data = _data_rows(rows, len(columns))
+            while chunk := list(islice(data, chunk_rows)):
+                sink.write(chunk); n += len(chunk)
+        finally:
+            sink.close()
+    finally:
+        wb.close()
+    return n, time.perf_counter() - t0, time.process_time() - cpu0, peak_rss_mb()
+
+def convert_sheet_pandas(excel, sheet, out_path, fmt="csv"):
+    """Original whole-sheet path via pandas; returns the same stats as convert_sheet."""
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    df = pd.ExcelFile(excel).parse(sheet)
+    df.columns = [normalize(str(c)) for c in df.columns]
+    if fmt == "csv": df.to_csv(out_path, index=False)
+    elif fmt == "parquet": df.to_parquet(out_path, index=False)
+    else: df.to_feather(out_path)
+    return len(df), time.perf_counter() - t0, time.process_time() - cpu0, peak_rss_mb()
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("excel", type=Path)
     parser.add_argument("--outdir", type=Path, default=Path("excel_output"))
+    parser.add_argument("--format", choices=list(EXTENSIONS), default="csv", help="Output format (parquet/feather need pyarrow)")
+    parser.add_argument("--engine", choices=["stream","pandas"], default="stream", help="stream: openpyxl read-only; pandas: load whole sheets (.xls)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Sheets converted in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows buffered per write")
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging()
+    setup_logging(); instrument_from_args(args)
     if not args.excel.exists():
         logging.error("Excel not found")
         sys.exit(1)
     args.outdir.mkdir(exist_ok=True)
-    xls = pd.ExcelFile(args.excel)
-    for sheet in xls.sheet_names:
-        df = xls.parse(sheet)
-        df.columns = [normalize(c) for c in df.columns]
-        out_path = args.outdir / f"{args.excel.stem}_{normalize(sheet)}.csv"
-        df.to_csv(out_path, index=False)
-        logging.info(f"Saved {out_path}")
+    if args.engine == "stream" and args.excel.suffix.lower() == ".xls":
+        logging.info("Legacy .xls is not supported by openpyxl; using --engine pandas")
+        args.engine = "pandas"
+    with stage("workbook_open"):
+        sheets = pd.ExcelFile(args.excel).sheet_names
+    ext = EXTENSIONS[args.format]
+    failed = 0
+    # One process per sheet so each sheet's peak memory is measured on its own.
+    with stage("sheet_pool"), ProcessPoolExecutor(max_workers=min(args.workers, len(sheets)) or 1, max_tasks_per_child=1) as pool:
+        futures = {}
+        for sheet in sheets:
+            out_path = args.outdir / f"{args.excel.stem}_{normalize(sheet)}{ext}"
+            if args.engine == "stream":
+                future = pool.submit(convert_sheet, args.excel, sheet, out_path, args.format, args.chunk_rows)
+            else:
+                future = pool.submit(convert_sheet_pandas, args.excel, sheet, out_path, args.format)
+            futures[future] = out_path
+        for future in as_completed(futures):
+            out_path = futures[future]
+            try:
+                rows, seconds, cpu, peak = future.result()
+            except Exception as e:
+                failed += 1; logging.error(f"Failed to write {out_path}: {e}"); continue
+            record("sheet_convert", seconds, cpu, peak)
+            logging.info(f"Saved {out_path} ({rows} rows, {rows / seconds if seconds else 0:,.0f} rows/s, peak {peak:.0f} MB)")
+    if failed:
+        sys.exit(1)
 
 if __name__=="__main__":
     main()
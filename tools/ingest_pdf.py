@@ -1,11 +1,36 @@
 #!/usr/bin/env python3
 """
 ingest_pdf.py - Extract text from PDF files using PyMuPDF.
+
+Accepts PDF files, directories and glob patterns. A single PDF is written to
+--out; several inputs are written to --outdir as one .txt per document with a
+manifest.json of page count, character count and extraction time. Documents,
+and page ranges of very large documents, are spread across a process pool and
+text is streamed to disk page by page.
+
+With --incremental the manifest's content hashes decide what to redo: unchanged
+PDFs are skipped, new or modified ones are extracted, and outputs of inputs
+that no longer exist are removed. A change of PyMuPDF version or extraction
+settings invalidates every entry.
+
+Each manifest entry lists page_starts, the character offset of every page in
+its .txt, so the text can be split back into pages (see literature_index.py).
 """
 
-import argparse, logging, sys
+import argparse, glob, hashlib, json, logging, os, shutil, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import fitz  # PyMuPDF
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, peak_rss_mb, stage
+from instrumentation import record as record_stage  # `record` is a manifest entry here
+from lazy_imports import lazy_import
+
+fitz = lazy_import("fitz")  # PyMuPDF
+
+CHUNK_PAGES = 100  # documents longer than this are split across workers
+
+# Anything that changes the extracted text; bump "format" when extract_range changes.
+def extraction_settings():
+    return {"format": 2, "method": "page.get_text", "page_separator": "\n", "pymupdf": fitz.VersionBind}
 
 def setup_logging(log_path):
     logging.basicConfig(
@@ -18,20 +43,225 @@ def extract_text(pdf_path):
     doc = fitz.open(pdf_path)
     return "\n".join(page.get_text() for page in doc)
 
+def extract_range(pdf_path, start, stop, out_path):
+    """
+    Stream pages [start, stop) of a PDF to out_path, one page at a time.
+    Pages are separated by a newline, as in extract_text(), so concatenating
+    consecutive ranges reproduces the whole-document text.
+    Returns (characters written, seconds taken, CPU seconds, peak RSS in MB of
+    this process, character length of each page without its separator).
+    """
+    t0, cpu0 = time.perf_counter(), time.process_time(); chars = 0; lengths = []
+    with fitz.open(pdf_path) as doc, open(out_path, "w", encoding="utf-8") as out:
+        for i in range(start, stop):
+            page = doc[i].get_text()
+            text = ("\n" if i else "") + page
+            out.write(text); chars += len(text); lengths.append(len(page))
+    return chars, time.perf_counter() - t0, time.process_time() - cpu0, peak_rss_mb(), lengths
+
+def collect_pdfs(inputs):
+    """Expand files, directories (recursively) and glob patterns into (pdf, relative name) pairs."""
+    found = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            found += [(p, p.relative_to(path)) for p in sorted(path.rglob("*")) if p.suffix.lower() == ".pdf"]
+        elif path.exists():
+            found.append((path, Path(path.name)))
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                logging.warning(f"No PDFs match {item}")
+            found += [(Path(m), Path(Path(m).name)) for m in matches if m.lower().endswith(".pdf")]
+    seen, unique = set(), []
+    for pdf, rel in found:
+        if pdf.resolve() not in seen:
+            seen.add(pdf.resolve()); unique.append((pdf, rel))
+    return unique
+
+def plan_outputs(pdfs, outdir):
+    """Map each PDF to outdir/<relative name>.txt, suffixing duplicates."""
+    jobs, taken = [], set()
+    for pdf, rel in pdfs:
+        out = outdir / rel.with_suffix(".txt"); n = 1
+        while out in taken:
+            n += 1; out = outdir / rel.with_name(f"{rel.stem}_{n}.txt")
+        taken.add(out); jobs.append((pdf, out))
+    return jobs
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(path):
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def plan_incremental(jobs, previous):
+    """
+    Compare jobs against a previous manifest.
+    Returns (jobs to extract, still-valid records, records of deleted inputs).
+    A file whose size and mtime match its entry is trusted without hashing;
+    otherwise it is hashed and skipped if the content is unchanged. Entries for
+    PDFs not named in this run are kept while the PDF still exists on disk;
+    only those whose PDF is gone count as deleted.
+    """
+    old = {r["pdf"]: r for r in (previous or {}).get("documents", []) if "error" not in r}
+    valid = old
+    if old and previous.get("settings") != extraction_settings():
+        logging.info("Extraction settings or PyMuPDF version changed; re-extracting everything")
+        valid = {}
+    todo, kept = [], []
+    for pdf, out in jobs:
+        record = valid.get(str(pdf))
+        if record and record["out"] == str(out) and out.exists():
+            st = pdf.stat()
+            if (record.get("size"), record.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+                kept.append(record); continue
+            if record.get("sha256") == file_sha256(pdf):
+                kept.append(dict(record, size=st.st_size, mtime_ns=st.st_mtime_ns)); continue
+        todo.append((pdf, out))
+    current = {str(pdf) for pdf, _ in jobs}
+    outputs = {str(out) for _, out in jobs}
+    deleted = []
+    for pdf, r in old.items():
+        if pdf in current or r["out"] in outputs:
+            continue
+        if not Path(pdf).exists():
+            deleted.append(r)
+        elif pdf in valid:  # not named this time, but still there: keep its entry
+            kept.append(r)
+    return todo, kept, deleted
+
+def ingest(jobs, workers=None, chunk_pages=CHUNK_PAGES):
+    """
+    Extract every (pdf, out_path) job on a process pool.
+    Returns one manifest record per document, in job order.
+    """
+    records, tasks = [], []
+    for pdf, out in jobs:
+        record = {"pdf": str(pdf), "out": str(out), "pages": 0, "chars": 0, "seconds": 0.0}
+        records.append(record)
+        try:
+            with stage("pdf_open"):
+                st = pdf.stat()
+                record.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(pdf))
+                with fitz.open(pdf) as doc:
+                    record["pages"] = doc.page_count
+        except Exception as e:
+            record["error"] = str(e); logging.error(f"Cannot open {pdf}: {e}")
+            continue
+        out.parent.mkdir(parents=True, exist_ok=True)
+        ranges = [(s, min(s + chunk_pages, record["pages"])) for s in range(0, record["pages"], chunk_pages)] or [(0, 0)]
+        parts = [out] if len(ranges) == 1 else [out.with_name(f"{out.name}.part{i}") for i in range(len(ranges))]
+        record["_parts"] = parts
+        record["_lengths"] = {}
+        tasks += [(record, (str(pdf), s, e, str(p))) for (s, e), p in zip(ranges, parts)]
+
+    # Largest ranges first keeps the pool busy until the end.
+    tasks.sort(key=lambda t: t[1][2] - t[1][1], reverse=True)
+    pending = {id(r): len(r["_parts"]) for r in records if "_parts" in r}
+    with stage("extract_pool"), ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_range, *args): (record, args[1]) for record, args in tasks}
+        for future in as_completed(futures):
+            record, start = futures[future]
+            try:
+                chars, seconds, cpu, rss, lengths = future.result()
+                record["chars"] += chars; record["seconds"] += seconds
+                record["_lengths"][start] = lengths
+                record_stage("page_range_extract", seconds, cpu, rss)
+            except Exception as e:
+                record["error"] = str(e); logging.error(f"Extraction failed for {record['pdf']}: {e}")
+            pending[id(record)] -= 1
+            if not pending[id(record)]:
+                _finish(record)
+    for record in records:
+        record.pop("_parts", None); record.pop("_lengths", None)
+        record["seconds"] = round(record["seconds"], 3)
+    return records
+
+def _finish(record):
+    """Stitch split parts into the final output, record page offsets and log the document."""
+    parts = record["_parts"]
+    if "error" not in record:
+        lengths = [n for start in sorted(record["_lengths"]) for n in record["_lengths"][start]]
+        record["page_starts"] = [0]
+        for n in lengths[:-1]:
+            record["page_starts"].append(record["page_starts"][-1] + n + 1)  # +1 for the page separator
+    if len(parts) > 1 and "error" not in record:
+        with open(record["out"], "w", encoding="utf-8") as out:
+            for part in parts:
+                with open(part, encoding="utf-8") as src:
+                    shutil.copyfileobj(src, out)
+    if len(parts) > 1:
+        for part in parts:
+            Path(part).unlink(missing_ok=True)
+    if "error" not in record:
+        logging.info(f"{record['pdf']}: {record['pages']} pages, {record['chars']} chars -> {record['out']}")
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("pdf", type=Path)
-    parser.add_argument("--out", type=Path, default=Path("extracted_text.txt"))
+    parser.add_argument("pdf", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--out", type=Path, default=Path("extracted_text.txt"), help="Output file for a single PDF")
+    parser.add_argument("--outdir", type=Path, help="Output directory for batch mode (default pdf_output)")
+    parser.add_argument("--manifest", type=Path, help="Manifest path (default <outdir>/manifest.json in batch mode)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--chunk-pages", type=int, default=CHUNK_PAGES, help="Split documents longer than this across workers")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip PDFs unchanged since the manifest was written; remove outputs of PDFs deleted from disk")
     parser.add_argument("--log", type=Path, default=Path("ingest_pdf.log"))
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging(args.log)
-    if not args.pdf.exists():
+    setup_logging(args.log); instrument_from_args(args)
+    pdfs = collect_pdfs(args.pdf)
+    if not pdfs:
         logging.error("PDF not found")
         sys.exit(1)
-    text = extract_text(args.pdf)
-    args.out.write_text(text, encoding="utf-8")
-    logging.info(f"Text extracted to {args.out}")
+    batch = args.outdir is not None or len(pdfs) > 1 or Path(args.pdf[0]).is_dir()
+    if batch:
+        outdir = args.outdir or Path("pdf_output")
+        jobs = plan_outputs(pdfs, outdir)
+        manifest = args.manifest or outdir / "manifest.json"
+    else:
+        jobs = [(pdfs[0][0], args.out)]
+        manifest = args.manifest
+    if args.incremental and not manifest:
+        logging.error("--incremental needs a manifest; pass --manifest or use batch mode")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    kept = []
+    if args.incremental:
+        jobs, kept, deleted = plan_incremental(jobs, load_manifest(manifest))
+        for record in deleted:
+            Path(record["out"]).unlink(missing_ok=True)
+            logging.info(f"Removed {record['out']} ({record['pdf']} no longer exists)")
+        logging.info(f"Incremental: {len(jobs)} to extract, {len(kept)} unchanged, {len(deleted)} removed")
+    records = ingest(jobs, workers=args.workers, chunk_pages=args.chunk_pages)
+    wall = time.perf_counter() - t0
+    pages = sum(r["pages"] for r in records if "error" not in r)
+    failed = sum("error" in r for r in records)
+    if manifest:
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        documents = sorted(kept + records, key=lambda r: r["pdf"])
+        manifest.write_text(json.dumps({"settings": extraction_settings(), "documents": documents, "pages": pages,
+                                        "seconds": round(wall, 3),
+                                        "pages_per_sec": round(pages / wall, 1) if wall else None}, indent=2))
+        logging.info(f"Manifest written to {manifest}")
+    if batch:
+        logging.info(f"Extracted {len(records) - failed}/{len(records)} documents to {outdir}")
+    else:
+        logging.info(f"Text extracted to {args.out}")
+    logging.info(f"{pages} pages in {wall:.2f}s ({pages / wall if wall else 0:.1f} pages/sec)")
+    if failed:
+        sys.exit(1)
 
 if __name__=="__main__":
     main()
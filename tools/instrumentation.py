@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+instrumentation.py - Per-stage time and memory metrics shared by all tools.
+
+Tools mark their phases with stage():
+
+    with stage("csv_load"):
+        df = load_dataset(...)
+
+and take the flags from add_instrumentation_arguments():
+
+    --metrics-out PATH   write the run's metrics as JSON
+    --profile PATH       write a cProfile dump of the run (python -m pstats PATH)
+    --trace-memory       also record each stage's peak Python heap with
+                         tracemalloc (slows allocation-heavy code)
+
+Without these flags stage() does nothing. Stages may nest and repeat. They are
+aggregated by name: number of calls, total and longest wall time, process CPU
+time, and peak memory. Work done in worker processes is counted in the
+enclosing stage's wall time and in the run's children_cpu_s; timings a worker
+measures itself can be added with record(). Every tool
+writes the same schema (version 1):
+
+    {"schema": 1, "tool": "analyze_advanced", "argv": [...], "started": "...",
+     "exit_code": 0, "wall_s": 4.1, "cpu_s": 3.9, "children_cpu_s": 0.0,
+     "peak_rss_mb": 312.5, "peak_traced_mb": null,
+     "stages": {"csv_load": {"count": 1, "wall_s": 0.8, "max_wall_s": 0.8,
+                             "cpu_s": 0.7, "peak_rss_mb": 180.2, "peak_traced_mb": null}, ...}}
+
+peak_rss_mb is the process's resident-set high-water mark when the stage
+ended. So the first stage whose value jumps is the one that grew the process.
+Libraries are imported lazily, so the first stage to use one (e.g. the first
+model fit and statsmodels) also includes its import time.
+
+    python3 tools/instrumentation.py report metrics/*.json --out perf_report.json
+
+combines several runs (e.g. every stage of a pipeline) into one table.
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCHEMA = 1
+MB = 1024 * 1024
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def peak_rss_mb():
+    """Resident-set high-water mark of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (MB if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB elsewhere
+
+class Session:
+    """Metrics of one tool run; stages are aggregated by name."""
+
+    def __init__(self, tool, argv, trace_memory=False, profile_path=None):
+        self.tool, self.argv = tool, list(argv)
+        self.stages = {}
+        self.trace_memory = trace_memory
+        self.profile_path = Path(profile_path) if profile_path else None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiler = None
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._t0, self._cpu0, self._times0 = time.perf_counter(), time.process_time(), os.times()
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile_path:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _traced_peak(self):
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1]
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._local.__dict__.setdefault("stack", [])
+        frame = {"peak": 0}
+        if self.trace_memory:
+            import tracemalloc
+            if stack:  # the parent's peak so far, before the child resets the counter
+                stack[-1]["peak"] = max(stack[-1]["peak"], self._traced_peak())
+            tracemalloc.reset_peak()
+        stack.append(frame)
+        t0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+            stack.pop()
+            traced = None
+            if self.trace_memory:
+                traced = max(frame["peak"], self._traced_peak())
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], traced)
+            self._record(name, wall, cpu, traced)
+
+    def _record(self, name, wall, cpu, traced, rss=None):
+        rss = rss if rss is not None else peak_rss_mb()
+        with self._lock:
+            s = self.stages.setdefault(name, {"count": 0, "wall_s": 0.0, "max_wall_s": 0.0, "cpu_s": 0.0,
+                                              "peak_rss_mb": None, "peak_traced_mb": None})
+            s["count"] += 1
+            s["wall_s"] += wall; s["max_wall_s"] = max(s["max_wall_s"], wall); s["cpu_s"] += cpu
+            if rss is not None:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0, rss)
+            if traced is not None:
+                s["peak_traced_mb"] = max(s["peak_traced_mb"] or 0, round(traced / MB, 1))
+
+    def finish(self, exit_code=0):
+        """Stop profiling and return the metrics dict."""
+        if self._profiler:
+            self._profiler.disable()
+            self.profile_path.parent.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(self.profile_path)
+            logging.info(f"Profile written to {self.profile_path}")
+        traced = None
+        if self.trace_memory:
+            import tracemalloc
+            traced = round(self._traced_peak() / MB, 1)
+            tracemalloc.stop()
+        times = os.times()
+        children = (times.children_user - self._times0.children_user) + (times.children_system - self._times0.children_system)
+        stages = {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in s.items()}
+                  for name, s in self.stages.items()}
+        return {"schema": SCHEMA, "tool": self.tool, "argv": self.argv, "started": self.started,
+                "exit_code": exit_code, "wall_s": round(time.perf_counter() - self._t0, 4),
+                "cpu_s": round(time.process_time() - self._cpu0, 4), "children_cpu_s": round(children, 4),
+                "peak_rss_mb": peak_rss_mb(), "peak_traced_mb": traced, "stages": stages}
+
+_session = None
+_metrics_out = None
+
+@contextmanager
+def _noop():
+    yield
+
+def stage(name):
+    """Context manager timing the enclosed block as stage `name` of the current run (no-op when not recording)."""
+    session = _session
+    return session.stage(name) if session is not None else _noop()
+
+def record(name, wall_s, cpu_s=0.0, peak_rss=None):
+    """
+    Add one call of stage `name` measured elsewhere, e.g. inside a worker
+    process; peak_rss is then that worker's high-water mark. No-op when not
+    recording.
+    """
+    session = _session
+    if session is not None:
+        session._record(name, wall_s, cpu_s, None, peak_rss)
+
+def start(tool, argv, metrics_out=None, profile=None, trace_memory=False):
+    """Begin recording a run; metrics go to metrics_out when instrumented main() returns."""
+    global _session, _metrics_out
+    _session = Session(tool, argv, trace_memory=trace_memory, profile_path=profile)
+    _metrics_out = Path(metrics_out) if metrics_out else None
+    return _session
+
+def finish(exit_code=0):
+    """Stop recording, write the metrics file if requested, and return the metrics (None if not recording)."""
+    global _session, _metrics_out
+    if _session is None:
+        return None
+    metrics = _session.finish(exit_code)
+    if _metrics_out:
+        _metrics_out.parent.mkdir(parents=True, exist_ok=True)
+        _metrics_out.write_text(json.dumps(metrics, indent=2))
+        logging.info(f"Metrics written to {_metrics_out}")
+    _session = _metrics_out = None
+    return metrics
+
+def add_instrumentation_arguments(parser):
+    """Add the shared --metrics-out/--profile/--trace-memory flags to a tool's parser."""
+    parser.add_argument("--metrics-out", type=Path, help="Write per-stage time and memory metrics as JSON")
+    parser.add_argument("--profile", type=Path, help="Write a cProfile dump of the run to this file")
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak Python heap per stage (slower)")
+
+def instrument_from_args(args):
+    """Start recording if any add_instrumentation_arguments() flag was given."""
+    if args.metrics_out or args.profile or args.trace_memory:
+        start(Path(sys.argv[0]).stem, sys.argv[1:], args.metrics_out, args.profile, args.trace_memory)
+
+def instrumented(main):
+    """Decorate a tool's main() so a run started by instrument_from_args() is finished however main exits."""
+    @functools.wraps(main)
+    def wrapper(*a, **kw):
+        code = 1
+        try:
+            result = main(*a, **kw)
+            code = 0
+            return result
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            raise
+        finally:
+            finish(code)
+    return wrapper
+
+def aggregate(runs):
+    """Combine metrics dicts into per-tool and per-(tool, stage) totals."""
+    tools, stages = {}, {}
+    for run in runs:
+        if run.get("schema") != SCHEMA:
+            raise ValueError(f"Unsupported metrics schema {run.get('schema')!r}")
+        t = tools.setdefault(run["tool"], {"runs": 0, "failed": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                           "children_cpu_s": 0.0, "peak_rss_mb": None})
+        t["runs"] += 1; t["failed"] += run["exit_code"] != 0
+        for k in ("wall_s", "cpu_s", "children_cpu_s"):
+            t[k] += run[k]
+        if run["peak_rss_mb"] is not None:
+            t["peak_rss_mb"] = max(t["peak_rss_mb"] or 0, run["peak_rss_mb"])
+        for name, s in run["stages"].items():
+            a = stages.setdefault(f"{run['tool']}:{name}", {"count": 0, "wall_s": 0.0, "max_wall_s": 0.0, "cpu_s": 0.0,
+                                                           "peak_rss_mb": None, "peak_traced_mb": None})
+            a["count"] += s["count"]; a["wall_s"] += s["wall_s"]; a["cpu_s"] += s["cpu_s"]
+            a["max_wall_s"] = max(a["max_wall_s"], s["max_wall_s"])
+            for k in ("peak_rss_mb", "peak_traced_mb"):
+                if s.get(k) is not None:
+                    a[k] = max(a[k] or 0, s[k])
+    rounded = lambda d: {k: round(v, 4) if isinstance(v, float) else v for k, v in d.items()}
+    return {"schema": SCHEMA, "runs": len(runs), "tools": {k: rounded(v) for k, v in tools.items()},
+            "stages": {k: rounded(v) for k, v in stages.items()}}
+
+def print_report(report):
+    print(f"{'tool':<24}{'runs':>6}{'wall s':>10}{'cpu s':>10}{'child cpu':>11}{'peak MB':>10}")
+    for name, t in sorted(report["tools"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        print(f"{name:<24}{t['runs']:>6}{t['wall_s']:>10.2f}{t['cpu_s']:>10.2f}{t['children_cpu_s']:>11.2f}"
+              f"{t['peak_rss_mb'] or 0:>10.1f}")
+    print(f"\n{'stage':<48}{'count':>7}{'wall s':>10}{'max s':>9}{'cpu s':>9}{'peak MB':>9}")
+    for name, s in sorted(report["stages"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        print(f"{name:<48}{s['count']:>7}{s['wall_s']:>10.2f}{s['max_wall_s']:>9.2f}{s['cpu_s']:>9.2f}"
+              f"{s['peak_rss_mb'] or 0:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine tool metrics files into one performance report")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("report", help="Aggregate --metrics-out files")
+    p.add_argument("metrics", nargs="+", type=Path, help="Metrics JSON files or directories of them")
+    p.add_argument("--out", type=Path, help="Write the combined report as JSON")
+    args = parser.parse_args()
+
+    setup_logging()
+    runs = []
+    for path in args.metrics:
+        if path.is_dir():
+            # Skip combined reports written into the directory (run_pipeline's perf_report.json, earlier --out files)
+            runs += [run for run in (json.loads(f.read_text()) for f in sorted(path.glob("*.json"))) if "tool" in run]
+        else:
+            runs.append(json.loads(path.read_text()))
+    report = aggregate(runs)
+    print_report(report)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        logging.info(f"Report written to {args.out}")
+
+if __name__ == "__main__":
+    main()
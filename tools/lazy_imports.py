@@ -0,0 +1,45 @@
+"""
+lazy_imports.py - Deferred imports for the tools' heavy dependencies.
+
+    pd = lazy_import("pandas")
+
+binds a stand-in module that imports pandas the first time one of its
+attributes is used. Module-level names therefore cost nothing until the code
+path that needs them runs: `tool.py --help` or a failed argument check no
+longer waits seconds for pandas, statsmodels or matplotlib to load. The real
+import goes through importlib.import_module, so sys.modules, pickling and
+later plain imports behave as usual.
+"""
+
+import importlib
+import types
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the named module on first attribute access."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):  # e.g. Entrez.email = ...
+        setattr(self._load(), attr, value)
+
+    def __reduce__(self):  # cloudpickle (joblib) ships module globals of __main__ functions
+        return lazy_import, (self.__name__,)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+def lazy_import(name):
+    """Return a LazyModule for `name` (dotted names are fine, e.g. "sklearn.metrics")."""
+    return LazyModule(name)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+literature_index.py - Local full-text index of extracted PDFs and literature records.
+
+A SQLite FTS5 index (BM25 ranking, Porter stemming) over two kinds of document:
+
+    page     one page of a PDF extracted by ingest_pdf.py, located through the
+             page_starts offsets in its manifest.json
+    record   one paper from search_literature.py results (literature_results.json
+             or the --harvest .jsonl). Records from different sources are merged
+             into one document when they share a DOI or PMID. The document keeps
+             each source's fields and the fullest text (PubMed's when present)
+
+Adding is incremental. A PDF whose content hash is unchanged since it was last
+indexed is skipped, pages of PDFs dropped from a manifest are removed, and a
+results file is only reread when its size or mtime changes.
+
+    tools/literature_index.py add pdf_output/manifest.json literature_output/
+    tools/literature_index.py query "papillary carcinoma BRAF" --limit 10
+    tools/literature_index.py query '"lymph node" NEAR(metastasis, 5)' --raw --kind page
+    tools/literature_index.py stats
+
+search_literature.py takes PubMed abstracts the index already holds instead of
+fetching them, adds its results to the index, and with --index-only answers
+from the index without any network access.
+"""
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from response_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_INDEX = DEFAULT_CACHE_DIR / "literature_index.sqlite"
+TITLE_WEIGHT = 4.0  # BM25 weight of a title match relative to the body
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,              -- 'page' or 'record'
+    doi TEXT UNIQUE, pmid TEXT UNIQUE,
+    path TEXT, page INTEGER,         -- pages: extracted .txt and 1-based page number
+    pdf TEXT,
+    title TEXT NOT NULL DEFAULT '', body TEXT NOT NULL DEFAULT '',
+    body_source TEXT,                -- records: source whose text is the body
+    year INTEGER,
+    sources TEXT,                    -- records: {source: record without its text}
+    UNIQUE (path, page)
+);
+CREATE TABLE IF NOT EXISTS source_ids (
+    source TEXT NOT NULL, source_id TEXT NOT NULL, rowid INTEGER NOT NULL,
+    PRIMARY KEY (source, source_id)
+);
+CREATE INDEX IF NOT EXISTS source_ids_rowid ON source_ids(rowid);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, signature TEXT NOT NULL, origin TEXT, indexed REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    title, body, content='docs', content_rowid='rowid', tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, title, body) VALUES (new.rowid, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, body) VALUES ('delete', old.rowid, old.title, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE OF title, body ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, body) VALUES ('delete', old.rowid, old.title, old.body);
+    INSERT INTO docs_fts(rowid, title, body) VALUES (new.rowid, new.title, new.body);
+END;
+"""
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def normalize_doi(doi):
+    doi = (doi or "").strip().lower()
+    doi = re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi)
+    return doi or None
+
+def record_ids(record):
+    """(doi, pmid) of a search_literature record, from its fields or its PubMed text."""
+    source, text = record.get("source"), record.get("text") or ""
+    doi = record.get("doi") or (record.get("id") if source == "CrossRef" else None)
+    pmid = record.get("pmid") or (record.get("id") if source == "PubMed" else None)
+    if not doi and source == "PubMed":
+        m = re.search(r"^DOI: (\S+)", text, re.M)
+        doi = m and m.group(1)
+    return normalize_doi(doi), str(pmid) if pmid else None
+
+def _pubmed_title(text):
+    """Title paragraph of a PubMed abstract-format record (citation, title, authors, ...)."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text.strip())]
+    return " ".join(paragraphs[1].split()) if len(paragraphs) > 1 else ""
+
+def _locate(out, outdir):
+    """
+    A manifest's output path, which is relative to where ingest_pdf ran; when
+    that is not the current directory, find it under the manifest's directory.
+    """
+    if out.is_absolute() or out.exists():
+        return out
+    for k in range(1, len(out.parts)):
+        candidate = outdir.joinpath(*out.parts[k:])
+        if candidate.exists():
+            return candidate
+    return out
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching documents containing every word."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"' for w in words)
+
+class LiteratureIndex:
+    """SQLite FTS5 index of PDF pages and deduplicated literature records."""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _file_unchanged(self, path, signature):
+        row = self._conn.execute("SELECT signature FROM files WHERE path = ?", (str(path),)).fetchone()
+        return row is not None and row[0] == signature
+
+    def _mark_file(self, path, signature, origin=None):
+        self._conn.execute("INSERT OR REPLACE INTO files (path, signature, origin, indexed) VALUES (?, ?, ?, ?)",
+                           (str(path), signature, origin, time.time()))
+
+    # -- PDF pages ---------------------------------------------------------
+
+    def add_manifest(self, manifest_path):
+        """Index the pages of every document in an ingest_pdf manifest; returns (pages added, pages removed)."""
+        manifest_path = Path(manifest_path)
+        manifest = json.loads(manifest_path.read_text())
+        origin = str(manifest_path.resolve())
+        added = removed = 0
+        current = set()
+        with self._lock, self._transaction():
+            for doc in manifest.get("documents", []):
+                if "error" in doc:
+                    continue
+                out = str(_locate(Path(doc["out"]), manifest_path.parent).resolve())
+                current.add(out)
+                signature = f"{doc.get('sha256')}:{manifest.get('settings', {}).get('format')}"
+                if self._file_unchanged(out, signature):
+                    continue
+                removed += self._delete_pages(out)
+                added += self._add_pages(out, doc)
+                self._mark_file(out, signature, origin)
+            for (path,) in self._conn.execute("SELECT path FROM files WHERE origin = ?", (origin,)).fetchall():
+                if path not in current:
+                    removed += self._delete_pages(path)
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        logging.info(f"{manifest_path}: {added} pages indexed, {removed} removed")
+        return added, removed
+
+    def _add_pages(self, out, doc):
+        try:
+            text = Path(out).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            logging.warning(f"{out} is missing; run ingest_pdf again")
+            return 0
+        starts = doc.get("page_starts")
+        if starts is None:
+            logging.warning(f"{doc['pdf']}: manifest has no page offsets (older ingest_pdf); indexing as one page")
+            starts = [0]
+        bounds = list(zip(starts, starts[1:] + [len(text) + 1]))
+        title = Path(doc["pdf"]).stem
+        self._conn.executemany(
+            "INSERT INTO docs (kind, path, page, pdf, title, body) VALUES ('page', ?, ?, ?, ?, ?)",
+            [(out, i, doc["pdf"], title, text[a:b - 1]) for i, (a, b) in enumerate(bounds, 1)])
+        return len(bounds)
+
+    def _delete_pages(self, out):
+        return self._conn.execute("DELETE FROM docs WHERE kind = 'page' AND path = ?", (out,)).rowcount
+
+    # -- literature records ------------------------------------------------
+
+    def add_results(self, path, force=False):
+        """Index a literature_results.json/.jsonl file unless unchanged since last time; returns records read."""
+        path = Path(path)
+        st = path.stat()
+        signature = f"{st.st_size}:{st.st_mtime_ns}"
+        key = str(path.resolve())
+        if not force and self._file_unchanged(key, signature):
+            logging.info(f"{path}: unchanged, skipped")
+            return 0
+        if path.suffix == ".jsonl":
+            with path.open(encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.loads(path.read_text(encoding="utf-8"))
+        merged = self.add_records(records)
+        with self._lock:
+            self._mark_file(key, signature)
+        logging.info(f"{path}: {len(records)} records, {merged} merged into existing documents")
+        return len(records)
+
+    def add_records(self, records):
+        """Insert or merge search_literature records; returns how many matched an existing document."""
+        merged = 0
+        with self._lock, self._transaction():
+            for record in records:
+                merged += self._add_record(record)
+        return merged
+
+    def _find(self, source, source_id, doi, pmid):
+        rows = set()
+        if source_id:
+            row = self._conn.execute("SELECT rowid FROM source_ids WHERE source = ? AND source_id = ?",
+                                     (source, source_id)).fetchone()
+            rows.update(row or ())
+        for column, value in (("doi", doi), ("pmid", pmid)):
+            if value:
+                row = self._conn.execute(f"SELECT rowid FROM docs WHERE {column} = ?", (value,)).fetchone()
+                rows.update(row or ())
+        return sorted(rows)
+
+    def _add_record(self, record):
+        source = record.get("source") or "unknown"
+        source_id = str(record["id"]) if record.get("id") is not None else None
+        doi, pmid = record_ids(record)
+        text = record.get("text") or ""
+        title = record.get("title") or (_pubmed_title(text) if source == "PubMed" else "")
+        year = record.get("year") or record.get("published")
+        rows = self._find(source, source_id, doi, pmid)
+        if not rows:
+            cur = self._conn.execute(
+                "INSERT INTO docs (kind, doi, pmid, title, body, body_source, year, sources) VALUES ('record', ?, ?, ?, ?, ?, ?, ?)",
+                (doi, pmid, title or "", text, source if text else None, year,
+                 json.dumps({source: {k: v for k, v in record.items() if k != "text"}})))
+            rowid = cur.lastrowid
+        else:
+            rowid = rows[0]
+            for other in rows[1:]:  # this record links documents indexed separately
+                self._merge_into(rowid, other)
+            self._update(rowid, source, record, doi, pmid, title, text, year)
+        if source_id:
+            self._conn.execute("INSERT OR REPLACE INTO source_ids (source, source_id, rowid) VALUES (?, ?, ?)",
+                               (source, source_id, rowid))
+        return bool(rows)
+
+    def _update(self, rowid, source, record, doi, pmid, title, text, year):
+        old = self._conn.execute("SELECT doi, pmid, title, body, body_source, year, sources FROM docs WHERE rowid = ?",
+                                 (rowid,)).fetchone()
+        sources = json.loads(old[6] or "{}")
+        sources[source] = {k: v for k, v in record.items() if k != "text"}
+        body, body_source = old[3], old[4]
+        # PubMed's abstract-format text is the fullest; otherwise keep the longest
+        if text and (source == "PubMed" or (body_source != "PubMed" and len(text) > len(body))):
+            body, body_source = text, source
+        new = (old[0] or doi, old[1] or pmid, old[2] or title or "", body, body_source, old[5] or year, json.dumps(sources))
+        if new == tuple(old):
+            return
+        if new[2:4] == tuple(old[2:4]):  # title and body unchanged: leave the FTS row alone
+            self._conn.execute("UPDATE docs SET doi = ?, pmid = ?, body_source = ?, year = ?, sources = ? WHERE rowid = ?",
+                               (*new[:2], *new[4:], rowid))
+        else:
+            self._conn.execute("UPDATE docs SET doi = ?, pmid = ?, title = ?, body = ?, body_source = ?, year = ?,"
+                               " sources = ? WHERE rowid = ?", (*new, rowid))
+
+    def _merge_into(self, rowid, other):
+        row = self._conn.execute("SELECT doi, pmid, title, body, body_source, year, sources FROM docs WHERE rowid = ?",
+                                 (other,)).fetchone()
+        self._conn.execute("DELETE FROM docs WHERE rowid = ?", (other,))
+        self._conn.execute("UPDATE source_ids SET rowid = ? WHERE rowid = ?", (rowid, other))
+        for source, fields in json.loads(row[6] or "{}").items():
+            text = row[3] if source == row[4] else ""
+            self._update(rowid, source, fields, row[0], row[1], row[2], text, row[5])
+
+    def pubmed_texts(self, pmids):
+        """{pmid: PubMed abstract text} for the PMIDs whose PubMed record is indexed."""
+        found = {}
+        pmids = [str(p) for p in pmids]
+        with self._lock:
+            for start in range(0, len(pmids), 500):
+                batch = pmids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT pmid, body FROM docs WHERE body_source = 'PubMed' AND pmid IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+                found.update(rows)
+        return found
+
+    # -- queries -----------------------------------------------------------
+
+    def query(self, text, limit=10, kind=None, raw=False):
+        """Best matches for text, as dicts ordered by BM25 score (lower is better)."""
+        match = text if raw else fts_query(text)
+        if not match:
+            return []
+        sql = ("SELECT d.rowid, d.kind, d.doi, d.pmid, d.path, d.page, d.pdf, d.title, d.year, d.sources,"
+               " snippet(docs_fts, 1, '[', ']', '...', 12), bm25(docs_fts, ?, 1.0) AS score"
+               " FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid WHERE docs_fts MATCH ?")
+        params = [TITLE_WEIGHT, match]
+        if kind:
+            sql += " AND d.kind = ?"; params.append(kind)
+        sql += " ORDER BY score LIMIT ?"; params.append(limit)
+        names = ("rowid", "kind", "doi", "pmid", "path", "page", "pdf", "title", "year", "sources", "snippet", "score")
+        hits = []
+        for row in self._conn.execute(sql, params):
+            hit = {k: v for k, v in zip(names, row) if v is not None}
+            if "sources" in hit:
+                hit["sources"] = sorted(json.loads(hit["sources"]))
+            hits.append(hit)
+        return hits
+
+    def records(self, text, limit=10):
+        """Matching records as search_literature records, one per source that contributed to each document."""
+        out = []
+        for hit in self.query(text, limit, kind="record"):
+            doc = self._conn.execute("SELECT body, body_source, sources FROM docs WHERE rowid = ?", (hit["rowid"],)).fetchone()
+            for source, fields in json.loads(doc[2]).items():
+                record = dict(fields)
+                if source == doc[1]:
+                    record["text"] = doc[0]
+                out.append(record)
+        return out
+
+    def stats(self):
+        kinds = dict(self._conn.execute("SELECT kind, COUNT(*) FROM docs GROUP BY kind").fetchall())
+        files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"pages": kinds.get("page", 0), "records": kinds.get("record", 0), "files": files,
+                "bytes": self.path.stat().st_size}
+
+    def optimize(self):
+        """Merge the FTS5 index segments, which speeds up later queries."""
+        self._conn.execute("INSERT INTO docs_fts(docs_fts) VALUES ('optimize')")
+
+def _first_char(path):
+    with path.open(encoding="utf-8") as f:
+        return f.read(64).lstrip()[:1]
+
+def expand_inputs(paths):
+    """Yield (kind, path) for manifests and results files given directly or found in directories."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for p in sorted(path.rglob("*")):
+                if p.name == "manifest.json":
+                    yield "manifest", p
+                elif p.name.startswith("literature_results") and p.suffix in (".json", ".jsonl"):
+                    yield "results", p
+        elif path.name == "manifest.json" or (path.suffix == ".json" and _first_char(path) == "{"):
+            yield "manifest", path  # results files are JSON lists
+        else:
+            yield "results", path
+
+def print_hits(hits, elapsed):
+    for n, hit in enumerate(hits, 1):
+        if hit["kind"] == "page":
+            where = f"{hit['pdf']} p.{hit['page']}"
+        else:
+            ids = ", ".join(f"{k.upper()} {hit[k]}" for k in ("doi", "pmid") if k in hit)
+            where = f"{hit.get('title') or '(untitled)'} [{ids or ', '.join(hit['sources'])}]"
+        print(f"{n:>3}. {hit['score']:>9.3g}  {where}\n        {' '.join(hit.get('snippet', '').split())}")
+    print(f"{len(hits)} results in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+@instrumented
+def main():
+    parser = argparse.ArgumentParser(description="Full-text index of extracted PDF pages and literature records")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX, help="Index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("add", help="Index ingest_pdf manifests and search_literature results (incremental)")
+    p.add_argument("paths", nargs="+", help="manifest.json, literature_results.json(l), or directories containing them")
+    p.add_argument("--force", action="store_true", help="Reread results files even if unchanged")
+    p = sub.add_parser("query", help="Ranked full-text search")
+    p.add_argument("text")
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--kind", choices=["page", "record"], help="Only PDF pages or only literature records")
+    p.add_argument("--raw", action="store_true", help="Pass text as FTS5 query syntax (phrases, OR, NOT, NEAR, prefix*)")
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    sub.add_parser("stats", help="Document counts and index size")
+    sub.add_parser("optimize", help="Merge index segments after large additions")
+    for p in sub.choices.values():
+        add_instrumentation_arguments(p)
+    args = parser.parse_args()
+
+    setup_logging(); instrument_from_args(args)
+    index = LiteratureIndex(args.index)
+    try:
+        if args.command == "add":
+            with stage("index_add"):
+                for kind, path in expand_inputs(args.paths):
+                    if kind == "manifest":
+                        index.add_manifest(path)
+                    else:
+                        index.add_results(path, force=args.force)
+            logging.info(f"Index {args.index}: {index.stats()}")
+        elif args.command == "query":
+            t0 = time.perf_counter()
+            with stage("index_query"):
+                try:
+                    hits = index.query(args.text, args.limit, args.kind, args.raw)
+                except sqlite3.OperationalError as e:
+                    logging.error(f"Invalid query: {e}"); sys.exit(2)
+            elapsed = time.perf_counter() - t0
+            if args.json:
+                print(json.dumps(hits, indent=2))
+            else:
+                print_hits(hits, elapsed)
+        elif args.command == "optimize":
+            with stage("index_optimize"):
+                index.optimize()
+        else:
+            print(json.dumps(index.stats(), indent=2))
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+llm_client.py - Shared chat-completion client with a persistent response cache.
+
+write_paper.py, write_code.py and add_citations.py send their chat requests
+through complete(). Responses are stored in SQLite (llm.sqlite in the response
+cache directory) keyed by a hash of the backend, model, messages and sampling
+parameters. So rerunning an unchanged pipeline makes no API calls. Entries
+never expire; the file is capped in size with least-recently-used eviction.
+Every call, cached or not, appends one JSON line with latency and token
+counts to the call log.
+
+Backends (--llm-backend):
+    openai   openai.ChatCompletion.create, as the tools have always used
+    http     POST to an OpenAI-compatible <base-url>/chat/completions, e.g. a
+             local stub server (benchmarks/stub_server.py) or a proxy
+
+Further backends can be added with register_backend().
+
+count_tokens()/truncate_tokens() estimate prompt sizes locally: with tiktoken
+installed they use the model's tokenizer, otherwise a regex pre-tokenizer that
+charges one token per four characters of each word (within ~15% on English).
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from instrumentation import stage
+from response_cache import DEFAULT_CACHE_DIR, NullCache, ResponseCache
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+SOURCE = "llm"
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "gpt-4")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text, model=None) -> int:
+    """Estimated number of tokens in `text` for `model`."""
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(m.group()) / 4) for m in _WORD.finditer(text))
+
+def truncate_tokens(text, budget, model=None) -> str:
+    """The longest prefix of `text` within `budget` tokens."""
+    enc = _encoding(model)
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        return text if len(ids) <= budget else enc.decode(ids[:budget])
+    used = 0
+    for m in _WORD.finditer(text):
+        used += math.ceil(len(m.group()) / 4)
+        if used > budget:
+            return text[:m.start()].rstrip()
+    return text
+
+class LLMError(RuntimeError):
+    """A backend could not produce a completion (missing key, HTTP error, ...)."""
+
+def _openai_backend(model, messages, base_url=None, **params):
+    import openai
+    openai.api_key = openai.api_key or os.getenv("OPENAI_API_KEY")
+    if not openai.api_key:
+        raise LLMError("OPENAI_API_KEY not set")
+    resp = openai.ChatCompletion.create(model=model, messages=messages, **params)
+    usage = getattr(resp, "usage", None) or {}
+    return {"content": resp.choices[0].message.content,
+            "prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+
+def _http_backend(model, messages, base_url=None, **params):
+    from http_session import get_session
+    import requests
+    key = os.getenv("OPENAI_API_KEY")
+    headers = {"Authorization": f"Bearer {key}"} if key else {}
+    url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/") + "/chat/completions"
+    try:
+        with stage("http_request"):
+            resp = get_session().post(url, json={"model": model, "messages": messages, **params}, headers=headers, timeout=600)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        raise LLMError(f"{url}: {e}") from e
+    data = resp.json()
+    usage = data.get("usage") or {}
+    return {"content": data["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+
+BACKENDS = {"openai": _openai_backend, "http": _http_backend}
+
+def register_backend(name, func):
+    """Register func(model, messages, base_url=None, **params) -> {"content", "prompt_tokens", "completion_tokens"}."""
+    BACKENDS[name] = func
+
+class LLMClient:
+    """Chat completions through a backend, a response cache and a JSON-lines call log."""
+
+    def __init__(self, backend="openai", cache=None, log_path=None, base_url=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend {backend!r}; choose from {sorted(BACKENDS)}")
+        self.backend = backend
+        self.base_url = base_url
+        self.cache = cache or NullCache()
+        self.log_path = Path(log_path) if log_path else None
+        self.calls = 0
+        self.tokens = {"prompt": 0, "completion": 0}
+        self._lock = threading.Lock()
+
+    def complete(self, model, messages, **params) -> str:
+        """Return the assistant message for `messages`, from the cache when possible."""
+        key_parts = (self.backend, self.base_url, model, messages, params)
+        t0 = time.perf_counter()
+        body = self.cache.lookup(SOURCE, key_parts)
+        cached = body is not None
+        if cached:
+            result = json.loads(body)
+        else:
+            with stage("llm_call"):
+                result = BACKENDS[self.backend](model, messages, base_url=self.base_url, **params)
+            self.cache.store(SOURCE, key_parts, json.dumps(result))
+        self._record(model, cached, time.perf_counter() - t0, result)
+        return result["content"]
+
+    def _record(self, model, cached, latency, result):
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "backend": self.backend, "model": model,
+                 "cached": cached, "latency_s": round(latency, 4),
+                 "prompt_tokens": result.get("prompt_tokens"), "completion_tokens": result.get("completion_tokens")}
+        with self._lock:
+            if not cached:
+                self.calls += 1
+                self.tokens["prompt"] += result.get("prompt_tokens") or 0
+                self.tokens["completion"] += result.get("completion_tokens") or 0
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def log_stats(self):
+        hits = sum(self.cache.hits.values())
+        logging.info(f"LLM: {self.calls} API calls, {hits} cached; "
+                     f"{self.tokens['prompt']} prompt + {self.tokens['completion']} completion tokens billed")
+
+    def close(self):
+        self.cache.close()
+
+_client = LLMClient()
+
+def get_client():
+    """Return the process-wide client configured by the running tool."""
+    return _client
+
+def complete(model, messages, **params) -> str:
+    return _client.complete(model, messages, **params)
+
+def configure(backend="openai", cache_dir=DEFAULT_CACHE_DIR, enabled=True, refresh=False,
+              max_bytes=DEFAULT_MAX_BYTES, log_path=None, base_url=None):
+    """Install the process-wide client and return it."""
+    global _client
+    _client.close()
+    cache = (ResponseCache(cache_dir, max_bytes=max_bytes, ttls={SOURCE: float("inf")}, refresh=refresh,
+                           filename="llm.sqlite") if enabled else NullCache())
+    _client = LLMClient(backend, cache, log_path, base_url)
+    return _client
+
+def add_llm_arguments(parser):
+    """Add the shared LLM backend, cache and call-log flags to a tool's parser."""
+    parser.add_argument("--llm-backend", choices=sorted(BACKENDS), default="openai",
+                        help="Completion backend (http: OpenAI-compatible endpoint at --llm-base-url)")
+    parser.add_argument("--llm-base-url", help="Base URL for the http backend (default $OPENAI_BASE_URL or OpenAI)")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Directory holding the LLM cache")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API; do not read or write the cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached completions but store fresh ones")
+    parser.add_argument("--llm-log", type=Path, default=DEFAULT_CACHE_DIR / "llm_calls.jsonl",
+                        help="JSON-lines log of per-call latency and token counts")
+
+def configure_from_args(args):
+    """Configure the process-wide client from parsed add_llm_arguments() flags."""
+    if args.llm_log:
+        args.llm_log.parent.mkdir(parents=True, exist_ok=True)
+    return configure(args.llm_backend, args.cache_dir, enabled=not args.no_cache, refresh=args.refresh,
+                     log_path=args.llm_log, base_url=args.llm_base_url)
@@ -0,0 +1,201 @@
+"""
+response_cache.py - Persistent, content-keyed cache for remote API responses.
+
+Responses are stored in a SQLite file keyed by a hash of the source name and
+the request that produced them. Each source has its own time-to-live and the
+whole cache is capped in size, evicting least-recently-used entries first.
+
+Tools opt in through add_cache_arguments()/configure_from_args(); library
+callers that never configure a cache get a disabled one and hit the network.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "research-assistant-ai"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DAY = 24 * 3600
+# Search results drift as new papers are indexed; resolved records rarely change.
+DEFAULT_TTLS = {
+    "pubmed": 7 * DAY,
+    "crossref": 7 * DAY,
+    "semanticscholar": 7 * DAY,
+    "doi": 90 * DAY,
+}
+DEFAULT_TTL = 7 * DAY
+
+def make_key(source: str, *parts) -> str:
+    """Hash a source name and request description into a stable cache key."""
+    blob = json.dumps([source, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """SQLite-backed response cache with per-source TTLs and LRU eviction."""
+
+    enabled = True
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 ttls=None, refresh=False, filename="responses.sqlite"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / filename
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.refresh = refresh
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, source TEXT NOT NULL, body TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        # Running size of the table, kept up to date by this process's writes and
+        # recounted before evicting, since other processes share the file.
+        self._total = self._table_size()
+
+    def _table_size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, source: str, key: str):
+        """Return the cached body for `key`, or None if absent, expired or refreshing."""
+        now = time.time()
+        with self._lock:
+            if self.refresh:
+                self.misses[source] += 1
+                return None
+            row = self._conn.execute(
+                "SELECT body, created, size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttls.get(source, DEFAULT_TTL):
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.hits[source] += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total -= row[2]
+            self.misses[source] += 1
+        return None
+
+    def put(self, source: str, key: str, body: str):
+        """Store `body` under `key`, then evict LRU entries beyond the size cap."""
+        now = time.time()
+        size = len(body.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, source, body, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (key, source, body, size, now, now)
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        total = self._table_size()
+        if total <= self.max_bytes:
+            self._total = total
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._total = total
+        logging.debug(f"Response cache evicted {len(doomed)} entries")
+
+    def lookup(self, source: str, key_parts):
+        """Return the cached text for `key_parts`, or None on a miss."""
+        return self.get(source, make_key(source, *key_parts))
+
+    def store(self, source: str, key_parts, body: str):
+        """Cache `body` under `key_parts`."""
+        self.put(source, make_key(source, *key_parts), body)
+
+    def cached(self, source: str, key_parts, fetch):
+        """Return the cached text for `key_parts`, calling `fetch()` to fill a miss."""
+        body = self.lookup(source, key_parts)
+        if body is None:
+            body = fetch()
+            self.store(source, key_parts, body)
+        return body
+
+    def log_stats(self):
+        """Log hit/miss counts overall and per source."""
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        total = hits + misses
+        if not total:
+            return
+        per_source = ", ".join(
+            f"{s} {self.hits[s]}/{self.hits[s] + self.misses[s]}"
+            for s in sorted(set(self.hits) | set(self.misses))
+        )
+        logging.info(f"Response cache: {hits} hits, {misses} misses "
+                     f"({100 * hits / total:.0f}% hit rate; {per_source})")
+
+    def close(self):
+        self._conn.close()
+
+class NullCache:
+    """Stand-in used when caching is disabled; always fetches."""
+
+    enabled = False
+
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def lookup(self, source, key_parts):
+        self.misses[source] += 1
+        return None
+
+    def store(self, source, key_parts, body):
+        pass
+
+    def cached(self, source, key_parts, fetch):
+        self.misses[source] += 1
+        return fetch()
+
+    def log_stats(self):
+        pass
+
+    def close(self):
+        pass
+
+_cache = NullCache()
+
+def get_cache():
+    """Return the process-wide cache configured by the running tool."""
+    return _cache
+
+def configure(cache_dir=DEFAULT_CACHE_DIR, enabled=True, refresh=False, max_bytes=DEFAULT_MAX_BYTES):
+    """Install the process-wide cache and return it."""
+    global _cache
+    _cache.close()
+    _cache = ResponseCache(cache_dir, max_bytes=max_bytes, refresh=refresh) if enabled else NullCache()
+    return _cache
+
+def add_cache_arguments(parser):
+    """Add the shared --cache-dir/--no-cache/--refresh flags to a tool's parser."""
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                        help="Directory holding the response cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the response cache entirely")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached responses but store fresh ones")
+
+def configure_from_args(args):
+    """Configure the process-wide cache from parsed add_cache_arguments() flags."""
+    return configure(args.cache_dir, enabled=not args.no_cache, refresh=args.refresh)
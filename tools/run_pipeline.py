@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+run_pipeline.py - Run a declared workflow of tools with make-style skipping.
+
+The workflow (YAML or JSON) names stages, each running a tool from codex.json
+with arguments, the paths it reads and the paths it writes:
+
+    stages:
+      ingest:   {tool: ingest_excel, args: "data.xlsx --outdir excel_output",
+                 inputs: [data.xlsx], outputs: [excel_output]}
+      analyze:  {tool: analyze_advanced, args: "excel_output/Sheet1.csv --outcome y --predictors a b",
+                 inputs: [excel_output/Sheet1.csv], outputs: [analysis_output]}
+      table:    {tool: create_apa_table, args: "excel_output/Sheet1.csv --out table.md",
+                 inputs: [excel_output/Sheet1.csv], outputs: [table.md]}
+
+A stage depends on every stage whose outputs contain one of its inputs (or
+that it lists under `after`). Independent stages run concurrently in worker
+processes. Each worker imports a tool once and calls its main() with the
+stage's arguments, so no fresh interpreter is started per stage.
+
+A stage is skipped when its outputs exist and a hash of its tool source,
+arguments and input contents matches the last successful run. Hashes are
+recorded in .pipeline_state.json next to the workflow. Paths are relative to
+the workflow file. A per-stage timing report is printed and written to
+pipeline_report.json. With --metrics-dir every stage that runs also writes
+its instrumentation metrics there (<stage>.json), and they are combined into
+<metrics-dir>/perf_report.json.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from instrumentation import aggregate, print_report
+
+TOOLS_DIR = Path(__file__).resolve().parent
+CODEX = TOOLS_DIR.parent / "codex.json"
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def load_tools(codex=CODEX):
+    """Tool name -> script path, from the `python3 tools/<name>.py` commands in codex.json."""
+    tools = {}
+    for tool in json.loads(codex.read_text())["tools"]:
+        script = tool["command"].split()[-1]
+        tools[tool["name"]] = (codex.parent / script).resolve()
+    return tools
+
+def load_workflow(path, tools):
+    text = path.read_text()
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("PyYAML is required for YAML workflows (pip install pyyaml), or use JSON")
+        raw = yaml.safe_load(text)
+    else:
+        raw = json.loads(text)
+    stages = {}
+    for name, s in (raw.get("stages") or {}).items():
+        if s.get("tool") not in tools:
+            raise SystemExit(f"Stage {name}: unknown tool {s.get('tool')!r} (see codex.json)")
+        args = s.get("args", [])
+        stages[name] = {"tool": s["tool"], "args": shlex.split(args) if isinstance(args, str) else [str(a) for a in args],
+                        "inputs": list(s.get("inputs", [])), "outputs": list(s.get("outputs", [])),
+                        "after": list(s.get("after", []))}
+    return stages
+
+def _within(path, root):
+    path, root = Path(os.path.normpath(path)), Path(os.path.normpath(root))
+    return path == root or root in path.parents
+
+def dependencies(stages):
+    """Stage -> set of stages it must wait for; exits on unknown names or cycles."""
+    deps = {}
+    for name, s in stages.items():
+        deps[name] = {other for other, o in stages.items() if other != name
+                      and any(_within(i, out) for i in s["inputs"] for out in o["outputs"])}
+        unknown = set(s["after"]) - set(stages)
+        if unknown:
+            raise SystemExit(f"Stage {name}: unknown stages in after: {', '.join(sorted(unknown))}")
+        deps[name] |= set(s["after"])
+    done = set()
+    while len(done) < len(deps):
+        ready = [n for n in deps if n not in done and deps[n] <= done]
+        if not ready:
+            raise SystemExit(f"Dependency cycle among: {', '.join(sorted(set(deps) - done))}")
+        done.update(ready)
+    return deps
+
+def path_digest(path, h):
+    """Feed a file's bytes, or a directory's relative paths and file bytes, into hash h."""
+    path = Path(path)
+    if path.is_dir():
+        for p in sorted(path.rglob("*")):
+            if p.is_file():
+                h.update(str(p.relative_to(path)).encode()); path_digest(p, h)
+    elif path.exists():
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    else:
+        h.update(b"<missing>")
+
+def stage_stamp(stage, script):
+    h = hashlib.sha256()
+    h.update(json.dumps([stage["tool"], stage["args"], stage["inputs"]]).encode())
+    path_digest(script, h)
+    for i in stage["inputs"]:
+        path_digest(i, h)
+    return h.hexdigest()
+
+_modules = {}
+
+def load_tool(script):
+    """Import a tool script as a module once per process (its main() is not run)."""
+    module = _modules.get(script)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(Path(script).stem, script)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module  # so pickled functions in the tool's own pools resolve
+        spec.loader.exec_module(module)
+        _modules[script] = module
+    return module
+
+def call_tool(name, module, args):
+    """Run module.main() with args as sys.argv[1:]; returns the exit code."""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:  # let each tool's basicConfig() install its own handlers
+        root.removeHandler(handler); handler.close()
+    sys.argv = [module.__file__, *args]
+    try:
+        module.main()
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        print(f"[{name}] {type(e).__name__}: {e}", file=sys.stderr)
+        code = 1
+    # joblib keeps its loky workers alive for reuse; this process could not exit until they time out.
+    loky = sys.modules.get("joblib.externals.loky.reusable_executor")
+    if loky and getattr(loky, "_executor", None) is not None:
+        loky._executor.shutdown(wait=True)
+    return code
+
+def run_stage(name, script, args):
+    """Run one tool in this worker process; returns (exit code, seconds)."""
+    module = load_tool(script)
+    start = time.perf_counter()
+    code = call_tool(name, module, args)
+    return code, time.perf_counter() - start
+
+def run(stages, tools, state_path, jobs, force=False, dry_run=False, metrics_dir=None):
+    deps = dependencies(stages)
+    state = {} if force or not state_path.exists() else json.loads(state_path.read_text())
+    report, status = {}, {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        running = {}
+        while len(status) < len(stages):
+            for name in stages:
+                if name in status or name in running.values() or not deps[name] <= set(status):
+                    continue
+                stage = stages[name]
+                if any(status[d] in ("failed", "blocked") for d in deps[name]):
+                    status[name] = "blocked"; report[name] = {"status": "blocked"}
+                    logging.warning(f"{name}: blocked by a failed dependency"); continue
+                stamp = stage_stamp(stage, tools[stage["tool"]])
+                if state.get(name) == stamp and all(Path(o).exists() for o in stage["outputs"]):
+                    status[name] = "skipped"; report[name] = {"status": "skipped"}
+                    logging.info(f"{name}: up to date"); continue
+                if dry_run:
+                    status[name] = "would run"; report[name] = {"status": "would run"}
+                    logging.info(f"{name}: would run {stage['tool']} {shlex.join(stage['args'])}"); continue
+                logging.info(f"{name}: running {stage['tool']} {shlex.join(stage['args'])}")
+                extra = ["--metrics-out", str(metrics_dir / f"{name}.json")] if metrics_dir else []
+                future = pool.submit(run_stage, name, str(tools[stage["tool"]]), stage["args"] + extra)
+                future.started = time.perf_counter() - t0
+                running[future] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    code, seconds = future.result()
+                except Exception as e:  # worker died
+                    logging.error(f"{name}: worker failed: {e}"); code, seconds = 1, 0.0
+                ok = code == 0
+                status[name] = "ran" if ok else "failed"
+                report[name] = {"status": status[name], "exit_code": code, "start": round(future.started, 3),
+                                "seconds": round(seconds, 3)}
+                if ok:
+                    # Re-hash inputs now: a stage that rewrites its own inputs should not rerun forever.
+                    state[name] = stage_stamp(stages[name], tools[stages[name]["tool"]])
+                    state_path.write_text(json.dumps(state, indent=2))
+                    logging.info(f"{name}: done in {seconds:.2f}s")
+                else:
+                    state.pop(name, None); state_path.write_text(json.dumps(state, indent=2))
+                    logging.error(f"{name}: exited with code {code} after {seconds:.2f}s")
+    return report, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a declared workflow of research-assistant tools")
+    parser.add_argument("workflow", type=Path, help="Workflow file (YAML or JSON)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Stages run concurrently")
+    parser.add_argument("--force", action="store_true", help="Run every stage even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Show which stages would run")
+    parser.add_argument("--report", type=Path, default=Path("pipeline_report.json"), help="Timing report (relative to the workflow)")
+    parser.add_argument("--metrics-dir", type=Path, help="Collect per-stage tool metrics here (relative to the workflow)")
+    args = parser.parse_args()
+
+    setup_logging()
+    tools = load_tools()
+    workflow = args.workflow.resolve()
+    stages = load_workflow(workflow, tools)
+    os.chdir(workflow.parent)
+    if args.metrics_dir and not args.dry_run:
+        args.metrics_dir.mkdir(parents=True, exist_ok=True)
+    report, total = run(stages, tools, Path(".pipeline_state.json"), args.jobs, args.force, args.dry_run, args.metrics_dir)
+
+    print(f"\n{'stage':<24}{'status':<12}{'start':>9}{'seconds':>10}")
+    for name, r in report.items():
+        start = f"{r['start']:.2f}" if "start" in r else ""
+        seconds = f"{r['seconds']:.2f}" if "seconds" in r else ""
+        print(f"{name:<24}{r['status']:<12}{start:>9}{seconds:>10}")
+    print(f"{'total':<36}{total:>19.2f}")
+    if not args.dry_run:
+        args.report.write_text(json.dumps({"total_seconds": round(total, 3), "stages": report}, indent=2))
+    ran = [args.metrics_dir / f"{name}.json" for name, r in report.items() if r["status"] in ("ran", "failed")] if args.metrics_dir else []
+    ran = [p for p in ran if p.exists()]
+    if ran:
+        perf = aggregate([json.loads(p.read_text()) for p in ran])
+        print(); print_report(perf)
+        (args.metrics_dir / "perf_report.json").write_text(json.dumps(perf, indent=2))
+    if any(r["status"] in ("failed", "blocked") for r in report.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
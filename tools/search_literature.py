@@ -1,50 +1,362 @@
 #!/usr/bin/env python3
 """
 search_literature.py - Search across PubMed, CrossRef, Semantic Scholar.
+Responses are kept in the shared on-disk cache (see response_cache.py).
+PubMed abstracts are fetched many per efetch call and the three sources are
+queried concurrently; a failing source is logged and skipped.
+
+--harvest pages through every result (CrossRef cursors, Semantic Scholar bulk
+tokens, PubMed retstart) and streams records to literature_results.jsonl,
+checkpointing after each page so --resume can continue an interrupted run.
+
+Results are added to the local full-text index (literature_index.py), and
+PubMed abstracts it already holds are taken from it instead of efetch;
+--index-only answers from the index without network access.
 """
 
-import argparse, logging, sys, json
+import argparse, functools, logging, sys, json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
-from Bio import Entrez
+from http_session import RateLimiter, cached_get, get_with_retry
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from lazy_imports import lazy_import
+from literature_index import DEFAULT_INDEX, LiteratureIndex
+from response_cache import add_cache_arguments, configure_from_args, get_cache
+
+Entrez = lazy_import("Bio.Entrez")
+
+CROSSREF_WORKS_URL = "https://api.crossref.org/works"
+S2_SEARCH_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
+S2_BULK_URL = "https://api.semanticscholar.org/graph/v1/paper/search/bulk"
+S2_FIELDS = "title,authors,year,abstract,externalIds"
+EFETCH_BATCH = 200        # IDs per efetch call
+HISTORY_THRESHOLD = 500   # use the esearch history server above this many hits
+# Requests per second during --harvest; NCBI allows 10/s with an API key.
+HARVEST_RATES = {"PubMed": 3, "CrossRef": 10, "SemanticScholar": 1}
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-def search_pubmed(query, retmax, email):
+def _esearch(query, retmax, use_history):
+    with stage("http_request"):
+        record = Entrez.read(Entrez.esearch(db="pubmed", term=query, retmax=retmax,
+                                            usehistory="y" if use_history else "n"))
+    return [str(i) for i in record["IdList"]], record.get("WebEnv"), record.get("QueryKey")
+
+def _split_abstracts(text):
+    """Split a multi-record efetch abstract dump into {pmid: record text}."""
+    records = {}
+    for chunk in re.split(r"\n{3,}(?=\d+\. )", text.strip()):
+        m = re.search(r"^PMID: (\d+)", chunk, re.M)
+        if m:
+            records[m.group(1)] = re.sub(r"^\d+\. ", "1. ", chunk, count=1) + "\n"
+    return records
+
+def _efetch_abstracts(ids=None, webenv=None, query_key=None, retstart=0, retmax=EFETCH_BATCH):
+    with stage("http_request"):
+        if webenv:
+            handle = Entrez.efetch(db="pubmed", webenv=webenv, query_key=query_key, retstart=retstart,
+                                   retmax=retmax, retmode="text", rettype="abstract")
+        else:
+            handle = Entrez.efetch(db="pubmed", id=",".join(ids), retmode="text", rettype="abstract")
+        text = handle.read()
+    return _split_abstracts(text)
+
+def _efetch_abstract(pmid):
+    """Fetch one record's abstract text; used for records a batch could not be split into."""
+    with stage("http_request"):
+        return Entrez.efetch(db="pubmed", id=pmid, retmode="text", rettype="abstract").read()
+
+def search_pubmed(query, retmax, email, batch_size=EFETCH_BATCH, index=None):
     Entrez.email = email
-    record = Entrez.read(Entrez.esearch(db="pubmed", term=query, retmax=retmax))
-    results = []
-    for pmid in record["IdList"]:
-        txt = Entrez.efetch(db="pubmed", id=pmid, retmode="text", rettype="abstract").read()
-        results.append({"source":"PubMed","id":pmid,"text":txt})
+    cache = get_cache()
+    use_history = retmax > HISTORY_THRESHOLD
+    webenv = query_key = None
+    def esearch():
+        nonlocal webenv, query_key
+        ids, webenv, query_key = _esearch(query, retmax, use_history)
+        return json.dumps(ids)
+    ids = json.loads(cache.cached("pubmed", ("esearch", query, retmax), esearch))
+
+    texts = index.pubmed_texts(ids) if index else {}
+    if texts:
+        logging.info(f"PubMed: {len(texts)}/{len(ids)} abstracts from the local index")
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        missing = []
+        for pmid in batch:
+            if pmid in texts:
+                continue
+            txt = cache.lookup("pubmed", ("efetch", pmid))
+            if txt is not None:
+                texts[pmid] = txt
+            else:
+                missing.append(pmid)
+        if not missing:
+            continue
+        if webenv and len(missing) == len(batch):
+            fetched = _efetch_abstracts(webenv=webenv, query_key=query_key, retstart=start, retmax=len(batch))
+        else:
+            fetched = _efetch_abstracts(ids=missing)
+        for pmid in missing:
+            txt = fetched.get(pmid)
+            if txt is None:  # record could not be split out of the batch; fetch it alone
+                txt = _efetch_abstract(pmid)
+            texts[pmid] = txt
+            cache.store("pubmed", ("efetch", pmid), txt)
+    return [{"source":"PubMed","id":pmid,"text":texts[pmid]} for pmid in ids]
+
+def search_crossref(query, retmax, timeout=30):
+    body = cached_get("crossref", CROSSREF_WORKS_URL, params={"query.title": query, "rows": retmax}, timeout=timeout)
+    items = json.loads(body).get("message", {}).get("items", [])
+    return [_crossref_record(item) for item in items]
+
+def _crossref_record(item):
+    return {"source":"CrossRef","id":item.get("DOI"),"title":(item.get("title") or [""])[0],"authors":[a.get("family") for a in item.get("author",[])],"published":item.get("published-print",{}).get("date-parts",[[None]])[0][0]}
+
+def _s2_record(d):
+    record = {"source":"SemanticScholar","id":d.get("paperId"),"title":d.get("title"),"year":d.get("year"),"text":d.get("abstract")}
+    external = d.get("externalIds") or {}
+    if external.get("DOI"):
+        record["doi"] = external["DOI"]
+    if external.get("PubMed"):
+        record["pmid"] = external["PubMed"]
+    return record
+
+def search_semanticscholar(query, retmax, timeout=30):
+    body = cached_get("semanticscholar", S2_SEARCH_URL, params={"query":query,"limit":retmax,"fields":S2_FIELDS}, timeout=timeout)
+    data = json.loads(body).get("data",[])
+    return [_s2_record(d) for d in data]
+
+def _timed_search(name, func, *args):
+    """Run one source search; failures are logged and yield no records."""
+    start = time.perf_counter()
+    try:
+        with stage(f"search:{name}"):
+            results = func(*args)
+    except Exception as e:
+        logging.error(f"{name} search failed after {time.perf_counter() - start:.2f}s: {e}")
+        return []
+    logging.info(f"{name}: {len(results)} records in {time.perf_counter() - start:.2f}s")
     return results
 
-def search_crossref(query, retmax):
-    resp = requests.get("https://api.crossref.org/works", params={"query.title": query, "rows": retmax})
-    items = resp.json().get("message", {}).get("items", [])
-    return [{"source":"CrossRef","id":item.get("DOI"),"title":item.get("title",[""])[0],"authors":[a.get("family") for a in item.get("author",[])],"published":item.get("published-print",{}).get("date-parts",[[None]])[0][0]} for item in items]
+def search_all(query, retmax, email, timeout=30, index=None):
+    """Query all sources concurrently; results are merged PubMed, CrossRef, Semantic Scholar."""
+    jobs = [("PubMed", search_pubmed, (query, retmax, email, EFETCH_BATCH, index)),
+            ("CrossRef", search_crossref, (query, retmax, timeout)),
+            ("SemanticScholar", search_semanticscholar, (query, retmax, timeout))]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(_timed_search, name, func, *a) for name, func, a in jobs]
+        return [record for future in futures for record in future.result()]
 
-def search_semanticscholar(query, retmax):
-    resp = requests.get("https://api.semanticscholar.org/graph/v1/paper/search", params={"query":query,"limit":retmax,"fields":"title,authors,year,abstract"})
-    data = resp.json().get("data",[])
-    return [{"source":"SemanticScholar","id":d.get("paperId"),"title":d.get("title"),"year":d.get("year"),"text":d.get("abstract")} for d in data]
+class HarvestWriter:
+    """
+    Stream records to a JSONL file and checkpoint each source's paging position.
 
+    Pages are appended and the checkpoint (per-source position plus the file
+    offset after the page) is replaced atomically under one lock. On resume
+    the file is truncated back to the checkpointed offset, so a page that was
+    written but not checkpointed is fetched again rather than duplicated.
+    """
+
+    def __init__(self, out_path, state_path, query, resume=False):
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        state = None
+        if resume and state_path.exists() and out_path.exists():
+            state = json.loads(state_path.read_text())
+            if state.get("query") != query:
+                logging.warning(f"{state_path} belongs to query {state.get('query')!r}; starting over")
+                state = None
+        self.state = state or {"query": query, "offset": 0, "sources": {}}
+        self.fh = out_path.open("r+b" if state else "wb")
+        self.fh.truncate(self.state["offset"])
+        self.fh.seek(self.state["offset"])
+
+    def position(self, source):
+        return dict(self.state["sources"].get(source, {}))
+
+    def commit(self, source, records, position):
+        with self.lock:
+            for record in records:
+                self.fh.write((json.dumps(record) + "\n").encode("utf-8"))
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            entry = self.state["sources"].setdefault(source, {"count": 0})
+            entry.update(position)
+            entry["count"] += len(records)
+            self.state["offset"] = self.fh.tell()
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.state, indent=2))
+            tmp.replace(self.state_path)
+
+    def close(self):
+        self.fh.close()
+
+def _page_ids(query, retstart, page_size):
+    """PMIDs of one page of the query's results, in efetch order."""
+    with stage("http_request"):
+        page = Entrez.read(Entrez.esearch(db="pubmed", term=query, retstart=retstart, retmax=page_size))
+    return [str(i) for i in page["IdList"]]
+
+def _complete_page(texts, ids, limiter):
+    """Fetch alone the records of ids a batch could not be split into; returns texts in ids order."""
+    for pmid in ids:
+        if pmid not in texts:
+            limiter.wait()
+            texts[pmid] = _efetch_abstract(pmid)
+    return {pmid: texts[pmid] for pmid in ids}
+
+def _pubmed_pages(query, position, page_size, limiter, timeout, index=None):
+    retstart = position.get("retstart", 0)
+    limiter.wait()
+    with stage("http_request"):  # with an index, the history esearch also lists the first page
+        record = Entrez.read(Entrez.esearch(db="pubmed", term=query, retstart=retstart,
+                                            retmax=page_size if index else 0, usehistory="y"))
+    total, webenv, query_key = int(record["Count"]), record["WebEnv"], record["QueryKey"]
+    ids = [str(i) for i in record["IdList"]]
+    # Listing each page costs an extra esearch, which only pays off when the
+    # index already holds PubMed records of this query.
+    use_index = bool(index and index.pubmed_texts(ids))
+    while retstart < total:
+        limiter.wait()
+        if use_index:  # list the page's PMIDs, then efetch only those the index lacks
+            if ids is None:
+                ids = _page_ids(query, retstart, page_size)
+                limiter.wait()
+            texts = index.pubmed_texts(ids)
+            missing = [pmid for pmid in ids if pmid not in texts]
+            if missing:
+                texts.update(_efetch_abstracts(ids=missing))
+            texts = _complete_page(texts, ids, limiter)
+            ids = None
+        else:
+            texts = _efetch_abstracts(webenv=webenv, query_key=query_key, retstart=retstart, retmax=page_size)
+            if len(texts) < min(page_size, total - retstart):
+                # some records could not be split out of the page; list it to find and fetch them
+                limiter.wait()
+                texts = _complete_page(texts, _page_ids(query, retstart, page_size), limiter)
+        retstart += page_size
+        yield ([{"source":"PubMed","id":pmid,"text":txt} for pmid, txt in texts.items()],
+               {"retstart": retstart, "done": retstart >= total})
+
+def _crossref_pages(query, position, page_size, limiter, timeout):
+    cursor = position.get("cursor", "*")
+    while True:
+        params = {"query.title": query, "rows": page_size, "cursor": cursor}
+        message = get_with_retry(CROSSREF_WORKS_URL, params=params, timeout=timeout, limiter=limiter).json().get("message", {})
+        items = message.get("items", [])
+        cursor = message.get("next-cursor")
+        done = not cursor or len(items) < page_size
+        yield [_crossref_record(item) for item in items], {"cursor": cursor, "done": done}
+        if done:
+            return
+
+def _s2_pages(query, position, page_size, limiter, timeout):
+    token = position.get("token")
+    while True:
+        params = {"query": query, "fields": S2_FIELDS}
+        if token:
+            params["token"] = token
+        data = get_with_retry(S2_BULK_URL, params=params, timeout=timeout, limiter=limiter).json()
+        token = data.get("token")
+        records = [_s2_record(d) for d in data.get("data", [])]
+        yield records, {"token": token, "done": not token or not records}
+        if not token or not records:
+            return
+
+def _harvest_source(name, pages, writer, query, limit, page_size, rate, timeout):
+    position = writer.position(name)
+    if position.get("done"):
+        logging.info(f"{name}: already harvested ({position.get('count', 0)} records)")
+        return
+    count, start = position.get("count", 0), time.perf_counter()
+    try:
+        with stage(f"harvest:{name}"):
+            for records, new_position in pages(query, position, page_size, RateLimiter(rate), timeout):
+                if limit:
+                    records = records[:max(limit - count, 0)]
+                    new_position["done"] = new_position["done"] or count + len(records) >= limit
+                count += len(records)
+                writer.commit(name, records, new_position)
+                logging.info(f"{name}: {count} records harvested")
+                if new_position["done"]:
+                    break
+    except Exception as e:
+        logging.error(f"{name} harvest stopped at {count} records: {e}; rerun with --resume to continue")
+        return
+    writer.commit(name, [], {"done": True})
+    logging.info(f"{name}: finished with {count} records in {time.perf_counter() - start:.1f}s")
+
+def harvest_all(query, outdir, email, limit=0, page_size=EFETCH_BATCH, resume=False, timeout=30, index=None):
+    """Harvest every source concurrently into outdir/literature_results.jsonl."""
+    Entrez.email = email
+    rates = dict(HARVEST_RATES, PubMed=10 if Entrez.api_key else 3)
+    writer = HarvestWriter(outdir/"literature_results.jsonl", outdir/"harvest_state.json", query, resume)
+    jobs = [("PubMed", functools.partial(_pubmed_pages, index=index)), ("CrossRef", _crossref_pages),
+            ("SemanticScholar", _s2_pages)]
+    try:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            for future in [pool.submit(_harvest_source, name, pages, writer, query, limit, page_size, rates[name], timeout)
+                           for name, pages in jobs]:
+                future.result()
+    finally:
+        writer.close()
+    return writer.state
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("query")
     parser.add_argument("--retmax", type=int, default=5)
     parser.add_argument("--email", required=True)
     parser.add_argument("--outdir", type=Path, default=Path("literature_output"))
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout (s) for CrossRef and Semantic Scholar")
+    parser.add_argument("--harvest", action="store_true", help="Page through all results, streaming to literature_results.jsonl (--retmax 0 = no cap per source)")
+    parser.add_argument("--page-size", type=int, default=EFETCH_BATCH, help="Records per page in --harvest mode")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted --harvest from harvest_state.json")
+    parser.add_argument("--api-key", default=os.environ.get("NCBI_API_KEY"), help="NCBI API key (raises the PubMed rate limit to 10 req/s)")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX, help="Local full-text index consulted and updated by searches")
+    parser.add_argument("--no-index", action="store_true", help="Neither read nor update the local index")
+    parser.add_argument("--index-only", action="store_true", help="Answer from the local index only (no network); up to --retmax papers")
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging()
+    setup_logging(); instrument_from_args(args)
+    Entrez.api_key = args.api_key
     args.outdir.mkdir(exist_ok=True)
-    results = []
-    results.extend(search_pubmed(args.query, args.retmax, args.email))
-    results.extend(search_crossref(args.query, args.retmax))
-    results.extend(search_semanticscholar(args.query, args.retmax))
+    index = None if args.no_index else LiteratureIndex(args.index)
+    try:
+        if args.index_only:
+            if index is None:
+                parser.error("--index-only needs the index; drop --no-index")
+            with stage("index_query"):
+                results = index.records(args.query, args.retmax)
+            logging.info(f"{len(results)} records from the local index {args.index}")
+        elif args.harvest:
+            state = harvest_all(args.query, args.outdir, args.email, args.retmax, args.page_size, args.resume,
+                                args.timeout, index)
+            counts = ", ".join(f"{name} {s['count']}" for name, s in state["sources"].items())
+            logging.info(f"Saved literature_results.jsonl ({counts})")
+            if index:
+                with stage("index_add"):
+                    index.add_results(args.outdir/"literature_results.jsonl", force=True)
+            return
+        else:
+            cache = configure_from_args(args)
+            results = search_all(args.query, args.retmax, args.email, args.timeout, index)
+            if index:
+                with stage("index_add"):
+                    index.add_records(results)
+            cache.log_stats()
+    finally:
+        if index:
+            index.close()
 
     with (args.outdir/"literature_results.json").open("w") as f:
         json.dump(results, f, indent=2)
     logging.info(f"Saved literature_results.json")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+streaming_stats.py - Single-pass, bounded-memory descriptive statistics and correlations.
+
+StreamingStats consumes a CSV chunk by chunk and produces the numeric part of
+DataFrame.describe() and DataFrame.corr() without holding the data in memory.
+Memory is O(p^2 + p*k) for p numeric columns and sketch size k, independent of
+row count.
+
+Tolerances against the in-memory pandas results:
+    count, min, max      exact
+    mean, std, corr      floating-point error only (~1e-9 relative); columns are
+                         shifted by their first-chunk means before accumulating
+                         sums to avoid cancellation
+    25%/50%/75%          exact (linear interpolation, as pandas) while a column
+                         has fewer values than the sketch holds; beyond that,
+                         KLL rank error of roughly 1.7/k (~0.4% of n at k=400)
+
+Correlations are pairwise-complete, like pandas: each pair uses the rows where
+both values are present.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from instrumentation import stage
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+DEFAULT_K = 400
+QUANTILES = (0.25, 0.5, 0.75)
+
+class QuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch.
+
+    Level h holds items of weight 2**h. A level over capacity is sorted and
+    every other item (random offset) is promoted to the level above, so the
+    sketch stays O(k) in size while preserving rank order.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, h: int) -> int:
+        depth = len(self.levels) - 1 - h
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[h])
+                leftover = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[self.rng.integers(2)::2]])
+                self.levels[h] = leftover
+            h += 1
+
+    def quantiles(self, qs=QUANTILES) -> np.ndarray:
+        if not self.n:
+            return np.full(len(qs), np.nan)
+        if all(len(level) == 0 for level in self.levels[1:]):
+            return np.quantile(self.levels[0], qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(qs) * cum[-1], side="left")
+        return items[np.clip(idx, 0, len(items) - 1)]
+
+class StreamingStats:
+    """Accumulate describe()/corr() statistics for numeric columns over chunks."""
+
+    def __init__(self, columns, k: int = DEFAULT_K):
+        p = len(columns)
+        self.columns = list(columns)
+        self.shift = None
+        self.n = np.zeros((p, p))     # rows where both i and j are present
+        self.sx = np.zeros((p, p))    # sum of x_i over those rows
+        self.sxx = np.zeros((p, p))   # sum of x_i**2 over those rows
+        self.sxy = np.zeros((p, p))   # sum of x_i * x_j
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        self.sketches = [QuantileSketch(k) for _ in columns]
+        self.rows = 0
+        self.coerced = 0
+
+    def update(self, chunk: pd.DataFrame):
+        frame = chunk[self.columns]
+        numeric = frame.apply(pd.to_numeric, errors="coerce")
+        self.coerced += int((numeric.isna() & frame.notna()).to_numpy().sum())
+        X = numeric.to_numpy(dtype=float)
+        present = ~np.isnan(X)
+        if self.shift is None:
+            counts = present.sum(axis=0)
+            self.shift = np.where(counts, np.nansum(X, axis=0) / np.maximum(counts, 1), 0.0)
+        self.rows += len(X)
+        self.min = np.fmin(self.min, np.where(present, X, np.inf).min(axis=0, initial=np.inf))
+        self.max = np.fmax(self.max, np.where(present, X, -np.inf).max(axis=0, initial=-np.inf))
+        for i, sketch in enumerate(self.sketches):
+            sketch.update(X[:, i])
+        Xc = np.where(present, X - self.shift, 0.0)
+        M = present.astype(float)
+        self.n += M.T @ M
+        self.sx += Xc.T @ M
+        self.sxx += (Xc * Xc).T @ M
+        self.sxy += Xc.T @ Xc
+
+    def describe(self) -> pd.DataFrame:
+        """Numeric rows of DataFrame.describe(): count, mean, std, min, quartiles, max."""
+        count = np.diag(self.n)
+        sx, sxx = np.diag(self.sx), np.diag(self.sxx)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, sx / count + self.shift, np.nan)
+            var = np.where(count > 1, (sxx - sx * sx / count) / (count - 1), np.nan)
+        std = np.sqrt(np.maximum(var, 0))
+        quartiles = np.array([s.quantiles() for s in self.sketches]).T
+        empty = count == 0
+        rows = {"count": count, "mean": mean, "std": std,
+                "min": np.where(empty, np.nan, self.min),
+                "25%": quartiles[0], "50%": quartiles[1], "75%": quartiles[2],
+                "max": np.where(empty, np.nan, self.max)}
+        return pd.DataFrame(rows, index=self.columns).T
+
+    def corr(self) -> pd.DataFrame:
+        """Pairwise-complete Pearson correlation, as DataFrame.corr()."""
+        n = self.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mx, my = self.sx / n, self.sx.T / n
+            cov = self.sxy / n - mx * my
+            vx, vy = self.sxx / n - mx * mx, self.sxx.T / n - my * my
+            r = cov / np.sqrt(vx * vy)
+        r = np.where((n > 1) & (vx > 0) & (vy > 0), np.clip(r, -1, 1), np.nan)
+        diag = np.diag_indices_from(r)
+        r[diag] = np.where(np.isnan(r[diag]), np.nan, 1.0)
+        return pd.DataFrame(r, index=self.columns, columns=self.columns)
+
+def stream_csv_stats(csv_path, chunksize: int = 500_000, k: int = DEFAULT_K) -> StreamingStats:
+    """Read a CSV in chunks and return the filled StreamingStats for its numeric columns."""
+    stats = None
+    with stage("stream_pass"):
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            if stats is None:
+                stats = StreamingStats(chunk.select_dtypes(include="number").columns, k=k)
+            with stage("stream_chunk_update"):
+                stats.update(chunk)
+    if stats is None:
+        stats = StreamingStats([], k=k)
+    if stats.coerced:
+        logging.warning(f"{stats.coerced} non-numeric values in numeric columns were treated as missing")
+    return stats
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+tool_server.py - Keep the tools' libraries loaded and run invocations against them.
+
+    python3 tools/tool_server.py serve &
+    python3 tools/tool_server.py run analyze_advanced data.csv --outcome y --predictors a b
+    python3 tools/tool_server.py stop
+
+`serve` imports every tool in codex.json and the heavy libraries they use
+(pandas, statsmodels, scikit-learn, matplotlib, PyMuPDF, ...) once, then
+listens on a Unix socket. `run` passes its own stdin/stdout/stderr, working
+directory, environment and arguments to the server. The server forks a child
+for the call, so each invocation starts with the libraries already in memory
+and state from one call never leaks into the next. The child runs the tool's
+main() with the client's streams, and its exit code becomes the client's.
+Ctrl-C in the client interrupts the child.
+
+If no server is listening, `run` runs the tool in its own process, so batch
+scripts work the same with or without the server. Unix only.
+"""
+
+import argparse
+import atexit
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+run_pipeline = lazy_import("run_pipeline")  # the client side only needs the socket
+
+SOCKET = Path(os.getenv("RESEARCH_TOOL_SOCKET", Path.home() / ".cache" / "research-assistant-ai" / "tool_server.sock"))
+PRELOAD = ["numpy", "pandas", "scipy.stats", "statsmodels.api", "lifelines", "joblib",
+           "sklearn.linear_model", "sklearn.metrics", "sklearn.model_selection", "sklearn.pipeline",
+           "sklearn.preprocessing", "matplotlib.pyplot", "seaborn", "fitz", "openpyxl", "pyarrow.parquet",
+           "Bio.Entrez", "requests", "openai", "pypandoc"]
+SKIP = {"run_pipeline", "tool_server"}
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def warm(tools, preload=PRELOAD):
+    """Import the tool modules and libraries; returns tool name -> module."""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    start = time.perf_counter()
+    modules = {}
+    for name, script in tools.items():
+        if name in SKIP:
+            continue
+        try:
+            modules[name] = run_pipeline.load_tool(str(script))
+        except Exception as e:
+            logging.warning(f"{name}: not loaded ({type(e).__name__}: {e})")
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logging.warning(f"{name}: not preloaded ({e})")
+    logging.info(f"Loaded {len(modules)} tools and {len(preload)} libraries in {time.perf_counter() - start:.1f}s")
+    return modules
+
+def _child(conn, request, fds, module):
+    """In the forked child: take over the client's streams and run the tool. Never returns."""
+    code = 1
+    try:
+        conn.close()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target); os.close(fd)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        os.chdir(request["cwd"])
+        os.environ.clear(); os.environ.update(request["env"])
+        code = run_pipeline.call_tool(request["tool"], module, request["argv"])
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            atexit._run_exitfuncs()  # e.g. joblib removing its memmap folders; os._exit skips them
+            sys.stdout.flush(); sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def _reap(pid, conn):
+    _, status = os.waitpid(pid, 0)
+    try:
+        conn.sendall(json.dumps({"exit": os.waitstatus_to_exitcode(status)}).encode() + b"\n")
+    except OSError:
+        pass  # client went away
+    conn.close()
+
+def _read_request(conn):
+    """A request is one byte carrying the client's three fds, then a JSON line."""
+    _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+    with conn.makefile("rb") as f:
+        return json.loads(f.readline()), fds
+
+def serve(path, modules):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        try:
+            socket.socket(socket.AF_UNIX).connect(str(path))
+            raise SystemExit(f"A server is already listening on {path}")
+        except ConnectionRefusedError:
+            path.unlink()  # left behind by a server that died
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(path)); server.listen(64)
+    logging.info(f"Serving {len(modules)} tools on {path}")
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request, fds = _read_request(conn)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Bad request: {e}"); conn.close(); continue
+            if request.get("op") == "stop":
+                conn.sendall(b'{"exit": 0}\n'); conn.close()
+                break
+            module = modules.get(request.get("tool"))
+            if module is None or len(fds) != 3:
+                for fd in fds:
+                    os.close(fd)
+                conn.sendall(json.dumps({"error": f"unknown tool {request.get('tool')!r}", "exit": 2}).encode() + b"\n")
+                conn.close(); continue
+            sys.stdout.flush(); sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                _child(conn, request, fds, module)
+            for fd in fds:
+                os.close(fd)
+            conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+            threading.Thread(target=_reap, args=(pid, conn), daemon=True).start()
+    finally:
+        server.close()
+        path.unlink(missing_ok=True)
+        logging.info("Server stopped")
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+def call(path, tool, argv):
+    """Run a tool through the server; returns its exit code, or None if no server is listening."""
+    sock = _connect(path)
+    if sock is None:
+        return None
+    request = {"op": "run", "tool": tool, "argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    socket.send_fds(sock, [b"R"], [0, 1, 2])
+    sock.sendall(json.dumps(request).encode() + b"\n")
+    pid = None
+    with sock, sock.makefile("rb") as replies:
+        while True:
+            try:
+                line = replies.readline()
+                if not line:
+                    return 1  # server went away mid-call
+                reply = json.loads(line)
+                if "error" in reply:
+                    print(reply["error"], file=sys.stderr)
+                pid = reply.get("pid", pid)
+                if "exit" in reply:
+                    return reply["exit"]
+            except KeyboardInterrupt:
+                if pid:
+                    os.kill(pid, signal.SIGINT)
+
+def stop(path):
+    sock = _connect(path)
+    if sock is None:
+        return False
+    with sock:
+        socket.send_fds(sock, [b"R"], [])
+        sock.sendall(b'{"op": "stop"}\n')
+        sock.recv(64)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tools against a server that keeps their libraries loaded")
+    parser.add_argument("--socket", type=Path, default=SOCKET, help="Unix socket path (default $RESEARCH_TOOL_SOCKET)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="Load the tools and serve calls until stopped")
+    p.add_argument("--no-preload", action="store_true", help="Load only the tool modules, not their libraries")
+    p = sub.add_parser("run", help="Run a tool through the server (or directly if none is running)")
+    p.add_argument("tool", help="Tool name from codex.json")
+    p.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the tool")
+    sub.add_parser("stop", help="Stop the server")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        setup_logging()
+        serve(args.socket, warm(run_pipeline.load_tools(), [] if args.no_preload else PRELOAD))
+    elif args.command == "run":
+        code = call(args.socket, args.tool, args.args)
+        if code is None:
+            tools = run_pipeline.load_tools()
+            if args.tool not in tools or args.tool in SKIP:
+                raise SystemExit(f"Unknown tool {args.tool!r} (see codex.json)")
+            print(f"tool_server: no server on {args.socket}; running {args.tool} directly", file=sys.stderr)
+            code = run_pipeline.call_tool(args.tool, run_pipeline.load_tool(str(tools[args.tool])), args.args)
+        sys.exit(code)
+    else:
+        if not stop(args.socket):
+            raise SystemExit(f"No server on {args.socket}")
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,372 @@
 #!/usr/bin/env python3
 """
 validate_models.py - K-fold CV and diagnostics.
+
+Runs repeated k-fold CV for one or more candidates (every combination of
+--model and predictor set). Fold splits are drawn once and shared by every
+candidate, fits run in parallel (--jobs), and each fold's result is cached on
+disk so adding a candidate only fits the new one. Writes per-fold results
+(cv_folds.csv), a per-candidate summary (cv_summary.csv), the legacy
+cv_results.csv and diagnostic plots for the first candidate.
+
+--method bootstrap runs Harrell's optimism-corrected bootstrap validation
+instead (linear and logistic models). Resamples are drawn as count vectors
+in fixed-size batches from a seeded SeedSequence, so results do not depend
+on the number of workers. Each resample is a weighted refit, and metrics for
+a whole batch are computed at once as matrix operations.
 """
 
-import argparse, logging, sys
+import argparse, hashlib, json, logging, os, sys, time
 from pathlib import Path
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.model_selection import KFold, cross_val_score
-from sklearn.linear_model import LinearRegression, LogisticRegression
+from dataset_cache import add_dataset_cache_arguments, load_dataset
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from lazy_imports import lazy_import
+
+os.environ["MPLBACKEND"] = "Agg"  # same as matplotlib.use("Agg"), before matplotlib is (lazily) imported
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
+joblib = lazy_import("joblib")
+linear_model = lazy_import("sklearn.linear_model")
+metrics = lazy_import("sklearn.metrics")
+model_selection = lazy_import("sklearn.model_selection")
+pipeline = lazy_import("sklearn.pipeline")
+preprocessing = lazy_import("sklearn.preprocessing")
+special = lazy_import("scipy.special")
+sklearn = lazy_import("sklearn")
+
+def penalized_logistic(penalty, l1_ratio):
+    """
+    Standardized saga LogisticRegression with an l1 or elastic-net penalty.
+    scikit-learn before 1.8 needs penalty= to use l1_ratio; 1.8 deprecates it
+    (the penalty follows from l1_ratio), so it is only passed where required.
+    """
+    version = tuple(int(part) for part in sklearn.__version__.split(".")[:2])
+    kwargs = {"penalty": penalty} if version < (1, 8) else {}
+    return pipeline.make_pipeline(preprocessing.StandardScaler(),
+                                  linear_model.LogisticRegression(l1_ratio=l1_ratio, solver="saga", max_iter=5000, **kwargs))
+
+# name -> (estimator factory, task). Penalized models standardize predictors first.
+MODELS = {
+    "linear": (lambda: linear_model.LinearRegression(), "regression"),
+    "ridge": (lambda: pipeline.make_pipeline(preprocessing.StandardScaler(), linear_model.RidgeCV(alphas=np.logspace(-3, 3, 13))), "regression"),
+    "lasso": (lambda: pipeline.make_pipeline(preprocessing.StandardScaler(), linear_model.LassoCV(cv=5)), "regression"),
+    "elasticnet": (lambda: pipeline.make_pipeline(preprocessing.StandardScaler(), linear_model.ElasticNetCV(cv=5, l1_ratio=0.5)), "regression"),
+    "logistic": (lambda: linear_model.LogisticRegression(max_iter=1000), "classification"),
+    "logistic_l1": (lambda: penalized_logistic("l1", 1.0), "classification"),
+    "logistic_elasticnet": (lambda: penalized_logistic("elasticnet", 0.5), "classification"),
+}
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
+def parse_predictor_sets(predictors, predictor_sets):
+    """--predictors gives the set "default"; --predictor-set NAME=a,b,c adds named sets."""
+    sets = {}
+    if predictors:
+        sets["default"] = list(predictors)
+    for spec in predictor_sets or []:
+        name, _, cols = spec.partition("=")
+        if not cols:
+            raise ValueError(f"--predictor-set expects NAME=col1,col2 (got {spec!r})")
+        sets[name] = [c for c in cols.split(",") if c]
+    return sets
+
+def score_fold(task, model, X_test, y_test):
+    preds = model.predict(X_test)
+    if task == "regression":
+        return {"rmse": metrics.mean_squared_error(y_test, preds) ** 0.5, "r2": metrics.r2_score(y_test, preds)}
+    scores = {"accuracy": metrics.accuracy_score(y_test, preds)}
+    if len(np.unique(y_test)) == 2:
+        scores["auc"] = metrics.roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+    return scores
+
+def fit_fold(model_name, X, y, train, test):
+    """Fit one candidate on one fold; returns its metrics and fit wall-clock time."""
+    factory, task = MODELS[model_name]
+    model = factory()
+    t0 = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - t0
+    return {**score_fold(task, model, X[test], y[test]), "fit_seconds": fit_seconds}
+
+class FoldCache:
+    """One JSON file per (data, candidate, fold) result under cache_dir."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key):
+        if self.cache_dir and (self.cache_dir / f"{key}.json").exists():
+            return json.loads((self.cache_dir / f"{key}.json").read_text())
+        return None
+
+    def put(self, key, result):
+        if self.cache_dir:
+            (self.cache_dir / f"{key}.json").write_text(json.dumps(result))
+
+def model_params(model_name):
+    """Hyperparameters of a candidate's estimator as a stable string, for cache keys."""
+    params = MODELS[model_name][0]().get_params(deep=True)
+    return json.dumps(params, sort_keys=True, default=repr)
+
+def fold_key(data_hash, model_name, params, predictors, test):
+    """Cache key of one fold: data, estimator, hyperparameters, scikit-learn version and test rows."""
+    h = hashlib.sha256()
+    h.update(json.dumps([data_hash, model_name, params, sklearn.__version__, predictors]).encode())
+    h.update(np.ascontiguousarray(test, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+def data_hash(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+                          + json.dumps(list(df.columns)).encode()).hexdigest()
+
+def complete_rows(df, outcome, predictors, set_name=None):
+    """Rows of the outcome and predictor columns without missing values."""
+    sub = df[[outcome] + predictors].dropna().reset_index(drop=True)
+    if len(sub) < len(df):
+        logging.info(f"{set_name or 'predictors'}: dropped {len(df) - len(sub)} rows with missing values")
+    return sub
+
+def run_cv(df, outcome, predictor_sets, models, folds=5, repeats=1, jobs=-1, cache=None, seed=42):
+    """
+    Evaluate every (predictor set, model) candidate on repeated k-fold splits.
+    Each predictor set uses its own complete rows, and the splits of those rows
+    are shared by all of its models. Data and splits of one set therefore do
+    not depend on the other sets, so adding a candidate leaves the cached folds
+    of the others valid. Returns a tidy DataFrame with one row per candidate
+    and fold.
+    """
+    cache = cache or FoldCache(None)
+    params = {m: model_params(m) for m in models}
+    tasks, rows = [], []
+    for set_name, predictors in predictor_sets.items():
+        sub = complete_rows(df, outcome, predictors, set_name)
+        splits = list(model_selection.RepeatedKFold(n_splits=folds, n_repeats=repeats, random_state=seed).split(sub))
+        X, y = sub[predictors].to_numpy(dtype=float), sub[outcome].to_numpy()
+        dh = data_hash(sub)
+        for model_name in models:
+            for i, (train, test) in enumerate(splits):
+                row = {"candidate": f"{set_name}/{model_name}", "predictor_set": set_name, "model": model_name,
+                       "repeat": i // folds + 1, "fold": i % folds + 1}
+                key = fold_key(dh, model_name, params[model_name], predictors, test)
+                cached = cache.get(key)
+                if cached is not None:
+                    rows.append({**row, **cached, "cached": True})
+                else:
+                    tasks.append((row, key, model_name, X, y, train, test))
+    logging.info(f"{len(tasks)} fits to run, {len(rows)} fold results from cache")
+    with stage("fold_fits"):
+        results = joblib.Parallel(n_jobs=jobs)(joblib.delayed(fit_fold)(m, X, y, tr, te) for _, _, m, X, y, tr, te in tasks)
+    for (row, key, *_), result in zip(tasks, results):
+        cache.put(key, result)
+        rows.append({**row, **result, "cached": False})
+    out = pd.DataFrame(rows)
+    out["candidate"] = pd.Categorical(out["candidate"], categories=[f"{s}/{m}" for s in predictor_sets for m in models])
+    return out.sort_values(["candidate", "repeat", "fold"]).reset_index(drop=True)
+
+def summarize(fold_df):
+    """Mean, SD, min and max of every metric per candidate, plus fit timing."""
+    metrics = [c for c in ["rmse", "r2", "accuracy", "auc", "fit_seconds"] if c in fold_df]
+    tidy = fold_df.melt(id_vars=["candidate", "predictor_set", "model"], value_vars=metrics, var_name="metric").dropna(subset=["value"])
+    summary = tidy.groupby(["candidate", "predictor_set", "model", "metric"], sort=False, observed=True)["value"].agg(["count", "mean", "std", "min", "max"])
+    return summary.reset_index()
+
+BOOTSTRAP_BATCH = 50  # resamples per worker task; fixed so results are independent of --jobs
+
+def weighted_auc(scores, y, w):
+    """
+    C-statistic of each row of scores (B x n) against binary y, with row
+    weights w (B x n); ties count one half, as in the Mann-Whitney U statistic.
+    """
+    order = np.argsort(scores, axis=1, kind="stable")
+    s = np.take_along_axis(scores, order, axis=1)
+    pos = y[order].astype(float)
+    wt = np.take_along_axis(w, order, axis=1)
+    wneg, wpos = wt * (1 - pos), wt * pos
+    cneg = np.cumsum(wneg, axis=1)
+    idx = np.broadcast_to(np.arange(s.shape[1]), s.shape)
+    new = np.ones_like(s, dtype=bool); new[:, 1:] = s[:, 1:] != s[:, :-1]
+    last = np.ones_like(s, dtype=bool); last[:, :-1] = new[:, 1:]
+    start = np.maximum.accumulate(np.where(new, idx, 0), axis=1)
+    end = np.minimum.accumulate(np.where(last, idx, s.shape[1] - 1)[:, ::-1], axis=1)[:, ::-1]
+    below = np.take_along_axis(cneg, start, axis=1) - np.take_along_axis(wneg, start, axis=1)
+    tied = np.take_along_axis(cneg, end, axis=1) - below
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (wpos * (below + 0.5 * tied)).sum(axis=1) / (wpos.sum(axis=1) * wneg.sum(axis=1))
+
+def logistic_calibration_slope(lp, y, w, iterations=50):
+    """Slope b of logit P(y=1) = a + b*lp, fitted by vectorized Newton steps for every row of lp."""
+    a, b = np.zeros(len(lp)), np.ones(len(lp))
+    for _ in range(iterations):
+        p = special.expit(a[:, None] + b[:, None] * lp)
+        r, h = w * (y - p), w * p * (1 - p)
+        g0, g1 = r.sum(1), (r * lp).sum(1)
+        h00, h01, h11 = h.sum(1), (h * lp).sum(1), (h * lp * lp).sum(1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            det = h00 * h11 - h01 ** 2
+            da, db = (h11 * g0 - h01 * g1) / det, (h00 * g1 - h01 * g0) / det
+        a, b = a + da, b + db
+        if np.nanmax(np.abs(np.r_[da, db]), initial=0) < 1e-10:
+            break
+    return b
+
+def bootstrap_metrics(task, preds, y, w):
+    """Metrics of each row of preds (B x n) against y under row weights w."""
+    if task == "classification":
+        return {"c_statistic": weighted_auc(preds, y, w), "calibration_slope": logistic_calibration_slope(preds, y, w)}
+    sw = w.sum(1)
+    resid = ((y - preds) ** 2 * w).sum(1)
+    ybar = (w * y).sum(1) / sw
+    pbar = (w * preds).sum(1) / sw
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (w * (preds - pbar[:, None]) * (y - ybar[:, None])).sum(1) / (w * (preds - pbar[:, None]) ** 2).sum(1)
+        r2 = 1 - resid / (w * (y - ybar[:, None]) ** 2).sum(1)
+    return {"rmse": np.sqrt(resid / sw), "r2": r2, "calibration_slope": slope}
+
+def _predict(task, model, X):
+    return model.decision_function(X) if task == "classification" else model.predict(X)
+
+def bootstrap_batch(model_name, X, y, seed_state, size):
+    """Fit `size` weighted resamples; returns (apparent, test) metric arrays for the batch."""
+    factory, task = MODELS[model_name]
+    counts = np.random.default_rng(seed_state).multinomial(len(y), np.full(len(y), 1 / len(y)), size=size).astype(float)
+    preds = np.empty_like(counts)
+    for b, weights in enumerate(counts):
+        model = factory().fit(X, y, sample_weight=weights)
+        preds[b] = _predict(task, model, X)
+    return bootstrap_metrics(task, preds, y, counts), bootstrap_metrics(task, preds, y, np.ones_like(counts))
+
+def apparent_metrics(model_name, X, y):
+    """Metrics of the model fitted to (X, y), on (X, y); each a length-1 array."""
+    factory, task = MODELS[model_name]
+    return bootstrap_metrics(task, _predict(task, factory().fit(X, y), X)[None, :], y, np.ones((1, len(y))))
+
+def corrected_resample(model_name, X, y, seed_state, inner):
+    """
+    The whole optimism correction, with `inner` resamples, run on one outer
+    resample of (X, y). Returns {metric: corrected value}.
+    """
+    rng = np.random.default_rng(seed_state)
+    idx = rng.integers(0, len(y), len(y))
+    Xo, yo = X[idx], y[idx]
+    if MODELS[model_name][1] == "classification" and len(np.unique(yo)) < 2:
+        return {}
+    apparent = apparent_metrics(model_name, Xo, yo)
+    boot, test = bootstrap_batch(model_name, Xo, yo, rng.integers(2**32, size=4), inner)
+    return {metric: value[0] - np.nanmean(boot[metric] - test[metric]) for metric, value in apparent.items()}
+
+def run_bootstrap(df, outcome, predictor_sets, models, resamples=1000, jobs=-1, seed=42,
+                  ci_resamples=0, ci_inner=100, alpha=0.05):
+    """
+    Optimism-corrected bootstrap validation (Harrell) of every candidate.
+    The optimism of resample b is its apparent metric on the resample minus
+    its metric on the original data; corrected = apparent - mean optimism.
+    With ci_resamples, the whole procedure (ci_inner resamples each) is
+    repeated on that many outer resamples of the data, and ci_low/ci_high
+    are the percentile interval of the corrected values.
+    """
+    sizes = [min(BOOTSTRAP_BATCH, resamples - i) for i in range(0, resamples, BOOTSTRAP_BATCH)]
+    rows = []
+    for set_name, predictors in predictor_sets.items():
+        sub = complete_rows(df, outcome, predictors, set_name)
+        X, y = sub[predictors].to_numpy(dtype=float), sub[outcome].to_numpy(dtype=float)
+        for model_name in models:
+            with stage("model_fit"):
+                apparent = apparent_metrics(model_name, X, y)
+            t0 = time.perf_counter()
+            with stage("bootstrap_resamples"):
+                batches = joblib.Parallel(n_jobs=jobs)(joblib.delayed(bootstrap_batch)(model_name, X, y, ss.generate_state(4), size)
+                                                for ss, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+            elapsed = time.perf_counter() - t0
+            logging.info(f"{set_name}/{model_name}: {resamples} resamples in {elapsed:.2f}s ({resamples / elapsed:.1f} resamples/s)")
+            outer = []
+            if ci_resamples:
+                t0 = time.perf_counter()
+                with stage("bootstrap_ci"):
+                    outer = joblib.Parallel(n_jobs=jobs)(joblib.delayed(corrected_resample)(model_name, X, y, ss.generate_state(4), ci_inner)
+                                                      for ss in np.random.SeedSequence([seed, 1]).spawn(ci_resamples))
+                logging.info(f"{set_name}/{model_name}: interval from {ci_resamples} x {ci_inner} resamples "
+                             f"in {time.perf_counter() - t0:.2f}s")
+            for metric, value in apparent.items():
+                optimism = np.concatenate([boot[metric] - test[metric] for boot, test in batches])
+                row = {"candidate": f"{set_name}/{model_name}", "predictor_set": set_name, "model": model_name,
+                       "metric": metric, "apparent": value[0], "optimism": np.nanmean(optimism),
+                       "corrected": value[0] - np.nanmean(optimism)}
+                if ci_resamples:
+                    corrected = np.array([o.get(metric, np.nan) for o in outer])
+                    row.update({"ci_low": np.nanquantile(corrected, alpha / 2), "ci_high": np.nanquantile(corrected, 1 - alpha / 2)})
+                rows.append({**row, "resamples": int(np.isfinite(optimism).sum()), "resamples_per_sec": resamples / elapsed})
+    return pd.DataFrame(rows)
+
+@instrumented
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("csv", type=Path)
     parser.add_argument("--outcome", required=True)
-    parser.add_argument("--predictors", required=True, nargs="+")
-    parser.add_argument("--model", choices=["linear","logistic"], default="linear")
+    parser.add_argument("--predictors", nargs="+", help="Predictor set 'default'")
+    parser.add_argument("--predictor-set", action="append", metavar="NAME=COL1,COL2", help="Additional named predictor set (repeatable)")
+    parser.add_argument("--model", nargs="+", choices=list(MODELS), default=["linear"])
+    parser.add_argument("--method", choices=["cv","bootstrap"], default="cv", help="Repeated k-fold CV or optimism-corrected bootstrap")
+    parser.add_argument("--resamples", type=int, default=1000, help="Bootstrap resamples with --method bootstrap")
+    parser.add_argument("--ci-resamples", type=int, default=0, help="Outer resamples for 95%% intervals of the corrected metrics with --method bootstrap (0 = none)")
+    parser.add_argument("--ci-inner-resamples", type=int, default=100, help="Resamples of the optimism correction within each outer resample")
     parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=1, help="Repeats of k-fold CV (e.g. 10 for 10x10)")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fits (-1 = all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fold-cache", type=Path, help="Fold result cache (default <outdir>/fold_cache)")
+    parser.add_argument("--no-fold-cache", action="store_true")
     parser.add_argument("--outdir", type=Path, default=Path("validation_output"))
+    add_dataset_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging(); args.outdir.mkdir(exist_ok=True)
-    df = pd.read_csv(args.csv)
-    X = df[args.predictors].values; y = df[args.outcome].values
-    kf = KFold(n_splits=args.folds, shuffle=True, random_state=42)
-    if args.model=="linear":
-        model = LinearRegression(); scoring="neg_mean_squared_error"
-    else:
-        model = LogisticRegression(max_iter=1000); scoring="accuracy"
-    scores = cross_val_score(model, X, y, cv=kf, scoring=scoring)
-    pd.DataFrame({f"fold{i+1}":[(-s)**0.5] if scoring.startswith("neg") else [s] for i,s in enumerate(scores)}).to_csv(args.outdir/"cv_results.csv", index=False)
-    model.fit(X,y); preds = model.predict(X)
-    plt.figure(); plt.scatter(y,preds); plt.savefig(args.outdir/"actual_vs_predicted.png")
-    plt.figure(); vals = model.predict_proba(X)[:,1] if args.model=="logistic" else preds; plt.hist(vals, bins=10); plt.savefig(args.outdir/"predicted_dist.png")
+    setup_logging(); instrument_from_args(args); args.outdir.mkdir(exist_ok=True)
+    try:
+        predictor_sets = parse_predictor_sets(args.predictors, args.predictor_set)
+    except ValueError as e:
+        parser.error(str(e))
+    if not predictor_sets:
+        parser.error("give --predictors and/or --predictor-set")
+    columns = list(dict.fromkeys([args.outcome] + [c for cols in predictor_sets.values() for c in cols]))
+    df = load_dataset(args.csv, columns, cache_dir=args.cache_dir, use_cache=not args.no_cache)
+
+    if args.method == "bootstrap":
+        unsupported = [m for m in args.model if m not in ("linear", "logistic")]
+        if unsupported:
+            parser.error(f"--method bootstrap supports linear and logistic models only (got {', '.join(unsupported)})")
+        boot = run_bootstrap(df, args.outcome, predictor_sets, args.model, args.resamples, args.jobs, args.seed,
+                             args.ci_resamples, args.ci_inner_resamples)
+        boot.to_csv(args.outdir/"bootstrap_validation.csv", index=False)
+        logging.info("\n" + boot.drop(columns=["predictor_set", "model"]).to_string(index=False))
+        return
+
+    cache = FoldCache(None if args.no_fold_cache else (args.fold_cache or args.outdir / "fold_cache"))
+    t0 = time.perf_counter()
+    fold_df = run_cv(df, args.outcome, predictor_sets, args.model, args.folds, args.repeats, args.jobs, cache, args.seed)
+    logging.info(f"Cross-validation finished in {time.perf_counter() - t0:.2f}s")
+    fold_df.to_csv(args.outdir/"cv_folds.csv", index=False)
+    with stage("summarize"):
+        summary = summarize(fold_df)
+    summary.to_csv(args.outdir/"cv_summary.csv", index=False)
+    logging.info("\n" + summary.to_string(index=False))
+
+    # Legacy outputs for the first candidate: one score per fold of the first repeat, and diagnostics.
+    set_name, model_name = next(iter(predictor_sets)), args.model[0]
+    first = fold_df[(fold_df.candidate == f"{set_name}/{model_name}") & (fold_df.repeat == 1)]
+    metric = "rmse" if MODELS[model_name][1] == "regression" else "accuracy"
+    pd.DataFrame({f"fold{i+1}":[s] for i,s in enumerate(first[metric])}).to_csv(args.outdir/"cv_results.csv", index=False)
+    sub = complete_rows(df, args.outcome, predictor_sets[set_name])
+    X = sub[predictor_sets[set_name]].values; y = sub[args.outcome].values
+    with stage("model_fit"):
+        model = MODELS[model_name][0](); model.fit(X,y); preds = model.predict(X)
+    with stage("figure_render"):
+        plt.figure(); plt.scatter(y,preds); plt.savefig(args.outdir/"actual_vs_predicted.png")
+    with stage("figure_render"):
+        plt.figure(); vals = model.predict_proba(X)[:,1] if MODELS[model_name][1]=="classification" else preds; plt.hist(vals, bins=10); plt.savefig(args.outdir/"predicted_dist.png")
 
 if __name__=="__main__":
     main()
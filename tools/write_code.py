@@ -2,13 +2,15 @@
 """
 write_code.py - Generate custom Python code via OpenAI GPT.
 Updated to use a system role and avoid default examples.
+Completions go through llm_client (cached, logged, pluggable backend).
 """
 
 import argparse
 import logging
 import sys
 from pathlib import Path
-import openai
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented
+from llm_client import LLMError, add_llm_arguments, complete, configure_from_args
 
 def setup_logging():
     logging.basicConfig(
@@ -22,31 +24,35 @@ def generate_code(prompt, model):
         "Generate Python code exactly matching the user's request without additional examples or commentary."
     )
     user_msg = f"Please write Python code for the following request:\n{prompt}"
-    resp = openai.ChatCompletion.create(
-        model=model,
-        messages=[
+    content = complete(
+        model,
+        [
             {"role": "system", "content": system_msg},
             {"role": "user", "content": user_msg}
         ],
         temperature=0,
         max_tokens=1500
     )
-    return resp.choices[0].message.content.strip()
+    return content.strip()
 
+@instrumented
 def main():
     parser = argparse.ArgumentParser(description="Generate Python code from prompt")
     parser.add_argument("--prompt", required=True, help="Description of desired Python code")
     parser.add_argument("--outfile", type=Path, required=True, help="Path to save generated code")
     parser.add_argument("--model", default="gpt-4", help="OpenAI model ID")
+    add_llm_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    setup_logging()
-    openai.api_key = sys.getenv("OPENAI_API_KEY")
-    if not openai.api_key:
-        logging.error("OPENAI_API_KEY not set")
+    setup_logging(); instrument_from_args(args)
+    llm = configure_from_args(args)
+    try:
+        code = generate_code(args.prompt, args.model)
+    except LLMError as e:
+        logging.error(e)
         sys.exit(1)
-
-    code = generate_code(args.prompt, args.model)
+    llm.log_stats()
     args.outfile.write_text(code)
     logging.info(f"Generated code saved to {args.outfile}")
 
@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 """
 write_paper.py - Draft manuscript and export to Markdown, PDF, LaTeX.
+
+Completions go through llm_client, so an unchanged rerun is served from cache.
+
+--by-section drafts Abstract, Introduction, Methods, Results and Discussion as
+concurrent requests and assembles them in order. Each section gets only the
+inputs it needs, trimmed to its share of --section-budget tokens: the data
+insights for Methods/Results, literature records for the Introduction, both for
+the Discussion and Abstract. Literature records (literature_results.json/.jsonl)
+are packed whole, each abstract capped, until the budget is used.
 """
 
-import argparse, logging, sys
+import argparse, json, logging, sys, time
 from pathlib import Path
-import openai
-import pypandoc
+from http_session import concurrent_map
+from instrumentation import add_instrumentation_arguments, instrument_from_args, instrumented, stage
+from lazy_imports import lazy_import
+from llm_client import LLMError, add_llm_arguments, complete, configure_from_args, count_tokens, truncate_tokens
+
+pypandoc = lazy_import("pypandoc")
+
+SECTION_BUDGET = 6000   # input tokens per section prompt
+RECORD_TOKENS = 250     # cap per literature record
+# name: (instructions, share of the budget for data insights / literature, max_tokens)
+SECTIONS = {
+    "Abstract": ("a structured abstract (Background, Methods, Results, Conclusions; at most 250 words)", {"data": 0.6, "lit": 0.4}, 500),
+    "Introduction": ("the Introduction: background, gap in the literature, and study aim", {"data": 0.1, "lit": 0.9}, 1200),
+    "Methods": ("the Methods: study design, variables and statistical analysis", {"data": 1.0}, 1000),
+    "Results": ("the Results, reporting the statistics given", {"data": 1.0}, 1200),
+    "Discussion": ("the Discussion: principal findings in the context of prior work, limitations, conclusion", {"data": 0.4, "lit": 0.6}, 1500),
+}
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -14,9 +38,57 @@ def setup_logging():
 def draft_markdown(data_text, lit_text, model):
     prompt = (f"Using this data:\n{data_text}\nAnd these literature summaries:\n{lit_text}"
               "\nWrite a full scientific manuscript with Abstract, Introduction, Methods, Results, Discussion.")
-    resp = openai.ChatCompletion.create(model=model,messages=[{"role":"user","content":prompt}],temperature=0.2,max_tokens=3000)
-    return resp.choices[0].message.content
+    return complete(model,[{"role":"user","content":prompt}],temperature=0.2,max_tokens=3000)
 
+def literature_digest(lit_text, budget, model=None):
+    """Pack literature records into `budget` tokens, one line each; falls back to trimming raw text."""
+    try:
+        records = json.loads(lit_text)
+    except json.JSONDecodeError:
+        try:
+            records = [json.loads(line) for line in lit_text.splitlines() if line.strip()]
+        except json.JSONDecodeError:
+            return truncate_tokens(lit_text, budget, model)
+    if not isinstance(records, list):
+        return truncate_tokens(lit_text, budget, model)
+    lines, used = [], 0
+    for r in records:
+        year = r.get("year") or r.get("published") or ""
+        head = f"[{r.get('source', '')} {r.get('id', '')}] {r.get('title') or ''} ({year})".strip()
+        line = truncate_tokens(f"{head}: {' '.join((r.get('text') or '').split())}", RECORD_TOKENS, model)
+        cost = count_tokens(line, model)
+        if used + cost > budget:
+            break
+        lines.append(line); used += cost
+    if len(lines) < len(records):
+        logging.info(f"Literature: {len(lines)}/{len(records)} records fit in {budget} tokens")
+    return "\n".join(lines)
+
+def section_prompt(name, data_text, lit_text, budget, model):
+    instructions, shares, _ = SECTIONS[name]
+    parts = []
+    if "data" in shares:
+        parts.append(f"Data insights:\n{truncate_tokens(data_text, int(budget * shares['data']), model)}")
+    if "lit" in shares:
+        parts.append(f"Literature:\n{literature_digest(lit_text, int(budget * shares['lit']), model)}")
+    return ("\n\n".join(parts) + f"\n\nWrite {instructions} of a scientific manuscript based on the material above. "
+            f"Return only the text of the {name} section in Markdown, without the section heading.")
+
+def draft_sections(data_text, lit_text, model, budget=SECTION_BUDGET, concurrency=len(SECTIONS)):
+    """Draft every section concurrently and assemble them in manuscript order."""
+    with stage("prompt_build"):
+        prompts = {name: section_prompt(name, data_text, lit_text, budget, model) for name in SECTIONS}
+    for name, prompt in prompts.items():
+        logging.info(f"{name}: {count_tokens(prompt, model)} input tokens")
+    def draft(name):
+        start = time.perf_counter()
+        text = complete(model,[{"role":"user","content":prompts[name]}],temperature=0.2,max_tokens=SECTIONS[name][2])
+        logging.info(f"{name} drafted in {time.perf_counter() - start:.1f}s")
+        return text
+    bodies = concurrent_map(draft, list(SECTIONS), concurrency)
+    return "\n\n".join(f"## {name}\n\n{body.strip()}" for name, body in zip(SECTIONS, bodies)) + "\n"
+
+@instrumented
 def main():
     parser=argparse.ArgumentParser()
     parser.add_argument("data_insights", type=Path)
@@ -25,13 +97,24 @@ def main():
     parser.add_argument("--out", type=Path, default=Path("manuscript.md"))
     parser.add_argument("--to-pdf", type=Path)
     parser.add_argument("--to-tex", type=Path)
+    parser.add_argument("--by-section", action="store_true", help="Draft sections concurrently from budgeted inputs")
+    parser.add_argument("--section-budget", type=int, default=SECTION_BUDGET, help="Input tokens per section with --by-section")
+    parser.add_argument("--concurrency", type=int, default=len(SECTIONS), help="Sections drafted at once with --by-section")
+    add_llm_arguments(parser)
+    add_instrumentation_arguments(parser)
     args=parser.parse_args()
 
-    setup_logging()
-    openai.api_key=sys.getenv("OPENAI_API_KEY"); 
-    if not openai.api_key: logging.error("API key not set"); sys.exit(1)
+    setup_logging(); instrument_from_args(args); llm = configure_from_args(args)
     data_text=args.data_insights.read_text(); lit_text=args.lit_summary.read_text()
-    md = draft_markdown(data_text, lit_text, args.model)
+    start = time.perf_counter()
+    try: md = (draft_sections(data_text, lit_text, args.model, args.section_budget, args.concurrency) if args.by_section
+               else draft_markdown(data_text, lit_text, args.model))
+    except LLMError as e: logging.error(e); sys.exit(1)
+    logging.info(f"Drafted in {time.perf_counter() - start:.1f}s"); llm.log_stats()
     args.out.write_text(md); logging.info(f"Saved {args.out}")
-    if args.to_pdf: pypandoc.convert_text(md,'pdf',format='md',outputfile=str(args.to_pdf)); logging.info(f"PDF: {args.to_pdf}")
-    if args.to_tex: args.to_tex.write_text(pypandoc.convert_text(md,'latex',format='md')); logging.info(f"LaTeX: {args.to_tex}")
+    with stage("pandoc_export"):
+        if args.to_pdf: pypandoc.convert_text(md,'pdf',format='md',outputfile=str(args.to_pdf)); logging.info(f"PDF: {args.to_pdf}")
+        if args.to_tex: args.to_tex.write_text(pypandoc.convert_text(md,'latex',format='md')); logging.info(f"LaTeX: {args.to_tex}")
+
+if __name__=="__main__":
+    main()